@@ -1,12 +1,20 @@
 import os
 import csv
+import shutil
+import sys
+import tempfile
+import time
 from collections import defaultdict
-from typing import Tuple, Generator, Dict
+from typing import Tuple, Generator, Dict, List
 from pathlib import Path
 from tqdm import tqdm
 from multiprocessing import Process, Queue, cpu_count
 import queue
 
+# 公開番号の正規化は src/model/patent_number.py と共通（パスインデックスと同じ主キーにする）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from model.patent_number import publication_key  # noqa: E402
+
 # --- 設定変数 ---
 # データを配置するルートディレクトリ
 BASE_DIR = "/mnt/eightthdd/raw_data"
@@ -26,31 +34,54 @@ EXPECTED_TOTAL_ITEMS = 2000000
 def extract_info(full_path: str) -> Tuple[str, str, str]:
     """
     パスからdoc_numberとdoc_idを抽出し、CSV行のタプルを返します。
+    doc_number は model.patent_number.publication_key の主キー
+    （JP2010000001A -> 2010000001、JP5752307B -> 5752307。解釈できなければ "ERROR"）。
     """
-    doc_id_with_prefix = os.path.basename(full_path)
-    doc_id = doc_id_with_prefix
-
-    doc_number = "ERROR"
-    try:
-        # JP2010000001A -> 0000001 の抽出ロジック
-        number_part_raw = doc_id[:-1][6:]
-        doc_number = number_part_raw.lstrip('0')
-        doc_number = doc_number.zfill(7)
-    except (IndexError, ValueError):
-        pass  # doc_number は "ERROR" のまま
-
+    doc_id = os.path.basename(full_path)
+    doc_number = publication_key(doc_id) or "ERROR"
     return doc_number, doc_id, full_path
 
 # --- マルチプロセス用関数 ---
 
 def process_chunk_directory(chunk_dir_path: Path, result_queue: Queue):
     """
-    チャンクディレクトリを処理し、結果をキューに送信します。
+    チャンクディレクトリを処理し、結果を1つのバッチ（行のリスト）としてキューに送信します。
+
+    1件ごとに put すると、数百万件の小さなメッセージの pickle とキューのロックが処理時間の大半を占めるため、
+    チャンクディレクトリ単位（数千件）でまとめて送ります。ディレクトリの列挙は os.scandir で行い、
+    エントリの種類は d_type から判定するため、件数分の stat を発行しません。
 
     Args:
         chunk_dir_path: チャンクディレクトリのパス
         result_queue: 結果を送信するキュー
     """
+    try:
+        rows = []
+        with os.scandir(chunk_dir_path) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+
+                # 最終文字を取得 (例: 'A')
+                suffix = entry.name[-1].upper()
+
+                # 情報を抽出
+                doc_number, doc_id, path = extract_info(entry.path)
+                rows.append((suffix, doc_number, doc_id, path))
+
+        # チャンク1つ分をまとめて送信（Writerはこの1メッセージでチャンクの完了も数える）
+        result_queue.put(('batch', rows))
+
+    except PermissionError as e:
+        result_queue.put(('error', f"警告: {chunk_dir_path} へのアクセスが拒否されました: {e}"))
+    except Exception as e:
+        result_queue.put(('error', f"エラー: {chunk_dir_path} の処理中にエラーが発生: {e}"))
+
+
+def process_chunk_directory_per_document(chunk_dir_path: Path, result_queue: Queue):
+    """
+    1件ごとにキューへ送信する従来の処理（run_benchmark の比較用）。
+    """
     try:
         count = 0
         for doc_dir in chunk_dir_path.iterdir():
@@ -112,12 +143,19 @@ def writer_process(result_queue: Queue, output_dir: str, max_rows_per_file: int,
 
                 msg_type = item[0]
 
-                if msg_type == 'data':
+                if msg_type == 'batch':
+                    # チャンク1つ分の行をまとめて書き込む
+                    _, rows = item
+                    writer.write_rows(rows)
+                    chunk_pbar.update(1)
+                elif msg_type == 'data':
                     _, suffix, doc_number, doc_id, path = item
                     writer.write_row(suffix, doc_number, doc_id, path)
                 elif msg_type == 'error':
                     _, error_msg = item
                     tqdm.write(error_msg)
+                    # エラーになったチャンクも処理済みとして数える
+                    chunk_pbar.update(1)
                 elif msg_type == 'progress':
                     # ワーカーがチャンクの処理を完了したときに送信される
                     # プログレスバーを1チャンク分進める
@@ -273,6 +311,34 @@ class StreamingCSVWriter:
         if len(self.buffers[suffix]) >= BUFFER_SIZE:
             self._flush_buffer(suffix)
 
+    def write_rows(self, rows: List[Tuple[str, str, str, str]]):
+        """
+        (suffix, doc_number, doc_id, path) の行をまとめてCSVファイルに書き込む（write_row のバッチ版）。
+        ファイルの切り替え（max_rows_per_file）は write_row と同じ位置で行い、プログレスバーはバッチごとに1回だけ更新する。
+        """
+        by_suffix: Dict[str, list] = defaultdict(list)
+        for suffix, doc_number, doc_id, path in rows:
+            by_suffix[suffix].append((doc_number, doc_id, path))
+
+        for suffix, suffix_rows in by_suffix.items():
+            start = 0
+            while start < len(suffix_rows):
+                if suffix not in self.file_handles or self.row_counts[suffix] >= self.max_rows_per_file:
+                    if suffix in self.file_handles:
+                        self._flush_buffer(suffix)
+                    self._open_new_file(suffix)
+
+                end = min(len(suffix_rows), start + self.max_rows_per_file - self.row_counts[suffix])
+                self.buffers[suffix].extend(suffix_rows[start:end])
+                self.row_counts[suffix] += end - start
+                start = end
+
+                if len(self.buffers[suffix]) >= BUFFER_SIZE:
+                    self._flush_buffer(suffix)
+
+        self.total_written += len(rows)
+        self.pbar.update(len(rows))
+
     def close(self):
         """全てのファイルを閉じる"""
         for suffix in list(self.file_handles.keys()):
@@ -292,13 +358,14 @@ class StreamingCSVWriter:
 
 # --- メイン処理 ---
 
-def worker_process(task_queue: Queue, result_queue: Queue):
+def worker_process(task_queue: Queue, result_queue: Queue, process_chunk=process_chunk_directory):
     """
     タスクキューからチャンクディレクトリを取得し、処理するワーカープロセス。
 
     Args:
         task_queue: 処理するチャンクディレクトリのパスを受け取るキュー
         result_queue: 処理結果を送信するキュー
+        process_chunk: チャンクディレクトリの処理関数（run_benchmark で従来の処理と比べるときに差し替える）
     """
     try:
         while True:
@@ -309,7 +376,7 @@ def worker_process(task_queue: Queue, result_queue: Queue):
                     break
 
                 # チャンクディレクトリを処理
-                process_chunk_directory(chunk_dir_path, result_queue)
+                process_chunk(chunk_dir_path, result_queue)
 
             except queue.Empty:
                 continue
@@ -331,20 +398,20 @@ def main_multiprocess():
       │   └→ チャンクディレクトリのパスを配布
       │
       ├─ ワーカープロセス × N個 (並列実行)
-      │   ├→ ワーカー1: タスクキューからチャンクを取得 → ディレクトリスキャン → result_queueに送信
-      │   ├→ ワーカー2: タスクキューからチャンクを取得 → ディレクトリスキャン → result_queueに送信
+      │   ├→ ワーカー1: タスクキューからチャンクを取得 → ディレクトリスキャン → チャンク1つ分を1バッチでresult_queueに送信
+      │   ├→ ワーカー2: タスクキューからチャンクを取得 → ディレクトリスキャン → チャンク1つ分を1バッチでresult_queueに送信
       │   └→ ...
       │
       ├─ 結果キュー (result_queue)
-      │   └→ すべてのワーカーからのデータを集約
+      │   └→ すべてのワーカーからのバッチを集約
       │
       └─ Writerプロセス × 1個のみ (単一実行) ★重要★
-          └→ result_queueからデータを取得 → CSV書き込み（順次処理）
+          └→ result_queueからバッチを取得 → CSV書き込み（順次処理）
 
     このアーキテクチャにより:
     - 複数のワーカーが並列でディレクトリをスキャン（高速化）
     - 単一のWriterがすべての書き込みを担当（同時書き込み回避）
-    - Queueによる安全なプロセス間通信
+    - Queueによる安全なプロセス間通信（メッセージはチャンク単位なので、件数分の pickle・ロックが発生しない）
     """
     print("=" * 60)
     print("ディレクトリスキャン & CSV生成（マルチプロセス版）")
@@ -358,33 +425,64 @@ def main_multiprocess():
     print(f"ワーカープロセス数: {num_workers}")
     print("=" * 60)
 
-    base_path = Path(BASE_DIR)
-
-    if not base_path.exists():
+    if not Path(BASE_DIR).exists():
         print(f"エラー: ベースディレクトリ {BASE_DIR} が見つかりません。")
         return
 
-    # チャンクディレクトリのリストを収集
-    print("\nチャンクディレクトリを収集中...")
+    run_multiprocess(BASE_DIR, OUTPUT_DIR, num_workers)
+
+    print("=" * 60)
+    print("処理が完了しました")
+    print(f"CSVファイルは {OUTPUT_DIR} に保存されました")
+    print("=" * 60)
+
+
+def collect_chunk_dirs(base_dir: str) -> List[Path]:
+    """
+    ベースディレクトリ配下のチャンクディレクトリ（result_X/{チャンク}）を列挙します。
+    """
     chunk_dirs = []
-    for intermediate_dir in sorted(base_path.iterdir()):
+    for intermediate_dir in sorted(Path(base_dir).iterdir()):
         if not intermediate_dir.is_dir():
             continue
         for chunk_dir in sorted(intermediate_dir.iterdir()):
             if chunk_dir.is_dir():
                 chunk_dirs.append(chunk_dir)
+    return chunk_dirs
+
+
+def run_multiprocess(
+    base_dir: str,
+    output_dir: str,
+    num_workers: int,
+    process_chunk=process_chunk_directory,
+    queue_size: int | None = None,
+):
+    """
+    ワーカープロセスでチャンクディレクトリを走査し、単一のWriterプロセスでCSVに書き込みます。
 
+    Args:
+        base_dir: 入力のベースディレクトリ
+        output_dir: CSVの出力先ディレクトリ
+        num_workers: ワーカープロセス数
+        process_chunk: チャンクディレクトリの処理関数（既定はチャンク単位のバッチ送信）
+        queue_size: 結果キューの最大メッセージ数（省略時はワーカー数 × 4 バッチ）
+    """
+    # チャンクディレクトリのリストを収集
+    print("\nチャンクディレクトリを収集中...")
+    chunk_dirs = collect_chunk_dirs(base_dir)
     print(f"合計 {len(chunk_dirs)} 個のチャンクディレクトリを発見しました")
 
     # タスクキューと結果キューを作成
+    # 1メッセージがチャンク1つ分（数千件）なので、溜めるのはワーカーあたり数バッチで十分
     task_queue = Queue()
-    result_queue = Queue(maxsize=num_workers * 1000)
+    result_queue = Queue(maxsize=queue_size if queue_size is not None else num_workers * 4)
 
     # === 同時書き込み回避: Writerプロセスは1つのみ起動 ===
     # すべてのワーカーからのデータは、この単一のWriterプロセスに集約され、
     # 順次的にCSVファイルに書き込まれます。
     print("\nWriterプロセスを起動中...")
-    writer_proc = Process(target=writer_process, args=(result_queue, OUTPUT_DIR, MAX_ROWS_PER_FILE, len(chunk_dirs)))
+    writer_proc = Process(target=writer_process, args=(result_queue, output_dir, MAX_ROWS_PER_FILE, len(chunk_dirs)))
     writer_proc.start()
 
     # ワーカープロセスを起動（複数）
@@ -392,7 +490,7 @@ def main_multiprocess():
     print(f"{num_workers} 個のワーカープロセスを起動中...")
     workers = []
     for i in range(num_workers):
-        worker = Process(target=worker_process, args=(task_queue, result_queue))
+        worker = Process(target=worker_process, args=(task_queue, result_queue, process_chunk))
         worker.start()
         workers.append(worker)
 
@@ -414,9 +512,6 @@ def main_multiprocess():
 
         print("\nすべてのワーカープロセスが完了しました")
 
-        # Writerプロセスに終了シグナルを送信
-        result_queue.put(None)
-
     except KeyboardInterrupt:
         print("\n\n処理が中断されました")
         # ワーカープロセスを強制終了
@@ -428,15 +523,11 @@ def main_multiprocess():
         import traceback
         traceback.print_exc()
     finally:
-        # Writerプロセスの終了を待つ
+        # Writerプロセスに終了シグナルを送信し、終了を待つ
+        result_queue.put(None)
         print("\nWriterプロセスの終了を待機中...")
         writer_proc.join()
 
-    print("=" * 60)
-    print("処理が完了しました")
-    print(f"CSVファイルは {OUTPUT_DIR} に保存されました")
-    print("=" * 60)
-
 
 def main():
     """
@@ -479,7 +570,78 @@ def main():
     print(f"CSVファイルは {OUTPUT_DIR} に保存されました")
     print("=" * 60)
 
+# --- ベンチマーク ---
+
+def make_synthetic_tree(base_dir: str, num_tables: int = 4, chunks_per_table: int = 25, docs_per_chunk: int = 2000):
+    """
+    result_X/{チャンク}/{doc_id} 形式の合成ディレクトリツリーを作成します（run_benchmark 用）。
+    """
+    suffixes = ["A", "B", "U", "1"]
+    serial = 0
+    for table in range(1, num_tables + 1):
+        for chunk in range(chunks_per_table):
+            chunk_dir = Path(base_dir) / f"result_{table}" / str(chunk)
+            for _ in range(docs_per_chunk):
+                suffix = suffixes[serial % len(suffixes)]
+                doc_id = f"JP{2000 + serial % 20}{serial:06d}{suffix}" if suffix != "B" else f"JP{serial:07d}B"
+                (chunk_dir / doc_id).mkdir(parents=True)
+                serial += 1
+    return serial
+
+
+def _read_csv_rows(output_dir: str) -> Dict[str, list]:
+    """出力されたCSVを suffix ごとの行の集合（順不同で比較するためソート済み）で返す"""
+    rows: Dict[str, list] = defaultdict(list)
+    for csv_file in Path(output_dir).glob("*_path_*.csv"):
+        suffix = csv_file.name.split("_path_")[0]
+        with open(csv_file, newline='', encoding='utf-8') as f:
+            rows[suffix].extend(tuple(row) for row in list(csv.reader(f))[1:])
+    return {suffix: sorted(values) for suffix, values in rows.items()}
+
+
+def run_benchmark(num_tables: int = 4, chunks_per_table: int = 25, docs_per_chunk: int = 2000, num_workers: int = 4) -> dict:
+    """
+    合成ディレクトリツリーで、1件ずつ送信する従来の処理とチャンク単位のバッチ送信のスループットを比べます。
+    両者の出力CSVの内容（suffix ごとの行の集合）が一致することも確認します。
+    """
+    work_dir = tempfile.mkdtemp(prefix="process_path_bench_")
+    try:
+        base_dir = os.path.join(work_dir, "raw_data")
+        total = make_synthetic_tree(base_dir, num_tables, chunks_per_table, docs_per_chunk)
+
+        results = {}
+        outputs = {}
+        for name, process_chunk, queue_size in (
+            ("per_document", process_chunk_directory_per_document, num_workers * 1000),
+            ("batched", process_chunk_directory, None),
+        ):
+            output_dir = os.path.join(work_dir, name)
+            start = time.perf_counter()
+            run_multiprocess(base_dir, output_dir, num_workers, process_chunk, queue_size)
+            elapsed = time.perf_counter() - start
+            results[f"{name}_sec"] = elapsed
+            results[f"{name}_docs_per_sec"] = total / elapsed
+            outputs[name] = _read_csv_rows(output_dir)
+
+        if outputs["per_document"] != outputs["batched"]:
+            raise AssertionError("従来の処理とバッチ送信で出力CSVの内容が一致しません")
+        results["docs"] = total
+        results["speedup"] = results["per_document_sec"] / results["batched_sec"]
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv[1:]:
+        # 合成ツリーでのスループット比較: python process_path.py --benchmark
+        result = run_benchmark()
+        print(f"{result['docs']:,} 件")
+        print(f"  1件ずつ送信    : {result['per_document_sec']:.2f} 秒（{result['per_document_docs_per_sec']:,.0f} 件/秒）")
+        print(f"  チャンク単位送信: {result['batched_sec']:.2f} 秒（{result['batched_docs_per_sec']:,.0f} 件/秒）")
+        print(f"  高速化: {result['speedup']:.1f} 倍")
+        sys.exit(0)
+
     # マルチプロセス版を使用
     main_multiprocess()
 
@@ -0,0 +1,156 @@
+"""
+再ランキング（2段階目の検索）モジュール
+
+1段階目の検索（Retriever、BigQueryのVECTOR_SEARCH）で多めに取得した候補を、
+安価なローカルモデルで再スコアリングし、LLM（Generator、AI審査）に渡す件数を絞り込みます。
+
+- LexicalOverlapReranker: 文字n-gramの重なりによるスコア（追加ライブラリ不要）
+- CrossEncoderReranker: sentence-transformers のクロスエンコーダによるスコア（要インストール）
+
+スコアは (クエリ, 文書) ごとにキャッシュするため、同じクエリでの再実行はスコア計算を行いません。
+"""
+
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from infra.config import cfg
+from infra.index.ngram_index import ngram_tokenize
+
+
+class Reranker(ABC):
+    """
+    再ランキングの基底クラスです。サブクラスは _score_batch を実装します（未実装ならインスタンス化で失敗する）。
+    """
+
+    def __init__(self, batch_size: int = 32, cache_size: int = 100000):
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    @abstractmethod
+    def _score_batch(self, query: str, texts: list[str]) -> list[float]:
+        """
+        クエリと文書群のスコアを計算する（大きいほど関連が強い）。
+        """
+
+    def score(self, query: str, candidates: list[tuple[str, str]]) -> list[float]:
+        """
+        (文書キー, 本文) のリストをスコアリングする。キャッシュにないものだけをバッチで計算する。
+        """
+        query_key = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        scores: list[float | None] = []
+        pending: list[int] = []
+        for i, (doc_key, _) in enumerate(candidates):
+            cached = self._cache.get((query_key, doc_key))
+            if cached is not None:
+                self._cache.move_to_end((query_key, doc_key))
+            else:
+                pending.append(i)
+            scores.append(cached)
+
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start : start + self.batch_size]
+            batch_scores = self._score_batch(query, [candidates[i][1] for i in batch])
+            for i, value in zip(batch, batch_scores):
+                scores[i] = float(value)
+                self._cache[(query_key, candidates[i][0])] = float(value)
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return [float(value) for value in scores]
+
+    def rerank(self, query: str, candidates: list[tuple[str, str]], top_n: int) -> list[int]:
+        """
+        スコアの高い順に、上位top_n件の候補のインデックスを返す。
+        """
+        scores = self.score(query, candidates)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return order[:top_n]
+
+    def rerank_documents(self, query: str, docs: list[Document], top_n: int) -> list[Document]:
+        """
+        LangChainのDocumentを再ランキングし、上位top_n件を返す。
+        """
+        candidates = [(_document_key(doc), doc.page_content) for doc in docs]
+        return [docs[i] for i in self.rerank(query, candidates, top_n)]
+
+
+class LexicalOverlapReranker(Reranker):
+    """
+    クエリの文字n-gramのうち、文書に含まれる割合（カバー率）でスコアリングする。
+    英数字の連続（部品番号など）の一致は重み付けする。
+    """
+
+    def __init__(self, n: int = 2, alnum_weight: float = 3.0, **kwargs):
+        super().__init__(**kwargs)
+        self.n = n
+        self.alnum_weight = alnum_weight
+
+    def _term_weights(self, text: str) -> dict[str, float]:
+        weights: dict[str, float] = {}
+        for token in ngram_tokenize(text, self.n):
+            weight = self.alnum_weight if token.isascii() and len(token) > self.n else 1.0
+            weights[token] = max(weights.get(token, 0.0), weight)
+        return weights
+
+    def _score_batch(self, query: str, texts: list[str]) -> list[float]:
+        query_weights = self._term_weights(query)
+        total = sum(query_weights.values())
+        if total == 0:
+            return [0.0] * len(texts)
+
+        scores = []
+        for text in texts:
+            doc_terms = set(ngram_tokenize(text, self.n))
+            matched = sum(weight for term, weight in query_weights.items() if term in doc_terms)
+            scores.append(matched / total)
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    ローカルのクロスエンコーダ（sentence-transformers）でスコアリングする。
+    """
+
+    def __init__(self, model_name: str, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("CrossEncoderRerankerを使うには、sentence-transformersをインストールしてください。") from e
+        self.model = CrossEncoder(model_name)
+
+    def _score_batch(self, query: str, texts: list[str]) -> list[float]:
+        pairs = [(query, text) for text in texts]
+        return [float(score) for score in self.model.predict(pairs, batch_size=self.batch_size)]
+
+
+def create_reranker(rerank_type: str | None = None) -> Reranker | None:
+    """
+    設定（cfg.rerank_type）に応じた再ランキング器を生成する。未設定ならNoneを返す。
+    """
+    rerank_type = cfg.rerank_type if rerank_type is None else rerank_type
+    if not rerank_type:
+        return None
+
+    rerank_type = rerank_type.lower()
+    if rerank_type == "lexical":
+        return LexicalOverlapReranker(n=cfg.ngram_n, batch_size=cfg.rerank_batch_size)
+    elif rerank_type == "cross_encoder":
+        return CrossEncoderReranker(cfg.cross_encoder_model_name, batch_size=cfg.rerank_batch_size)
+    else:
+        raise ValueError(f"未定義の再ランキング器です: {rerank_type}")
+
+
+def _document_key(doc: Document) -> str:
+    """
+    キャッシュ用の文書キー。IDがなければ公開番号と本文のハッシュから作る。
+    """
+    if doc.id:
+        return doc.id
+    digest = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    return f"{doc.metadata.get('publication_number', '')}_{digest}"
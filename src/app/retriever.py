@@ -1,6 +1,10 @@
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator
 
+import numpy as np
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings.embeddings import Embeddings
@@ -8,20 +12,34 @@ from langchain_core.embeddings.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.reranker import Reranker, create_reranker
 from infra.config import cfg
+from infra.embedding_cache import CachedQueryEmbeddings
+from infra.index.compressed_index import CompressedVectorIndex, normalize_rows
+from infra.index.ngram_index import NgramInvertedIndex
+from infra.index.sharded_store import ShardedChroma, shard_key
 from infra.loader.common_loader import CommonLoader
 from model.patent import Patent
 
 
 class Retriever:
-    def __init__(self, knowledge_dir: str):
+    def __init__(self, knowledge_dir: str, reranker: Reranker | None = None):
+        """
+        Args:
+            knowledge_dir: ナレッジ（text.txt）のディレクトリ
+            reranker: 再ランキング器（省略時は cfg.rerank_type に従って生成。Noneなら再ランキングしない）
+        """
         # TODO: リトリーバでベクトルストアを生成するのではなく、生成したベクトルストアをリトリーバにDIするほうがいいかも。
         self.knowledge_paths = list(Path(knowledge_dir).rglob("text.txt"))
         self.knowledge: dict[str, Patent] = {}
         self.loader = CommonLoader()
         # todo: Chroma、Faissなど、ベクトルストアの性能をちゃんと比較するべき。
-        self.chroma = self._build_chroma()
-        self.retriever = self.chroma.as_retriever(search_kwargs={"k": cfg.top_n})
+        self.lexical_index = NgramInvertedIndex(cfg.lexical_index_dir, n=cfg.ngram_n)
+        self.chroma: Chroma | ShardedChroma = self._build_chroma()
+        if cfg.retrieval_mode == "hybrid" and not self.lexical_index.exists():
+            self._build_lexical_index_from_chroma()
+        self.compressed_index = self._build_compressed_index() if cfg.compression_reduction or cfg.compression_quantization else None
+        self.reranker = reranker if reranker is not None else create_reranker()
 
     def _init_embeddings(self) -> Embeddings:
         """
@@ -38,18 +56,28 @@ class Retriever:
                 model=cfg.openai_embedding_model_name,
                 api_key=os.getenv("OPENAI_API_KEY"),  # type: ignore
             )
+            model_name = cfg.openai_embedding_model_name
         else:
             raise ValueError(f"未定義の埋め込みモデルです: {cfg.embedding_type}")
 
-        return embeddings
+        # 同じクエリの再検索で埋め込みAPIを呼ばないよう、クエリ埋め込みをキャッシュする
+        return CachedQueryEmbeddings(
+            embeddings,
+            model_name=f"{type}:{model_name}",
+            max_size=cfg.query_embedding_cache_size,
+            persist_path=cfg.query_embedding_cache_path,
+        )
 
-    def _build_chroma(self) -> Chroma:
+    def _build_chroma(self) -> Chroma | ShardedChroma:
         """
         ナレッジからベクトルストアを構築する。
         既存のベクトルストアが存在するならロードする。
         """
         embeddings: Embeddings = self._init_embeddings()
 
+        if cfg.shard_by:
+            return self._build_sharded_chroma(embeddings)
+
         if os.path.exists(cfg.persist_dir):
             chroma = Chroma(persist_directory=cfg.persist_dir, embedding_function=embeddings)
         else:
@@ -58,21 +86,135 @@ class Retriever:
             self.knowledge = self._load_knowledge()
             os.makedirs(cfg.persist_dir, exist_ok=True)
 
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=cfg.chunk_size,
-                chunk_overlap=cfg.chunk_overlap,
-                add_start_index=True,
-            )
-            knowledge_docs: list[Document] = [patent.to_doc() for patent in self.knowledge.values()]
-            splitted_docs: list[Document] = splitter.split_documents(knowledge_docs)
+            splitted_docs, chunk_ids = self._split_knowledge(list(self.knowledge.values()))
             chroma = Chroma.from_documents(
                 documents=splitted_docs,
                 embedding=embeddings,
+                ids=chunk_ids,
                 persist_directory=cfg.persist_dir,
             )
+            self.lexical_index.add(chunk_ids, [doc.page_content for doc in splitted_docs])
 
         return chroma
 
+    def _build_sharded_chroma(self, embeddings: Embeddings) -> ShardedChroma:
+        """
+        シャード分割したベクトルストアをロードし、まだ存在しないシャードだけを並列に構築する。
+        """
+        sharded = ShardedChroma(cfg.persist_dir, embeddings, max_workers=cfg.shard_workers)
+        missing = {key: paths for key, paths in self._group_paths_by_shard().items() if key not in sharded.shards}
+        if not missing:
+            return sharded
+
+        # シャードは互いに独立しているので、取り込み（XMLロード・埋め込み・書き込み）もシャード単位で並列化する
+        with ThreadPoolExecutor(max_workers=cfg.shard_workers) as executor:
+            futures = [executor.submit(self._build_shard, sharded, key, paths) for key, paths in missing.items()]
+            for future in as_completed(futures):
+                chunk_ids, texts = future.result()
+                # BM25インデックスへの追加はスレッドセーフではないため、メインスレッドで行う
+                self.lexical_index.add(chunk_ids, texts)
+        return sharded
+
+    def _group_paths_by_shard(self) -> dict[str, list[Path]]:
+        """
+        ナレッジのパスを、シャードキー（cfg.shard_by）ごとに振り分ける。
+        """
+        paths_by_shard: dict[str, list[Path]] = defaultdict(list)
+        for path in self.knowledge_paths:
+            paths_by_shard[shard_key(path, cfg.shard_by)].append(path)
+        return paths_by_shard
+
+    def _build_shard(self, sharded: ShardedChroma, key: str, paths: list[Path]) -> tuple[list[str], list[str]]:
+        """
+        1シャード分のナレッジをロードしてベクトルストアを構築し、(チャンクID, 本文) を返す。
+        """
+        loader = CommonLoader()  # スレッドごとに別のローダを使う
+        patents = [loader.run(path) for path in paths]
+        splitted_docs, chunk_ids = self._split_knowledge(patents)
+        sharded.build_shard(key, splitted_docs, chunk_ids)
+        return chunk_ids, [doc.page_content for doc in splitted_docs]
+
+    def rebuild_shard(self, key: str) -> None:
+        """
+        指定したシャードだけを再構築する（他のシャードはそのまま検索に使える）。
+        """
+        if not isinstance(self.chroma, ShardedChroma):
+            raise ValueError("シャード分割されていないベクトルストアです。cfg.shard_by を設定してください。")
+        paths = self._group_paths_by_shard().get(key)
+        if not paths:
+            raise ValueError(f"シャード {key} に対応するナレッジがありません。")
+        # add() は登録済みのキーをスキップするため、古いシャードのチャンクをBM25インデックスから先に削除する
+        old_chunk_ids = self.chroma.shard_ids(key)
+        chunk_ids, texts = self._build_shard(self.chroma, key, paths)
+        self.lexical_index.remove(old_chunk_ids)
+        self.lexical_index.add(chunk_ids, texts)
+
+    def _split_knowledge(self, patents: list[Patent]) -> tuple[list[Document], list[str]]:
+        """
+        特許をチャンクに分割し、(チャンク, チャンクID) を返す。
+        """
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=cfg.chunk_size,
+            chunk_overlap=cfg.chunk_overlap,
+            add_start_index=True,
+        )
+        knowledge_docs: list[Document] = [patent.to_doc() for patent in patents]
+        splitted_docs: list[Document] = splitter.split_documents(knowledge_docs)
+        # チャンクIDは、ChromaとBM25インデックスで共通のキーとして使う
+        chunk_ids: list[str] = [self._chunk_id(doc) for doc in splitted_docs]
+        return splitted_docs, chunk_ids
+
+    def iter_chunks(self, include: list[str], batch_size: int = 10000) -> Iterator[dict]:
+        """
+        ベクトルストアに格納済みの全チャンクを、Chroma.get の形式でバッチごとに返す（シャード分割にも対応）。
+        """
+        stores = list(self.chroma.shards.values()) if isinstance(self.chroma, ShardedChroma) else [self.chroma]
+        for store in stores:
+            offset = 0
+            while True:
+                batch = store.get(include=include, limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                yield batch
+                offset += len(batch["ids"])
+
+    def _chunk_id(self, doc: Document) -> str:
+        """
+        チャンクのID（公開番号 + チャンク開始位置）を返す。
+        """
+        return f"{doc.metadata['publication_number']}_{doc.metadata['start_index']}"
+
+    def _build_lexical_index_from_chroma(self) -> None:
+        """
+        既存のベクトルストアに格納済みのチャンクから、BM25インデックスを構築する。
+        （BM25インデックス導入前に作成したベクトルストア向け）
+        一時ディレクトリに構築して最後に統合・公開するため、中断しても構築途中のインデックスは使われない。
+        """
+        self.lexical_index.build((batch["ids"], batch["documents"]) for batch in self.iter_chunks(include=["documents"]))
+
+    def _build_compressed_index(self) -> CompressedVectorIndex:
+        """
+        Chromaのfloat32ベクトルから、次元削減・量子化した圧縮インデックスを構築する。
+        既存の圧縮インデックスが現在の設定（cfg.compression_*）で構築されたものならロードする。
+        全ベクトルはメモリに載せず、Chromaからバッチごとに読み直して符号化する。
+        """
+        settings = {
+            "reduction": cfg.compression_reduction,
+            "dim": cfg.compression_dim,
+            "quantization": cfg.compression_quantization,
+            "pq_m": cfg.compression_pq_m,
+        }
+        if CompressedVectorIndex.is_built_with(cfg.compressed_index_dir, **settings):
+            return CompressedVectorIndex(cfg.compressed_index_dir)
+        if CompressedVectorIndex.exists(cfg.compressed_index_dir):
+            print(f"圧縮インデックスの設定が変わったため作り直します: {cfg.compressed_index_dir}")
+
+        def batches():
+            for batch in self.iter_chunks(include=["embeddings"]):
+                yield batch["ids"], np.asarray(batch["embeddings"], dtype=np.float32)
+
+        return CompressedVectorIndex.build_from_batches(cfg.compressed_index_dir, batches, **settings)
+
     def _load_knowledge(self) -> dict[str, Patent]:
         knowledge = {}
         for path in self.knowledge_paths:
@@ -103,8 +245,18 @@ class Retriever:
         else:
             raise ValueError("クエリは、strかPatent型にしてください。")
 
-        # ベクトル検索
-        retrieved_docs: list[Document] = self.retriever.invoke(query_str)
+        # 再ランキングする場合は、1段階目で多めに候補を取得する
+        fetch_k = max(cfg.rerank_fetch_k, cfg.top_n) if self.reranker else cfg.top_n
+
+        if cfg.retrieval_mode == "hybrid":
+            # BM25 + ベクトル検索
+            retrieved_docs: list[Document] = self._hybrid_search(query_str, fetch_k)
+        else:
+            # ベクトル検索
+            retrieved_docs = [doc for doc, _ in self._dense_search(query_str, fetch_k)]
+
+        if self.reranker:
+            retrieved_docs = self.reranker.rerank_documents(query_str, retrieved_docs, cfg.top_n)
 
         # DocumentからPatentに変換：情報量が異なるので、完全に同じPatentにはならない。
         # Patentにする必要があるのか、設計しなおすべき。
@@ -112,3 +264,79 @@ class Retriever:
         # 今後：XML構造のPatent -> 内部処理用のPatent <-> Documentに変換（互換性あり）
 
         return retrieved_docs
+
+    def _hybrid_search(self, query_str: str, k: int) -> list[Document]:
+        """
+        BM25スコアとベクトル類似度を、それぞれ0〜1に正規化して重み付き和で統合し、上位k件を返す。
+        """
+        fetch_k = max(cfg.hybrid_fetch_k, k)
+        dense_hits = self._dense_search(query_str, fetch_k)
+        lexical_hits = self.lexical_index.search(query_str, k=fetch_k)
+
+        docs: dict[str, Document] = {doc.id: doc for doc, _ in dense_hits if doc.id}
+        dense_scores = _min_max_normalize({doc.id: score for doc, score in dense_hits if doc.id})
+        lexical_scores = _min_max_normalize(dict(lexical_hits))
+
+        alpha = cfg.hybrid_alpha
+        combined: dict[str, float] = {}
+        for doc_id in dense_scores.keys() | lexical_scores.keys():
+            combined[doc_id] = alpha * dense_scores.get(doc_id, 0.0) + (1 - alpha) * lexical_scores.get(doc_id, 0.0)
+        top_ids = sorted(combined, key=lambda doc_id: combined[doc_id], reverse=True)[:k]
+
+        # BM25のみでヒットしたチャンクは、Chromaから本文とメタデータを取得する
+        missing_ids = [doc_id for doc_id in top_ids if doc_id not in docs]
+        if missing_ids:
+            docs.update({doc_id: doc for doc_id, (doc, _) in self._fetch_documents(missing_ids).items()})
+
+        return [docs[doc_id] for doc_id in top_ids if doc_id in docs]
+
+    def _dense_search(self, query_str: str, k: int) -> list[tuple[Document, float]]:
+        """
+        ベクトル検索の上位k件を (Document, 類似度) で返す。
+        圧縮インデックスがある場合はそれで候補を絞り、Chromaのfloat32ベクトルで再スコアリングする。
+        """
+        if self.compressed_index is None:
+            return self.chroma.similarity_search_with_relevance_scores(query_str, k=k)
+
+        query_vector = np.asarray(self.chroma.embeddings.embed_query(query_str), dtype=np.float32)
+        rescore = cfg.compression_rescore_k > 0
+        hits = self.compressed_index.search(query_vector, max(k, cfg.compression_rescore_k) if rescore else k)
+        fetched = self._fetch_documents([doc_id for doc_id, _ in hits], with_embeddings=rescore)
+
+        results: list[tuple[Document, float]] = []
+        query_unit = normalize_rows(query_vector[None, :])[0]
+        for doc_id, approx_score in hits:
+            if doc_id not in fetched:
+                continue
+            doc, embedding = fetched[doc_id]
+            score = float(normalize_rows(embedding[None, :])[0] @ query_unit) if rescore else approx_score
+            results.append((doc, score))
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def _fetch_documents(self, ids: list[str], with_embeddings: bool = False) -> dict[str, tuple[Document, np.ndarray | None]]:
+        """
+        ChromaからIDを指定してチャンクを取得する（with_embeddings=Trueならfloat32ベクトルも取得する）。
+        """
+        include = ["documents", "metadatas", "embeddings"] if with_embeddings else ["documents", "metadatas"]
+        fetched = self.chroma.get(ids=ids, include=include)
+        embeddings = fetched["embeddings"] if with_embeddings else [None] * len(fetched["ids"])
+
+        docs: dict[str, tuple[Document, np.ndarray | None]] = {}
+        for doc_id, content, metadata, embedding in zip(fetched["ids"], fetched["documents"], fetched["metadatas"], embeddings):
+            vector = np.asarray(embedding, dtype=np.float32) if embedding is not None else None
+            docs[doc_id] = (Document(id=doc_id, page_content=content, metadata=metadata or {}), vector)
+        return docs
+
+
+def _min_max_normalize(scores: dict[str, float]) -> dict[str, float]:
+    """
+    スコアを0〜1に正規化する（全て同じ値の場合は1.0とする）。
+    """
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
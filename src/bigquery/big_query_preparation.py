@@ -1,5 +1,7 @@
 import os
 from google.cloud import bigquery
+
+from bigquery.client import get_client
 # Conflict エラーを処理するために Conflict をインポート
 from google.api_core.exceptions import NotFound, Conflict 
 from dotenv import load_dotenv
@@ -33,8 +35,8 @@ FORCE_RELOAD_DATA = False
 # ----------------------------------------------------
 
 
-# BigQueryクライアントの初期化
-client = bigquery.Client(project=PROJECT_ID)
+# BigQueryクライアントの初期化（プロセス共通のクライアントを使う）
+client = get_client(PROJECT_ID)
 
 # --- データセットの確認と作成 ---
 # (既存のコード ... )
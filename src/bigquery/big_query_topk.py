@@ -15,16 +15,35 @@ BigQuery特許検索モジュール（VECTOR_SEARCH版）
 - base には STORING 句の有無に関わらず、すべてのカラムが含まれます
 - base.publication_number のように直接アクセス可能です
 - ROWID での JOIN は不要です（そもそも ROWID は存在しません）
+
+【検索結果のキャッシュ】
+- 同じ特許・同じインデックス（テーブル/ローカル複製）なら結果は変わらないため、
+  (特許番号, インデックスのバージョン) ごとに最も大きい top_k の結果をキャッシュします
+- 1段目: プロセス内のLRU、2段目: eval/{doc}/topk/{特許番号}.csv（横に .meta.json を置く）
+- 小さい top_k の検索は、キャッシュ済みの大きい top_k の結果の先頭を切り出して返します
+
+【非同期検索（GUI向け）】
+- submit_similar_patents_search() は検索をバックグラウンドで実行する SimilarPatentSearchJob を返します
+- BigQueryの場合はクエリジョブのハンドル（job_id）を保持し、結果をページごとに取得して溜めていきます
+  （google-cloud-bigquery-storage が入っていれば Storage Read API で読みます）
+- 呼び出し側は poll() で状態を確認し、dataframe() で取得済みの結果を表示できます
 """
 
-from google.cloud import bigquery
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
+import functools
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
-from infra.config import PathManager, DirNames
+from bigquery.client import get_bqstorage_client, get_client, query_parameters, run_query
+from bigquery.local_embedding_store import LocalEmbeddingStore
+from bigquery.local_ivf_index import LocalIvfIndex
+from infra.config import PathManager, DirNames, cfg
 # to_dataframe() で BigQuery の型を適切に扱うために推奨
 # pip install db-dtypes
 
@@ -39,10 +58,18 @@ TABLE_ID = os.getenv("TABLE_ID")
 # ▲▲▲ ユーザー設定 ▲▲▲
 # ----------------------------------------------------
 
-def search_similar_patents(target_patent_number, output_csv=None, top_k=1000):
+# 検索結果のプロセス内キャッシュ: (特許番号, インデックスのバージョン) -> (top_k, 結果)
+_result_cache: OrderedDict[tuple[str, str], tuple[int, pd.DataFrame]] = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+
+def search_similar_patents(target_patent_number, output_csv=None, top_k=1000, use_cache=True):
     """
     指定した特許番号に類似する特許を VECTOR_SEARCH で検索し、CSVファイルに保存
 
+    cfg.vector_search_backend = "local" の場合は、BigQueryではなく
+    embedding_v1 のローカル複製（bigquery/local_embedding_store.py）で検索する。
+
     Parameters:
     -----------
     target_patent_number : str
@@ -51,6 +78,8 @@ def search_similar_patents(target_patent_number, output_csv=None, top_k=1000):
         出力CSVファイル名。Noneの場合は自動生成される
     top_k : int
         取得する類似特許の件数（デフォルト: 1000）
+    use_cache : bool
+        Falseの場合はキャッシュを使わずに検索し直す
 
     Returns:
     --------
@@ -64,14 +93,394 @@ def search_similar_patents(target_patent_number, output_csv=None, top_k=1000):
         output_csv = topk_dir / f'similar_patents_{target_patent_number}.csv'
         print(f"出力CSVパスが指定されていないため、デフォルト値を使用します: {output_csv}")
 
+    index_version = _index_version()
+    if use_cache:
+        df = _load_cached_result(target_patent_number, top_k, index_version, output_csv)
+        if df is not None:
+            print(f"キャッシュから取得: {target_patent_number}（{len(df)}件, {index_version}）")
+            return df
+
+    if cfg.vector_search_backend == "local":
+        print(f"ローカル検索開始: {target_patent_number}（取得件数: {top_k}）")
+        ann_index = _get_local_ivf_index() if cfg.local_search_method == "ivf" else None
+        df = _get_local_store().search(target_patent_number, top_k=top_k, ann_index=ann_index)
+    elif cfg.vector_search_backend == "bigquery":
+        df = _search_bigquery(target_patent_number, top_k)
+    else:
+        raise ValueError(f"未定義の検索バックエンドです: {cfg.vector_search_backend}")
+
+    print(f"検索完了: {len(df)}件の類似特許を発見")
+
+    if df.empty:
+        print("類似する特許は見つかりませんでした。")
+        return pd.DataFrame()
+
+    # --- 4. CSVファイルに保存（キャッシュの永続層を兼ねる） ---
+    _store_cached_result(target_patent_number, top_k, index_version, df, output_csv)
+
+    # --- 5. 統計情報の表示 ---
+    print("\n--- 統計情報 ---")
+    print(f"最大類似度: {df['cosine_similarity'].max():.4f}")
+    print(f"最小類似度: {df['cosine_similarity'].min():.4f}")
+    print(f"平均類似度: {df['cosine_similarity'].mean():.4f}")
+    print("\n--- Top 5 類似特許 ---")
+    print(df.head())
+
+    return df
+
+
+def search_similar_patents_batch(target_patent_numbers, top_k=1000, doc_numbers=None):
+    """
+    複数の特許番号について類似特許をまとめて検索し、特許ごとのCSVに保存
+
+    対象特許のベクトルは1回のルックアップでまとめて取得し、
+    ローカル検索では 行列×行列 のtop-k、BigQueryでは対象特許をクエリテーブルとする
+    VECTOR_SEARCH 1ジョブで全件を検索する（評価データセットの一括検索向け）。
+
+    Parameters:
+    -----------
+    target_patent_numbers : list[str]
+        基準とする特許番号のリスト（例: ['JP-2012040876-A', 'JP-7550342-B2']）
+    top_k : int
+        特許ごとに取得する類似特許の件数（デフォルト: 1000）
+    doc_numbers : list[str], optional
+        CSVの保存先（eval/{doc_number}/topk/{特許番号}.csv）に使う doc_number。
+        Noneの場合は特許番号の数字部分（'JP-2012040876-A' → '2012040876'）を使う。
+
+    Returns:
+    --------
+    dict[str, pd.DataFrame]
+        特許番号 → 類似特許の検索結果（見つからなかった特許番号は含まない）
+    """
+    target_patent_numbers = list(target_patent_numbers)
+    if doc_numbers is None:
+        doc_numbers = [number.split("-")[1] if number.count("-") >= 2 else number for number in target_patent_numbers]
+    output_csvs = {
+        number: PathManager.get_file(doc_number, DirNames.TOPK, f"{number}.csv")
+        for number, doc_number in zip(target_patent_numbers, doc_numbers)
+    }
+
+    # キャッシュ済みの特許は検索対象から外す
+    index_version = _index_version()
+    results = {}
+    for number in target_patent_numbers:
+        df = _load_cached_result(number, top_k, index_version, output_csvs[number])
+        if df is not None:
+            results[number] = df
+    pending = [number for number in target_patent_numbers if number not in results]
+
+    print(f"一括検索開始: {len(pending)}件（キャッシュ済み: {len(results)}件, 取得件数: {top_k}）")
+    if not pending:
+        searched = {}
+    elif cfg.vector_search_backend == "local":
+        ann_index = _get_local_ivf_index() if cfg.local_search_method == "ivf" else None
+        searched = _get_local_store().search_batch(pending, top_k=top_k, ann_index=ann_index)
+    elif cfg.vector_search_backend == "bigquery":
+        searched = _search_bigquery_batch(pending, top_k)
+    else:
+        raise ValueError(f"未定義の検索バックエンドです: {cfg.vector_search_backend}")
+
+    for number, df in searched.items():
+        _store_cached_result(number, top_k, index_version, df, output_csvs[number])
+    results.update(searched)
+    missing = [number for number in target_patent_numbers if number not in results]
+    print(f"一括検索完了: {len(results)}件（見つからなかった特許番号: {len(missing)}件）")
+    return results
+
+
+class SimilarPatentSearchJob:
+    """
+    類似特許検索をバックグラウンドスレッドで実行するジョブ（submit_similar_patents_search で作成）。
+
+    Streamlitのスクリプトスレッドを検索完了までブロックしないためのもの。
+    状態は PENDING → RUNNING → DONE / ERROR / CANCELLED と遷移する。
+    session_state にはスレッドから書き込めないため、取得済みのページはジョブ内に溜め、
+    画面側が poll() / dataframe() で読み出して反映する。
+    """
+
+    def __init__(self, target_patent_number, output_csv, top_k):
+        self.target_patent_number = target_patent_number
+        self.output_csv = Path(output_csv)
+        self.top_k = int(top_k)
+        self.state = "PENDING"
+        self.job_id = None  # BigQueryのクエリジョブID（ローカル検索・キャッシュヒット時はNone）
+        self.total_rows = None
+        self.exception = None
+        self._query_job = None
+        self._pages: list[pd.DataFrame] = []
+        self._fetched_rows = 0
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"search-{target_patent_number}", daemon=True)
+
+    @property
+    def done(self):
+        return self.state in ("DONE", "ERROR", "CANCELLED")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def poll(self):
+        """
+        ジョブの状態（state, job_id, fetched_rows, total_rows）を返す。ブロックしない。
+        """
+        with self._lock:
+            return {
+                "state": self.state,
+                "job_id": self.job_id,
+                "fetched_rows": self._fetched_rows,
+                "total_rows": self.total_rows,
+            }
+
+    def dataframe(self):
+        """
+        ここまでに取得できた結果（類似度の降順）を返す。ブロックしない。
+        """
+        with self._lock:
+            pages = list(self._pages)
+        if not pages:
+            return pd.DataFrame()
+        return pd.concat(pages, ignore_index=True)
+
+    def wait(self, timeout=None):
+        """
+        ジョブの完了を待って結果を返す（失敗した場合は例外を送出する）。
+        """
+        self._thread.join(timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.dataframe()
+
+    def cancel(self):
+        """
+        ジョブを中止する（BigQueryのクエリジョブも取り消す）。取得済みの結果は残る。
+        """
+        self._cancelled.set()
+        with self._lock:
+            query_job = self._query_job
+        if query_job is not None and not query_job.done():
+            query_job.cancel()
+
+    def _set_state(self, state):
+        with self._lock:
+            self.state = state
+
+    def _append(self, df):
+        with self._lock:
+            self._pages.append(df)
+            self._fetched_rows += len(df)
+
+    def _run(self):
+        self._set_state("RUNNING")
+        try:
+            index_version = _index_version()
+            df = _load_cached_result(self.target_patent_number, self.top_k, index_version, self.output_csv)
+            if df is not None:
+                print(f"キャッシュから取得: {self.target_patent_number}（{len(df)}件, {index_version}）")
+                self._append(df)
+                self._set_state("DONE")
+                return
+
+            if cfg.vector_search_backend == "local":
+                ann_index = _get_local_ivf_index() if cfg.local_search_method == "ivf" else None
+                self._append(_get_local_store().search(self.target_patent_number, top_k=self.top_k, ann_index=ann_index))
+            elif cfg.vector_search_backend == "bigquery":
+                self._stream_bigquery()
+            else:
+                raise ValueError(f"未定義の検索バックエンドです: {cfg.vector_search_backend}")
+
+            if self._cancelled.is_set():
+                self._set_state("CANCELLED")
+                return
+            df = self.dataframe()
+            print(f"検索完了: {len(df)}件の類似特許を発見")
+            if not df.empty:
+                _store_cached_result(self.target_patent_number, self.top_k, index_version, df, self.output_csv)
+            self._set_state("DONE")
+        except Exception as e:
+            print(f"検索ジョブでエラーが発生しました (Job ID: {self.job_id}): {e}")
+            with self._lock:
+                self.exception = e
+                self.state = "CANCELLED" if self._cancelled.is_set() else "ERROR"
+
+    def _stream_bigquery(self):
+        query_job = _submit_bigquery_search(self.target_patent_number, self.top_k)
+        with self._lock:
+            self._query_job = query_job
+            self.job_id = query_job.job_id
+        if self._cancelled.is_set():
+            query_job.cancel()
+            return
+
+        rows = query_job.result(page_size=cfg.bigquery_page_size)
+        with self._lock:
+            self.total_rows = rows.total_rows
+        # ORDER BY 付きのクエリなので、ページは類似度の降順で届く
+        for page_df in rows.to_dataframe_iterable(bqstorage_client=get_bqstorage_client()):
+            if self._cancelled.is_set():
+                break
+            self._append(page_df)
+
+
+def submit_similar_patents_search(target_patent_number, output_csv, top_k=1000):
+    """
+    類似特許検索をバックグラウンドで開始し、完了を待たずにジョブを返す。
+    結果は search_similar_patents と同じくCSV（とキャッシュ）にも保存される。
+
+    使い方:
+        job = submit_similar_patents_search('JP-2012040876-A', output_csv, top_k=10000)
+        job.poll()        # {"state": "RUNNING", "job_id": ..., "fetched_rows": 3000, "total_rows": 10000}
+        job.dataframe()   # 取得済みの結果
+    """
+    return SimilarPatentSearchJob(target_patent_number, output_csv, top_k).start()
+
+
+def _index_version():
+    """
+    検索結果のキャッシュキーに使う、検索対象インデックスのバージョン文字列。
+    インデックス（テーブル/ローカル複製）や検索方式が変われば、キャッシュは使われない。
+    """
+    if cfg.vector_search_backend == "local":
+        version = f"local:{_get_local_store().meta.get('exported_at', '')}"
+        if cfg.local_search_method == "ivf":
+            version += f":ivf:nprobe={cfg.local_ivf_nprobe}"
+        return version
+    # 時間を cfg.bigquery_table_modified_ttl 秒ごとの区間に切り、区間が変わったらテーブル情報を取り直す
+    time_bucket = int(time.time() // cfg.bigquery_table_modified_ttl)
+    return f"bigquery:{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}:{_bigquery_table_modified(time_bucket)}"
+
+
+@functools.lru_cache(maxsize=1)
+def _bigquery_table_modified(time_bucket):
+    """
+    検索対象テーブルの最終更新日時（メタデータ取得のみで、クエリ課金は発生しない）。
+    time_bucket はキャッシュの有効期限用の引数（値が変わると取得し直す）。
+    """
+    table = get_client(PROJECT_ID).get_table(f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}")
+    return table.modified.isoformat() if table.modified else ""
+
+
+def _meta_path(output_csv):
+    return Path(output_csv).with_suffix(".meta.json")
+
+
+def _load_cached_result(target_patent_number, top_k, index_version, output_csv):
+    """
+    キャッシュ済みの結果（top_k 以上）があれば、先頭 top_k 件を返す（なければNone）。
+    """
+    key = (target_patent_number, index_version)
+    with _result_cache_lock:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            _result_cache.move_to_end(key)
+
+    # 2段目: eval/{doc}/topk/{特許番号}.csv（同じ条件で保存したことが .meta.json で確認できるもののみ）
+    if cached is None or cached[0] < top_k:
+        meta_path = _meta_path(output_csv)
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (
+                meta.get("target_patent_number") == target_patent_number
+                and meta.get("index_version") == index_version
+                and meta.get("top_k", 0) >= top_k
+                and Path(output_csv).exists()
+            ):
+                cached = (meta["top_k"], pd.read_csv(output_csv))
+                _put_memory_cache(key, *cached)
+
+    if cached is None or cached[0] < top_k:
+        return None
+    cached_top_k, df = cached
+    # 指定先のCSVがなければ保存しておく（GUIは保存先のCSVを読み直すため）
+    if not Path(output_csv).exists():
+        _save_csv(df, output_csv, cached_top_k, target_patent_number, index_version)
+    return df.head(top_k).reset_index(drop=True)
+
+
+def _store_cached_result(target_patent_number, top_k, index_version, df, output_csv):
+    """
+    検索結果をキャッシュに入れ、CSV（と .meta.json）に保存する。
+    既により大きい top_k の結果がキャッシュ済みなら、CSVはそちらを残す。
+    """
+    meta_path = _meta_path(output_csv)
+    if meta_path.exists() and Path(output_csv).exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("index_version") == index_version and meta.get("top_k", 0) > top_k:
+            return
+    _put_memory_cache((target_patent_number, index_version), top_k, df)
+    _save_csv(df, output_csv, top_k, target_patent_number, index_version)
+
+
+def _put_memory_cache(key, top_k, df):
+    with _result_cache_lock:
+        cached = _result_cache.get(key)
+        if cached is None or cached[0] <= top_k:
+            _result_cache[key] = (top_k, df)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > cfg.topk_result_cache_size:
+            _result_cache.popitem(last=False)
+
+
+def _save_csv(df, output_csv, top_k, target_patent_number, index_version):
+    output_path = Path(output_csv)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(str(output_path), index=False, encoding='utf-8-sig')
+    meta = {
+        "target_patent_number": target_patent_number,
+        "top_k": top_k,
+        "index_version": index_version,
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(_meta_path(output_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"CSVファイルに保存: {output_path.absolute()}")
+
+
+@functools.cache
+def _get_local_store():
+    """
+    ローカル複製はプロセス内で1回だけ開く（memmapなので実メモリはOSのページキャッシュで共有される）。
+    """
+    return LocalEmbeddingStore(cfg.local_embedding_dir)
+
+
+@functools.cache
+def _get_local_ivf_index():
+    # ローカル複製と一致しない（再エクスポート前に構築した）インデックスは使わない
+    return LocalIvfIndex(cfg.local_ivf_dir, _get_local_store())
+
+
+def _search_bigquery(target_patent_number, top_k):
+    """
+    BigQuery の VECTOR_SEARCH で類似特許を検索する。
+    """
+    # --- 3. クエリの実行と結果の取得 ---
+    query_job = None
+    try:
+        query_job = _submit_bigquery_search(target_patent_number, top_k)
+        df = query_job.to_dataframe()
+        
+    except Exception as e:
+        job_id = query_job.job_id if query_job is not None else None
+        print(f"クエリ実行中にエラーが発生しました (Job ID: {job_id}): {e}")
+        raise e
+
+    return df
+
+
+def _submit_bigquery_search(target_patent_number, top_k):
+    """
+    VECTOR_SEARCH のクエリジョブを投入し、完了を待たずに QueryJob を返す。
+    """
     # --- 1. 設定の検証 ---
     if not all([PROJECT_ID, DATASET_ID, TABLE_ID]):
         raise ValueError(
             "環境変数 PROJECT_ID, DATASET_ID, TABLE_ID のいずれかが設定されていません。"
         )
 
-    client = bigquery.Client(project=PROJECT_ID)
-    
     # prepare.py で作成した、インデックス付きのテーブル
     search_table_full_id = f"`{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`"
 
@@ -91,10 +500,11 @@ def search_similar_patents(target_patent_number, output_csv=None, top_k=1000):
     #   インデックスに保存されたカラムから直接取得（高速）
     #
     # どちらの場合でも、クエリの書き方は同じです。
+    # 特許番号は f-string で埋め込まず、クエリパラメータ（@target_patent_number）で渡す
 # --- 1. サブクエリ（改行なし） ---
     sub_query = (
         f"SELECT embedding_v1 FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}` "
-        f"WHERE publication_number = '{target_patent_number}' LIMIT 1"
+        "WHERE publication_number = @target_patent_number LIMIT 1"
     )
 
     # --- 2. VECTOR_SEARCH を実行するメインクエリ ---
@@ -108,46 +518,62 @@ def search_similar_patents(target_patent_number, output_csv=None, top_k=1000):
             TABLE `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`,
             'embedding_v1',
             ({sub_query}),
-            top_k => {top_k},
+            top_k => {int(top_k)},
             distance_type => 'COSINE'
         ) AS T
-    WHERE T.base.publication_number != '{target_patent_number}'
+    WHERE T.base.publication_number != @target_patent_number
     ORDER BY distance ASC
     """
-    
-    job_config = bigquery.QueryJobConfig()
+    print(f"実行クエリ: {query}") # デバッグ用にクエリ内容を表示
+    return run_query(query, query_parameters(target_patent_number=target_patent_number), project=PROJECT_ID)
 
-    # --- 3. クエリの実行と結果の取得 ---
+
+def _search_bigquery_batch(target_patent_numbers, top_k):
+    """
+    対象特許の埋め込みをクエリテーブルとして、VECTOR_SEARCH 1ジョブで全件を検索する。
+    """
+    if not all([PROJECT_ID, DATASET_ID, TABLE_ID]):
+        raise ValueError(
+            "環境変数 PROJECT_ID, DATASET_ID, TABLE_ID のいずれかが設定されていません。"
+        )
+
+    table = f"`{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`"
+
+    # 対象特許の埋め込みは UNNEST した特許番号の配列で1回だけ引く
+    query = f"""
+    SELECT
+        T.query.publication_number AS target_publication_number,
+        T.base.publication_number,
+        T.distance AS cosine_distance,
+        1 - T.distance AS cosine_similarity
+    FROM
+        VECTOR_SEARCH(
+            TABLE {table},
+            'embedding_v1',
+            (
+                SELECT publication_number, embedding_v1 FROM {table}
+                WHERE publication_number IN UNNEST(@target_patent_numbers)
+            ),
+            'embedding_v1',
+            top_k => {int(top_k)},
+            distance_type => 'COSINE'
+        ) AS T
+    WHERE T.base.publication_number != T.query.publication_number
+    ORDER BY target_publication_number, cosine_distance ASC
+    """
+    query_job = None
     try:
-        print(f"実行クエリ: {query}") # デバッグ用にクエリ内容を表示
-        query_job = client.query(query, job_config=job_config)
+        query_job = run_query(query, query_parameters(target_patent_numbers=list(target_patent_numbers)), project=PROJECT_ID)
         df = query_job.to_dataframe()
-        
     except Exception as e:
-        print(f"クエリ実行中にエラーが発生しました (Job ID: {query_job.job_id}): {e}")
+        job_id = query_job.job_id if query_job is not None else None
+        print(f"一括検索クエリの実行中にエラーが発生しました (Job ID: {job_id}): {e}")
         raise e
 
-    print(f"検索完了: {len(df)}件の類似特許を発見")
-
-    if df.empty:
-        print("類似する特許は見つかりませんでした。")
-        return pd.DataFrame()
-
-    # --- 4. CSVファイルに保存 ---
-    output_path = Path(output_csv)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(str(output_path), index=False, encoding='utf-8-sig')
-    print(f"CSVファイルに保存: {output_path.absolute()}")
-
-    # --- 5. 統計情報の表示 ---
-    print("\n--- 統計情報 ---")
-    print(f"最大類似度: {df['cosine_similarity'].max():.4f}")
-    print(f"最小類似度: {df['cosine_similarity'].min():.4f}")
-    print(f"平均類似度: {df['cosine_similarity'].mean():.4f}")
-    print("\n--- Top 5 類似特許 ---")
-    print(df.head())
-
-    return df
+    return {
+        number: group.drop(columns="target_publication_number").reset_index(drop=True)
+        for number, group in df.groupby("target_publication_number", sort=False)
+    }
 
 
 # --- 使用例 ---
@@ -166,4 +592,6 @@ if __name__ == "__main__":
     #         top_k=1000
     #     )
     # except Exception as e:
-    #     print(f"スクリプトの実行に失敗しました: {e}")
\ No newline at end of file
+    #     print(f"スクリプトの実行に失敗しました: {e}")
+    # # 評価データセットの一括検索（特許ごとに eval/{doc_number}/topk/{特許番号}.csv へ保存）
+    # search_similar_patents_batch(['JP-2012040876-A', 'JP-2014007731-A'], top_k=1000)
@@ -0,0 +1,126 @@
+"""
+BigQueryクライアントの共通モジュール
+
+bigquery.Client の生成（認証情報の読み込み・HTTPセッションの確立）は呼び出しのたびに行うと遅いため、
+(プロジェクト, ロケーション) ごとにプロセス内で1つだけ生成して使い回します。
+HTTPコネクションプールは、スレッドから並列にクエリを投げても詰まらない大きさに広げます。
+
+SQLへの値の埋め込みは f-string ではなくクエリパラメータ（@name）で行います。
+クエリ文字列が値によらず同じになるため、BigQueryの結果キャッシュが効きやすくなり、SQLインジェクションも防げます。
+
+使い方:
+    from bigquery.client import get_client, query_parameters, run_query
+
+    rows = run_query(
+        "SELECT publication_number FROM `p.d.t` WHERE publication_number IN UNNEST(@numbers)",
+        query_parameters(numbers=["JP-2012040876-A"]),
+    )
+"""
+
+import functools
+import numbers
+import os
+import threading
+
+import google.auth
+from dotenv import load_dotenv
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+
+from infra.config import cfg
+
+load_dotenv()
+
+_clients: dict[tuple[str | None, str | None], bigquery.Client] = {}
+_clients_lock = threading.Lock()
+
+# Pythonの値の型 → BigQueryのパラメータ型（boolはintのサブクラスなので先に判定する）
+_PARAMETER_TYPES = ((bool, "BOOL"), (numbers.Integral, "INT64"), (numbers.Real, "FLOAT64"), (str, "STRING"))
+
+
+def get_client(project: str | None = None, location: str | None = None) -> bigquery.Client:
+    """
+    プロセス共通のBigQueryクライアントを返す（初回のみ生成）。
+    projectを省略した場合は環境変数 GCP_PROJECT_ID を使う。
+    """
+    project = project or os.getenv("GCP_PROJECT_ID")
+    key = (project, location)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            credentials, default_project = google.auth.default(scopes=bigquery.Client.SCOPE)
+            # 既定のプールサイズ（10）では、スレッドから並列にクエリを投げると接続待ちになるため広げる。
+            # クライアント内部のセッション（client._http）には触れず、プールを広げたセッションを作って渡す
+            session = AuthorizedSession(credentials)
+            adapter = HTTPAdapter(pool_connections=cfg.bigquery_pool_size, pool_maxsize=cfg.bigquery_pool_size)
+            session.mount("https://", adapter)
+            client = bigquery.Client(
+                project=project or default_project, credentials=credentials, location=location, _http=session
+            )
+            _clients[key] = client
+        return client
+
+
+@functools.cache
+def get_bqstorage_client():
+    """
+    BigQuery Storage Read API のクライアントを返す（google-cloud-bigquery-storage 未導入ならNone）。
+    大きな結果を RowIterator.to_dataframe_iterable() でページごとに読むときに渡すと、
+    REST のページングより速く結果が届く。Noneの場合は REST のページングで読まれる。
+    """
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+
+def query_parameters(**values) -> list:
+    """
+    キーワード引数からクエリパラメータのリストを作る（リスト・タプルは配列パラメータになる）。
+
+    例:
+        query_parameters(target="JP-2012040876-A", top_k=1000, numbers=["JP-...", "JP-..."])
+    """
+    parameters = []
+    for name, value in values.items():
+        if isinstance(value, (list, tuple)):
+            element_type = _parameter_type(value[0]) if value else "STRING"
+            parameters.append(bigquery.ArrayQueryParameter(name, element_type, list(value)))
+        else:
+            parameters.append(bigquery.ScalarQueryParameter(name, _parameter_type(value), value))
+    return parameters
+
+
+def _parameter_type(value) -> str:
+    for python_type, parameter_type in _PARAMETER_TYPES:
+        if isinstance(value, python_type):
+            return parameter_type
+    raise TypeError(f"クエリパラメータにできない型です: {type(value)}")
+
+
+def job_config(parameters: list | None = None, use_query_cache: bool | None = None) -> bigquery.QueryJobConfig:
+    """
+    クエリパラメータと結果キャッシュの設定を持つ QueryJobConfig を作る。
+    use_query_cache を省略した場合は cfg.bigquery_use_query_cache に従う。
+    """
+    return bigquery.QueryJobConfig(
+        query_parameters=parameters or [],
+        use_query_cache=cfg.bigquery_use_query_cache if use_query_cache is None else use_query_cache,
+    )
+
+
+def run_query(
+    query: str,
+    parameters: list | None = None,
+    project: str | None = None,
+    location: str | None = None,
+    use_query_cache: bool | None = None,
+) -> bigquery.QueryJob:
+    """
+    共通クライアントでパラメータ付きクエリを投入し、QueryJob を返す。
+    結果は .result()（行イテレータ）または .to_dataframe() で取得する。
+    """
+    client = get_client(project, location)
+    return client.query(query, job_config=job_config(parameters, use_query_cache))
@@ -0,0 +1,223 @@
+"""
+embedding_v1 のローカル複製モジュール
+
+BigQueryの検索対象テーブル（publication_number, embedding_v1 の64次元ベクトル）を一度だけエクスポートし、
+ローカルのメモリマップ行列として保持します。
+類似特許検索をBigQueryの VECTOR_SEARCH ではなく、プロセス内のNumPy計算で行うためのものです
+（ネットワーク通信・クエリ課金なし）。
+
+ディスク構成（store_dir 配下）:
+    meta.json                 件数・次元・dtype・エクスポート元テーブルなど
+    vectors.npy               (件数 × 64) のL2正規化済みベクトル（float16 または float32）
+    publication_numbers.npy   公開番号（昇順にソート済み、vectors.npy と同じ行順）
+
+実行方法（srcディレクトリで、エクスポートのみ）:
+    uv run python -m bigquery.local_embedding_store
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from bigquery.topk_kernel import blocked_topk, blocked_topk_batch
+from infra.config import cfg
+
+load_dotenv()
+
+EMBEDDING_DIM = 64
+DTYPES = ("float32", "float16")
+
+
+def export_embeddings(
+    store_dir: str | Path,
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    dtype: str = "float16",
+    page_size: int = 100000,
+) -> "LocalEmbeddingStore":
+    """
+    BigQueryのテーブルから全ベクトルをエクスポートし、ローカル複製を作成する。
+    行列はメモリマップに直接書き込むため、全件をメモリに載せずに済む。
+    """
+    from bigquery.client import query_parameters, run_query
+
+    if dtype not in DTYPES:
+        raise ValueError(f"未定義のdtypeです: {dtype}")
+
+    # 公開番号の昇順で取得し、そのまま二分探索できる並びで保存する
+    query = (
+        f"SELECT publication_number, embedding_v1 FROM `{project_id}.{dataset_id}.{table_id}` "
+        "WHERE ARRAY_LENGTH(embedding_v1) = @dim "
+        "ORDER BY publication_number"
+    )
+    rows = run_query(query, query_parameters(dim=EMBEDDING_DIM), project=project_id).result(page_size=page_size)
+    n_rows = rows.total_rows
+    print(f"エクスポート開始: {n_rows}件 → {store_dir}")
+
+    store_dir = Path(store_dir)
+    tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    vectors = np.lib.format.open_memmap(tmp_dir / "vectors.npy", mode="w+", dtype=dtype, shape=(n_rows, EMBEDDING_DIM))
+    publication_numbers: list[str] = []
+    offset = 0
+    for page_df in rows.to_dataframe_iterable():
+        page_vectors = np.asarray(np.stack(page_df["embedding_v1"].to_numpy()), dtype=np.float32)
+        # 検索時に内積＝コサイン類似度となるよう、エクスポート時に正規化しておく
+        page_vectors /= np.maximum(np.linalg.norm(page_vectors, axis=1, keepdims=True), 1e-12)
+        vectors[offset : offset + len(page_df)] = page_vectors
+        publication_numbers.extend(page_df["publication_number"])
+        offset += len(page_df)
+        print(f"  {offset}/{n_rows}件")
+    vectors.flush()
+    del vectors
+
+    np.save(tmp_dir / "publication_numbers.npy", np.asarray(publication_numbers, dtype=np.bytes_))
+    meta = {
+        "count": offset,
+        "dim": EMBEDDING_DIM,
+        "dtype": dtype,
+        "source_table": f"{project_id}.{dataset_id}.{table_id}",
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    tmp_dir.rename(store_dir)
+    print(f"エクスポート完了: {store_dir}")
+    return LocalEmbeddingStore(store_dir)
+
+
+class LocalEmbeddingStore:
+    """
+    embedding_v1 のローカル複製に対する類似特許検索。
+
+    使い方:
+        store = LocalEmbeddingStore(cfg.local_embedding_dir)
+        df = store.search("JP-2023123456-A", top_k=1000)  # publication_number, cosine_distance, cosine_similarity
+    """
+
+    def __init__(self, store_dir: str | Path):
+        self.store_dir = Path(store_dir)
+        if not self.exists(self.store_dir):
+            raise FileNotFoundError(
+                f"embedding_v1 のローカル複製がありません: {self.store_dir}\n"
+                "src で `uv run python -m bigquery.local_embedding_store` を実行してエクスポートしてください。"
+            )
+        with open(self.store_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta: dict = json.load(f)
+        self.vectors = np.load(self.store_dir / "vectors.npy", mmap_mode="r")
+        self.publication_numbers = np.load(self.store_dir / "publication_numbers.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(store_dir: str | Path) -> bool:
+        return (Path(store_dir) / "meta.json").exists()
+
+    def __len__(self) -> int:
+        return len(self.publication_numbers)
+
+    def lookup(self, publication_number: str) -> int | None:
+        """
+        公開番号の行番号を二分探索で求める（見つからなければNone）。
+        """
+        key = np.bytes_(publication_number)
+        row = int(np.searchsorted(self.publication_numbers, key))
+        if row < len(self.publication_numbers) and self.publication_numbers[row] == key:
+            return row
+        return None
+
+    def get_vector(self, publication_number: str) -> np.ndarray:
+        row = self.lookup(publication_number)
+        if row is None:
+            raise KeyError(f"ローカル複製に存在しない公開番号です: {publication_number}")
+        return np.asarray(self.vectors[row], dtype=np.float32)
+
+    def search(self, target_patent_number: str, top_k: int = 1000, ann_index=None) -> pd.DataFrame:
+        """
+        指定した特許に類似する特許の上位top_k件を返す（対象特許自身は除く）。
+        列は search_similar_patents（VECTOR_SEARCH版）と同じ。
+        ann_index（LocalIvfIndex）を渡すと、厳密検索の代わりに近似最近傍検索を行う。
+        """
+        target_row = self.lookup(target_patent_number)
+        if target_row is None:
+            raise KeyError(f"ローカル複製に存在しない公開番号です: {target_patent_number}")
+
+        # WHERE publication_number != target 相当で、対象特許自身を除外する
+        if ann_index is not None:
+            top_rows, similarities = ann_index.search(
+                self.vectors[target_row], top_k, nprobe=cfg.local_ivf_nprobe, exclude_rows=[target_row]
+            )
+        else:
+            top_rows, similarities = blocked_topk(
+                self.vectors,
+                self.vectors[target_row],
+                top_k,
+                exclude_rows=[target_row],
+                block_size=cfg.local_search_block_size,
+                n_threads=cfg.local_search_threads,
+            )
+        return self._to_dataframe(top_rows, similarities)
+
+    def search_batch(self, target_patent_numbers: list[str], top_k: int = 1000, ann_index=None) -> dict[str, pd.DataFrame]:
+        """
+        複数の特許について類似特許を検索し、{公開番号: 結果} を返す。
+        厳密検索では、全対象のベクトルを1回で引き、行列を1回走査する 行列×行列 のtop-kで計算する。
+        ローカル複製に存在しない公開番号はスキップする。
+        """
+        targets: list[str] = []
+        target_rows: list[int] = []
+        for number in dict.fromkeys(target_patent_numbers):
+            row = self.lookup(number)
+            if row is None:
+                print(f"ローカル複製に存在しない公開番号のためスキップします: {number}")
+                continue
+            targets.append(number)
+            target_rows.append(row)
+        if not targets:
+            return {}
+
+        if ann_index is not None:
+            hits = [
+                ann_index.search(self.vectors[row], top_k, nprobe=cfg.local_ivf_nprobe, exclude_rows=[row]) for row in target_rows
+            ]
+        else:
+            hits = blocked_topk_batch(
+                self.vectors,
+                self.vectors[np.asarray(target_rows)],
+                top_k,
+                exclude_rows=target_rows,
+                block_size=cfg.local_search_block_size,
+                n_threads=cfg.local_search_threads,
+            )
+        return {number: self._to_dataframe(rows, similarities) for number, (rows, similarities) in zip(targets, hits)}
+
+    def _to_dataframe(self, rows: np.ndarray, similarities: np.ndarray) -> pd.DataFrame:
+        similarities = similarities.astype(np.float64)
+        return pd.DataFrame(
+            {
+                "publication_number": self.publication_numbers[rows].astype(str),
+                "cosine_distance": 1 - similarities,
+                "cosine_similarity": similarities,
+            }
+        )
+
+
+if __name__ == "__main__":
+    export_embeddings(
+        cfg.local_embedding_dir,
+        project_id=os.getenv("GCP_PROJECT_ID"),
+        dataset_id=os.getenv("DATASET_ID"),
+        table_id=os.getenv("TABLE_ID"),
+        dtype=cfg.local_embedding_dtype,
+    )
@@ -0,0 +1,229 @@
+"""
+embedding_v1 のローカル複製に対するIVF近似最近傍インデックス
+
+big_query_preparation.py がBigQuery側に作成する IVF ベクトルインデックスのローカル版です。
+k-meansのセントロイドでベクトルをクラスタ（転置リスト）に分け、検索時はクエリに近い nprobe 個の
+クラスタだけを厳密にスコアリングします。nprobe を大きくするほど recall が上がり、遅くなります。
+
+ディスク構成（index_dir 配下）:
+    meta.json           クラスタ数・件数と、構築元のローカル複製（store_dir, エクスポート日時）
+    centroids.npy       (nlist × 64) の正規化済みセントロイド
+    list_offsets.npy    クラスタiの行は list_rows[list_offsets[i]:list_offsets[i+1]]
+    list_rows.npy       クラスタ順に並べたローカル複製の行番号
+    list_vectors.npy    クラスタ順に並べたベクトル（1クラスタを連続領域で読めるように複製を並べ替えたもの）
+
+実行方法（srcディレクトリで、インデックス構築 + 厳密検索との recall@1000 比較）:
+    uv run python -m bigquery.local_ivf_index
+"""
+
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bigquery.local_embedding_store import LocalEmbeddingStore
+from bigquery.topk_kernel import DEFAULT_BLOCK_SIZE, blocked_topk
+from infra.config import cfg
+from infra.index.compressed_index import kmeans, normalize_rows
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    各ベクトルを最もコサイン類似度の高いセントロイドに割り当てる（ブロック単位で計算）。
+    """
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+        assign[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class LocalIvfIndex:
+    """
+    IVF（転置ファイル）による近似top-kコサイン類似度検索。
+
+    使い方:
+        index = LocalIvfIndex.build(cfg.local_ivf_dir, store, nlist=1024)
+        rows, scores = index.search(query_vector, k=1000, nprobe=16)
+    """
+
+    def __init__(self, index_dir: str | Path, store: LocalEmbeddingStore | None = None):
+        """
+        Args:
+            index_dir: インデックスの保存ディレクトリ
+            store: 検索対象のローカル複製。渡すと、インデックスがこの複製から構築されたものかを確認し、
+                違えば（再エクスポート後など、行番号がずれている場合）ValueError を送出する
+        """
+        self.index_dir = Path(index_dir)
+        if not self.exists(self.index_dir):
+            raise FileNotFoundError(
+                f"IVFインデックスがありません: {self.index_dir}\n"
+                "src で `uv run python -m bigquery.local_ivf_index` を実行して構築してください。"
+            )
+        with open(self.index_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta: dict = json.load(f)
+        self.centroids = np.load(self.index_dir / "centroids.npy")
+        self.list_offsets = np.load(self.index_dir / "list_offsets.npy")
+        self.list_rows = np.load(self.index_dir / "list_rows.npy", mmap_mode="r")
+        self.list_vectors = np.load(self.index_dir / "list_vectors.npy", mmap_mode="r")
+        if store is not None and not self.is_built_for(store):
+            raise ValueError(
+                f"IVFインデックスがローカル複製と一致しません: {self.index_dir}\n"
+                f"  インデックス: 件数={self.meta.get('count')}, エクスポート日時={self.meta.get('store_exported_at')}\n"
+                f"  ローカル複製: 件数={len(store)}, エクスポート日時={store.meta.get('exported_at')}\n"
+                "src で `uv run python -m bigquery.local_ivf_index` を実行して再構築してください。"
+            )
+
+    @staticmethod
+    def exists(index_dir: str | Path) -> bool:
+        return (Path(index_dir) / "meta.json").exists()
+
+    def is_built_for(self, store: LocalEmbeddingStore) -> bool:
+        """
+        インデックスが store（件数・エクスポート日時が同じローカル複製）から構築されたものかどうか。
+        list_rows はローカル複製の行番号なので、複製を作り直したら再構築が必要になる。
+        """
+        return self.meta.get("count") == len(store) and self.meta.get("store_exported_at") == store.meta.get("exported_at")
+
+    @classmethod
+    def build(
+        cls,
+        index_dir: str | Path,
+        store: LocalEmbeddingStore,
+        nlist: int = 1024,
+        sample_per_list: int = 64,
+        n_iter: int = 20,
+        seed: int = 0,
+        block_size: int = 1 << 20,
+    ) -> "LocalIvfIndex":
+        """
+        ローカル複製からIVFインデックスを構築して保存する。
+        k-meansは nlist × sample_per_list 件のサンプルで学習し、全件の割り当てはブロック単位で行う。
+        """
+        vectors = store.vectors
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(len(vectors), size=min(nlist * sample_per_list, len(vectors)), replace=False))
+        sample = normalize_rows(vectors[sample_rows])
+        print(f"k-means学習: nlist={nlist}, サンプル={len(sample)}件")
+        centroids = normalize_rows(kmeans(sample, nlist, n_iter=n_iter, seed=seed))
+
+        print(f"割り当て: {len(vectors)}件")
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))]).astype(np.int64)
+
+        index_dir = Path(index_dir)
+        tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        np.save(tmp_dir / "centroids.npy", centroids.astype(np.float32))
+        np.save(tmp_dir / "list_offsets.npy", offsets)
+        np.save(tmp_dir / "list_rows.npy", order.astype(np.int64))
+        list_vectors = np.lib.format.open_memmap(tmp_dir / "list_vectors.npy", mode="w+", dtype=vectors.dtype, shape=vectors.shape)
+        for start in range(0, len(order), block_size):
+            rows = order[start : start + block_size]
+            # memmapからの読み出しを局所化するため、行番号の昇順で読んでから元の並びに戻す
+            sorted_idx = np.argsort(rows)
+            block = np.empty((len(rows), vectors.shape[1]), dtype=vectors.dtype)
+            block[sorted_idx] = vectors[rows[sorted_idx]]
+            list_vectors[start : start + len(rows)] = block
+        list_vectors.flush()
+        del list_vectors
+
+        with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+            meta = {
+                "nlist": len(centroids),
+                "count": len(vectors),
+                "store_dir": str(store.store_dir),
+                "store_exported_at": store.meta.get("exported_at"),
+            }
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        tmp_dir.rename(index_dir)
+        print(f"IVFインデックスを保存しました: {index_dir}")
+        return cls(index_dir, store)
+
+    def search(
+        self, query: np.ndarray, k: int, nprobe: int = 16, exclude_rows: list[int] | np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        クエリに近い nprobe 個のクラスタ内だけを厳密にスコアリングし、上位k件を返す。
+
+        Returns:
+            (ローカル複製の行番号, コサイン類似度)。類似度の降順
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        centroid_scores = self.centroids @ query
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+
+        candidate_rows: list[np.ndarray] = []
+        candidate_scores: list[np.ndarray] = []
+        for cluster in probes:
+            start, end = self.list_offsets[cluster], self.list_offsets[cluster + 1]
+            if start == end:
+                continue
+            candidate_rows.append(np.asarray(self.list_rows[start:end]))
+            candidate_scores.append(np.asarray(self.list_vectors[start:end], dtype=np.float32) @ query)
+        if not candidate_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        if exclude_rows is not None:
+            keep = ~np.isin(rows, np.asarray(exclude_rows))
+            rows, scores = rows[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            rows, scores = rows[top], scores[top]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+
+def run_recall_report(
+    store: LocalEmbeddingStore,
+    index: LocalIvfIndex,
+    k: int = 1000,
+    nprobes: tuple[int, ...] = (1, 4, 8, 16, 32, 64),
+    n_queries: int = 50,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    厳密検索（ブロック分割top-k）を基準に、nprobe ごとの recall@k と平均レイテンシを表示する。
+    """
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(len(store), size=min(n_queries, len(store)), replace=False)
+
+    exact: dict[int, set[int]] = {}
+    start = time.perf_counter()
+    for target in targets:
+        rows, _ = blocked_topk(store.vectors, store.vectors[target], k, exclude_rows=[target], n_threads=cfg.local_search_threads)
+        exact[target] = set(rows.tolist())
+    exact_ms = (time.perf_counter() - start) * 1000 / len(targets)
+    print(f"厳密検索: {exact_ms:.1f} ms/query")
+
+    results = []
+    for nprobe in nprobes:
+        recalls = []
+        start = time.perf_counter()
+        for target in targets:
+            rows, _ = index.search(store.vectors[target], k, nprobe=nprobe, exclude_rows=[target])
+            recalls.append(len(exact[target] & set(rows.tolist())) / max(len(exact[target]), 1))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(targets)
+        row = {"nprobe": nprobe, f"recall@{k}": float(np.mean(recalls)), "latency_ms": latency_ms}
+        print(row)
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    store = LocalEmbeddingStore(cfg.local_embedding_dir)
+    index = LocalIvfIndex(cfg.local_ivf_dir) if LocalIvfIndex.exists(cfg.local_ivf_dir) else None
+    if index is None or not index.is_built_for(store):
+        index = LocalIvfIndex.build(cfg.local_ivf_dir, store, nlist=cfg.local_ivf_nlist)
+    run_recall_report(store, index)
@@ -1,7 +1,12 @@
 """BigQueryでpatent_lookupテーブルを作成"""
 
-from google.cloud import bigquery
 import copy
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core.exceptions import BadRequest
+
+from bigquery.client import get_client, query_parameters, run_query
+from infra.config import cfg
 
 PROJECT_ID = "llmatch-471107"
 DATASET_ID = "dataset_lookup"
@@ -12,7 +17,7 @@ SOURCE_DATASET = "dataset03"
 
 def create_patent_lookup_table():
     """patent_lookupテーブルを作成"""
-    client = bigquery.Client(project=PROJECT_ID, location="us-central1")
+    client = get_client(PROJECT_ID, location="us-central1")
 
     query = f"""
     CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
@@ -54,33 +59,28 @@ def create_patent_lookup_table():
     print(f"完了: {table.num_rows:,} 件, {table.num_bytes / 1024**2:.2f} MB")
 
 
-def find_documents_batch(publication_numbers):
-    client = bigquery.Client(project=PROJECT_ID)
-    
+def find_documents_batch(doc_numbers):
+    """
+    doc_number の完全一致で patent_lookup テーブルを引く。
+    doc_number は model.patent_number.lookup_keys で作ったキーを渡す
+    （クラスタリングキーの等値条件になるため、テーブル全体を走査しない）。
+    """
     # 入力リストをTOP_Kで切り取る（必要であれば）
     # publication_numbers = publication_numbers[:TOP_K]
 
-    # SQL: UNNESTを使って配列を展開し、LIKE検索でJOINする
-    # DISTINCTをつけることで、複数の検索値に同じドキュメントがヒットした場合の重複を除去します
+    # SQL: UNNESTで展開した配列との完全一致（LIKEの部分一致はクラスタで絞り込めず全件走査になる）
+    # DISTINCTをつけることで、重複を除去します
     query = f"""
         SELECT DISTINCT
             t.result_table, 
             t.doc_number,
             t.path 
         FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}` AS t
-        INNER JOIN UNNEST(@pub_nums_array) AS input_num
-            ON t.doc_number LIKE CONCAT('%', input_num, '%')
+        WHERE t.doc_number IN UNNEST(@doc_numbers_array)
     """
 
-    # リストをARRAYパラメータとして渡す設定
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ArrayQueryParameter("pub_nums_array", "STRING", publication_numbers)
-        ]
-    )
-
-    # 1回だけクエリを実行
-    query_job = client.query(query, job_config=job_config)
+    # リストをARRAYパラメータとして渡し、1回だけクエリを実行
+    query_job = run_query(query, query_parameters(doc_numbers_array=list(doc_numbers)), project=PROJECT_ID)
     results = list(query_job.result())
 
     # 結果を辞書リストで返す
@@ -90,61 +90,90 @@ def find_documents_batch(publication_numbers):
 DEBUG = False
 
 def get_abstract_claims_by_query(top_k_df):
-    
-    client = bigquery.Client(project=PROJECT_ID)
+    """
+    search_path の結果（table_name, number 列）について、各文献の要約・請求項を取得する。
 
-    name_table_dict = {}
-    abstraccts_claims_list = []
+    result_* のワイルドカードテーブルに対する1回のクエリ
+    （_TABLE_SUFFIX IN UNNEST(@tables) AND doc_number IN UNNEST(@ids)）で全テーブル分をまとめて取得し、
+    top_k（top_k_df での順位）は辞書で対応付ける。
+    ワイルドカードクエリが失敗した場合（テーブル間でスキーマが異なる場合など）は、
+    テーブルごとのクエリをスレッドプールで並列に実行する。
 
-    for _, row in top_k_df.iterrows():
-        table_name = row['table_name']
-        publication_number = row['number']
+    Returns:
+        [{"doc_number", "abstract", "claims", "top_k"}, ...]（top_k の昇順）
+    """
+    # table_nameをキーにして、文献番号をまとめる。順位は最初に現れた行で決める
+    # （重複の判定を定数時間で行うため、出現順を保つ dict のキーとして集めてからリストにする）
+    numbers_by_table = {}
+    rank_by_number = {}
+    for rank, (table_name, number) in enumerate(zip(top_k_df['table_name'], top_k_df['number']), start=1):
         if table_name is None:
             continue
-        # table_nameをキーにして、publication_numberをリストでまとめる
-        if table_name not in name_table_dict:
-            name_table_dict[table_name] = []
-        name_table_dict[table_name].append(publication_number)
-
-
-    for table_name, name_list in name_table_dict.items():
-        # doc_infosからpathを取得し、クエリ対象の文献番号リストを作成
-        # '/tmp/tmpn5es9j7o/result_16/3/JP2025021568A/text.txt'
-        # JP2025021568Aを取得
-        table_name = f"result_{table_name}"
-
-        query = f"""
-            SELECT 
-                publication.doc_number,
-                abstract,
-                claims
-            FROM `{PROJECT_ID}.{SOURCE_DATASET}.{table_name}`
-            WHERE publication.doc_number IN UNNEST(@doc_numbers_array)
-        """
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ArrayQueryParameter("doc_numbers_array", "STRING", name_list)
-            ]
-        )
-
-        query_job = client.query(query, job_config=job_config)
-        results = list(query_job.result())
-        for row in results:
-            row_dict = {row["doc_number"]: (row["abstract"], row["claims"])}
-            # find n-th row in top_k_df where publication_number == row["doc_number"]
-            # get index of that row
-            n_th_row_index = top_k_df.index[top_k_df['number'] == row["doc_number"]].tolist()[0]
-            # pandas series to dict
-            row_dict = dict(row)
-            row_dict["top_k"] = n_th_row_index + 1
-            abstraccts_claims_list.append(copy.deepcopy(row_dict))
-
-        if DEBUG:# デバッグモード注意
-            print("DEBUG: get_abstract_claims_by_query ")
-            return abstraccts_claims_list
-    
+        numbers_by_table.setdefault(str(table_name), {}).setdefault(number)
+        rank_by_number.setdefault(number, rank)
+    name_table_dict = {table_name: list(numbers) for table_name, numbers in numbers_by_table.items()}
+    if DEBUG:# デバッグモード注意: 最初のテーブルだけを取得する
+        print("DEBUG: get_abstract_claims_by_query ")
+        name_table_dict = dict(list(name_table_dict.items())[:1])
+    if not name_table_dict:
+        return []
+
+    try:
+        rows = _fetch_abstract_claims_wildcard(name_table_dict)
+    except BadRequest as e:
+        print(f"ワイルドカードテーブルのクエリに失敗したため、テーブルごとに並列で取得します: {e}")
+        with ThreadPoolExecutor(max_workers=min(len(name_table_dict), cfg.bigquery_pool_size)) as executor:
+            results = executor.map(lambda item: _fetch_abstract_claims_table(*item), name_table_dict.items())
+            rows = [row for table_rows in results for row in table_rows]
+
+    abstraccts_claims_list = []
+    for row in rows:
+        row_dict = dict(row)
+        row_dict["top_k"] = rank_by_number[row_dict["doc_number"]]
+        abstraccts_claims_list.append(copy.deepcopy(row_dict))
+    abstraccts_claims_list.sort(key=lambda row_dict: row_dict["top_k"])
     return abstraccts_claims_list
 
 
+def _fetch_abstract_claims_wildcard(name_table_dict):
+    """
+    result_* の全対象テーブルから、1回のクエリで要約・請求項を取得する。
+    """
+    query = f"""
+        SELECT
+            _TABLE_SUFFIX AS table_suffix,
+            publication.doc_number,
+            abstract,
+            claims
+        FROM `{PROJECT_ID}.{SOURCE_DATASET}.result_*`
+        WHERE _TABLE_SUFFIX IN UNNEST(@tables)
+          AND publication.doc_number IN UNNEST(@doc_numbers_array)
+    """
+    doc_numbers = sorted({number for numbers in name_table_dict.values() for number in numbers})
+    parameters = query_parameters(tables=list(name_table_dict), doc_numbers_array=doc_numbers)
+    results = run_query(query, parameters, project=PROJECT_ID).result()
+
+    # 同じ文献番号が別テーブルにもある場合があるため、(テーブル, 文献番号) の組で絞り込む
+    requested = {(table_name, number) for table_name, numbers in name_table_dict.items() for number in numbers}
+    rows = []
+    for row in results:
+        row_dict = dict(row)
+        if (row_dict.pop("table_suffix"), row_dict["doc_number"]) in requested:
+            rows.append(row_dict)
+    return rows
 
+
+def _fetch_abstract_claims_table(table_name, name_list):
+    """
+    1つの result_X テーブルから要約・請求項を取得する（ワイルドカードクエリのフォールバック用）。
+    """
+    query = f"""
+        SELECT 
+            publication.doc_number,
+            abstract,
+            claims
+        FROM `{PROJECT_ID}.{SOURCE_DATASET}.result_{table_name}`
+        WHERE publication.doc_number IN UNNEST(@doc_numbers_array)
+    """
+    query_job = run_query(query, query_parameters(doc_numbers_array=name_list), project=PROJECT_ID)
+    return [dict(row) for row in query_job.result()]
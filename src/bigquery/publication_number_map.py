@@ -0,0 +1,148 @@
+"""
+doc_number → 公開番号（publication_number）の対応表モジュール
+
+XMLの doc_number（例: "2012040876"）からBigQueryの publication_number（例: "JP-2012040876-A"）を求めるのに、
+LIKE '%…%' でテーブル全体を走査せずに済むよう、model/patent_number.py の完全一致キーで引ける対応表をローカルに作ります。
+対応表がない場合は、候補の公開番号を IN UNNEST で完全一致照合するクエリにフォールバックします。
+
+ディスク構成（map_dir 配下）:
+    keys.npy        照合キー（昇順にソート済み）
+    canonical.npy   キーに対応する公開番号（keys.npy と同じ並び）
+
+実行方法（srcディレクトリで。ローカル複製があればそこから、なければBigQueryから作成）:
+    uv run python -m bigquery.publication_number_map
+"""
+
+import os
+import shutil
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+from infra.config import cfg
+from model.patent_number import candidate_publication_numbers, lookup_keys
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+DATASET_ID = os.getenv("DATASET_ID")
+TABLE_ID = os.getenv("TABLE_ID")
+
+
+class PublicationNumberMap:
+    """
+    照合キー → 公開番号 の対応表（ソート済み配列の二分探索で引く）。
+    """
+
+    def __init__(self, map_dir: str | Path):
+        self.map_dir = Path(map_dir)
+        self.keys = np.load(self.map_dir / "keys.npy", mmap_mode="r")
+        self.canonical = np.load(self.map_dir / "canonical.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(map_dir: str | Path) -> bool:
+        return (Path(map_dir) / "canonical.npy").exists()
+
+    @classmethod
+    def build(cls, map_dir: str | Path, publication_numbers: Iterable[str]) -> "PublicationNumberMap":
+        """
+        公開番号の一覧から対応表を作成して保存する。
+        """
+        keys: list[str] = []
+        canonical: list[str] = []
+        for publication_number in publication_numbers:
+            for key in lookup_keys(publication_number):
+                keys.append(key)
+                canonical.append(publication_number)
+
+        keys_array = np.asarray(keys, dtype=np.bytes_)
+        canonical_array = np.asarray(canonical, dtype=np.bytes_)
+        order = np.argsort(keys_array, kind="stable")
+
+        map_dir = Path(map_dir)
+        tmp_dir = map_dir.with_name(map_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        np.save(tmp_dir / "keys.npy", keys_array[order])
+        np.save(tmp_dir / "canonical.npy", canonical_array[order])
+        if map_dir.exists():
+            shutil.rmtree(map_dir)
+        tmp_dir.rename(map_dir)
+        print(f"対応表を保存しました: {map_dir}（{len(keys)}キー）")
+        return cls(map_dir)
+
+    def lookup(self, key: str) -> list[str]:
+        """
+        照合キーに対応する公開番号をすべて返す（種別コード違いで複数ある場合がある）。
+        """
+        key = np.bytes_(key)
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        return [value.decode() for value in self.canonical[start:end]]
+
+
+_map: PublicationNumberMap | None = None
+
+
+def _get_map() -> PublicationNumberMap | None:
+    global _map
+    if _map is None and PublicationNumberMap.exists(cfg.publication_number_map_dir):
+        _map = PublicationNumberMap(cfg.publication_number_map_dir)
+    return _map
+
+
+def resolve_publication_number(doc_number: str, kind: str | None = None) -> str | None:
+    """
+    XMLの doc_number（と種別コード）から、BigQueryの publication_number を求める（見つからなければNone）。
+    ローカルの対応表を優先し、なければ候補の公開番号をBigQueryで完全一致照合する。
+    """
+    candidates = candidate_publication_numbers(doc_number, kind)
+    if not candidates:
+        return None
+
+    number_map = _get_map()
+    if number_map is not None:
+        found = {
+            publication_number
+            for candidate in candidates
+            for key in lookup_keys(candidate)
+            for publication_number in number_map.lookup(key)
+        }
+    else:
+        from bigquery.client import query_parameters, run_query
+
+        query = f"""
+        SELECT publication_number
+        FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
+        WHERE publication_number IN UNNEST(@candidates)
+        """
+        rows = run_query(query, query_parameters(candidates=candidates), project=PROJECT_ID).result()
+        found = {row.publication_number for row in rows}
+
+    # 候補の優先順（指定された種別コードが先頭）で最初に見つかったものを返す
+    for candidate in candidates:
+        if candidate in found:
+            return candidate
+    return None
+
+
+def _iter_bigquery_publication_numbers(page_size: int = 100000) -> Iterable[str]:
+    from bigquery.client import run_query
+
+    query = f"SELECT publication_number FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`"
+    for row in run_query(query, project=PROJECT_ID).result(page_size=page_size):
+        yield row.publication_number
+
+
+if __name__ == "__main__":
+    from bigquery.local_embedding_store import LocalEmbeddingStore
+
+    if LocalEmbeddingStore.exists(cfg.local_embedding_dir):
+        store = LocalEmbeddingStore(cfg.local_embedding_dir)
+        publication_numbers = (value.decode() for value in store.publication_numbers)
+    else:
+        publication_numbers = _iter_bigquery_publication_numbers()
+    PublicationNumberMap.build(cfg.publication_number_map_dir, publication_numbers)
@@ -1,22 +1,25 @@
+"""
+top-k の検索結果から、ローカルの特許XMLコーパスに存在する文献（table_name）を求めるモジュール
+
+実行方法（srcディレクトリで、元の実装・行ごとの実装との速度比較・出力一致の確認。top_k=10,000）:
+    uv run python -m bigquery.search_path_from_file
+"""
+
 import pandas as pd
 from pathlib import Path
 import re
 import numpy as np
 
 from infra.config import PROJECT_ROOT
+from infra.index.path_index import TYPE_MAPPING, PathIndex, get_path_index, type_codes
+from model.patent_number import parse_publication_number, parse_publication_numbers, publication_key
 
 PATH_DATA_DIR = PROJECT_ROOT / 'data' / 'path'
 NUM_PATH = PATH_DATA_DIR / "patent_path_numpy.npy"
 
-# NUM_PATH存在確認、なければメッセージを表示して終了
-# NUM_PATH_ARRAYの変数に、NUM_PATHを読み込んだ結果を格納
-if not NUM_PATH.exists():
-    raise FileNotFoundError(f"Required file not found: {NUM_PATH}")
-
-NUM_PATH_ARRAY = np.load(NUM_PATH)
+# パスインデックスは import 時には読み込まず、最初の search_path の呼び出しで開く（get_path_index）
 
-# document_typeを整数に変換するマッピング（numpy_file.pyと同じ）
-TYPE_MAPPING = {'A': 0, '1': 1, 'B': 2, 'U': 3}
+# document_typeを整数に変換するマッピング（TYPE_MAPPING）は infra/index/path_index.py と共通
 # 整数からdocument_typeへの逆マッピング
 TYPE_REVERSE_MAPPING = {0: 'A', 1: '1', 2: 'B', 3: 'U'}
 
@@ -29,7 +32,96 @@ TYPE_REVERSE_MAPPING = {0: 'A', 1: '1', 2: 'B', 3: 'U'}
 #     if not path_file.exists():
 #         raise FileNotFoundError(f"Required file not found: {path_file}")
 
-def search_path(top_k_df: pd.DataFrame, top_k=None) -> pd.DataFrame:
+def search_path(top_k_df: pd.DataFrame, top_k=None, path_index: PathIndex | None = None) -> pd.DataFrame:
+    """
+    top-k の検索結果（publication_number 列）から、ローカルのパスインデックスに存在する文献を上位 top_k 件まで選び、
+    table_name（result_X の X）, name（ハイフンなしの公開番号）, number（doc_number）列を付けて返す。
+    パスインデックスにパスが保存されていれば、path 列（data/result_X/{チャンク}/{doc_id}/text.txt）も付ける。
+
+    公開特許（A）・再公表（A1）・登録特許（B）・実用新案（U）が対象。number は model/patent_number.py の主キー
+    （WO・和暦の番号は西暦4桁 + 0埋め6桁、例: 'JP-H084831-A' → '1996004831'）。
+    行ごとのループは使わず、公開番号の解析（Series.str.extract）、種別の整数化（カテゴリ型）、
+    パスインデックスの照合（np.searchsorted 1回）、列の代入をすべて一括で行う。
+    """
+    path_index = get_path_index() if path_index is None else path_index
+    if top_k is None:
+        top_k = len(top_k_df)
+
+    # publication_number 'JP-6343124-B2' を番号の主キーと種別コードに分ける
+    names = top_k_df['publication_number'].astype(str).str.replace('-', '', regex=False)
+    parsed = parse_publication_numbers(top_k_df['publication_number'])
+    # -1: 対象外（Y など）、0:A、1:1、2:B、3:U
+    codes = type_codes(parsed['document_type'])
+
+    # 全種別をまとめて、パスインデックスを1回の二分探索で引く
+    index_rows = np.full(len(top_k_df), -1, dtype=np.int64)
+    candidates = (codes >= 0) & parsed['key'].notna().to_numpy()
+    if candidates.any():
+        int_numbers = parsed.loc[candidates, 'key'].astype(np.int64).to_numpy()
+        index_rows[candidates] = path_index.lookup(int_numbers, codes[candidates])
+
+    # 見つかった文献のうち、上から top_k 件だけを残す
+    found = index_rows >= 0
+    found &= np.cumsum(found) <= top_k
+
+    top_k_df['table_name'] = None
+    top_k_df['name'] = None
+    top_k_df.loc[found, 'table_name'] = path_index.table_names[index_rows[found]].astype(str).astype(object)
+    top_k_df.loc[found, 'name'] = names[found]
+    top_k_df.loc[found, 'number'] = parsed.loc[found, 'key'].astype(str)
+    if path_index.has_paths:
+        top_k_df.loc[found, 'path'] = path_index.text_paths(index_rows[found])
+
+    # top_k_dfから、table_nameがNoneでない行だけを抽出して返す
+    return top_k_df[found].reset_index(drop=True)
+
+
+def _search_path_rowwise(top_k_df: pd.DataFrame, top_k=None, path_index: PathIndex | None = None) -> pd.DataFrame:
+    """
+    search_path の行ごとの実装（iterrows + 1件ずつの正規化 + 1セルずつの代入）。ベンチマークの比較用。
+    """
+    path_index = get_path_index() if path_index is None else path_index
+    top_k_df['table_name'] = None
+    top_k_df['name'] = None
+
+    if top_k is None:
+        top_k = len(top_k_df)
+
+    parsed_rows = []
+    for idx, row in top_k_df.iterrows():
+        key = publication_key(row['publication_number'])
+        if key is None:
+            continue
+        document_type = parse_publication_number(row['publication_number']).document_type
+        if document_type not in TYPE_MAPPING:
+            continue
+        parsed_rows.append((idx, row['publication_number'].replace('-', ''), key, TYPE_MAPPING[document_type]))
+
+    if parsed_rows:
+        int_numbers = np.array([int(parsed[2]) for parsed in parsed_rows], dtype=np.int64)
+        index_rows = path_index.lookup(int_numbers, np.array([parsed[3] for parsed in parsed_rows]))
+        top_k_counter = 0
+        for (idx, publication_number, publication_number_str, _), index_row in zip(parsed_rows, index_rows):
+            if top_k_counter >= top_k:
+                break
+            if index_row < 0:
+                continue
+            top_k_df.loc[idx, 'table_name'] = str(path_index.table_names[index_row])
+            top_k_df.loc[idx, 'name'] = publication_number
+            top_k_df.loc[idx, 'number'] = publication_number_str
+            if path_index.has_paths:
+                top_k_df.loc[idx, 'path'] = str(path_index.text_path(index_row))
+            top_k_counter += 1
+
+    return top_k_df[top_k_df['table_name'].notna()].reset_index(drop=True)
+
+
+def _search_path_original(top_k_df: pd.DataFrame, num_path_array: np.ndarray, top_k=None) -> pd.DataFrame:
+    """
+    ベースライン（パスインデックス導入前）の search_path をそのまま写したもの。ベンチマークの比較用。
+    グローバルの NUM_PATH_ARRAY（[doc_number, table_name, type] の配列）を引数 num_path_array で受け取る点だけが異なる。
+    公開特許（A）しか対象にせず、番号は先頭の数字列をそのまま使うため、比較は西暦の番号のAに限る。
+    """
     # top_k_dfにpathカラムを追加、NaNで初期化
     top_k_df['table_name'] = None
     top_k_df['name'] = None
@@ -82,8 +174,8 @@ def search_path(top_k_df: pd.DataFrame, top_k=None) -> pd.DataFrame:
 
         # NUM_PATH_ARRAYから検索
         # 配列の列構造: [doc_number (0), table_name (1), type (2)]
-        mask = (NUM_PATH_ARRAY[:, 0] == int_publication_number) & (NUM_PATH_ARRAY[:, 2] == document_type_int)
-        matched_rows = NUM_PATH_ARRAY[mask]
+        mask = (num_path_array[:, 0] == int_publication_number) & (num_path_array[:, 2] == document_type_int)
+        matched_rows = num_path_array[mask]
 
         # マッチする行が見つからなければスキップ
         if len(matched_rows) == 0:
@@ -99,4 +191,121 @@ def search_path(top_k_df: pd.DataFrame, top_k=None) -> pd.DataFrame:
     # top_k_dfから、table_nameがNoneでない行だけを抽出して返す
     top_k_df = top_k_df[top_k_df['table_name'].notna()].reset_index(drop=True)
 
-    return top_k_df
\ No newline at end of file
+    return top_k_df
+
+
+def _synthetic_top_k(n_rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    VECTOR_SEARCH の結果と同じ形の、ランダムな公開番号の top-k を作る（A/B/U などが混在）。
+    """
+    kinds = rng.choice(["A", "B2", "B1", "U", "Y2", "A1"], size=n_rows, p=[0.55, 0.25, 0.05, 0.05, 0.05, 0.05])
+    numbers = np.where(
+        np.char.startswith(kinds.astype(str), "A"),
+        rng.integers(2010, 2024, size=n_rows) * 10**6 + rng.integers(0, 10**6, size=n_rows),
+        rng.integers(5_000_000, 7_500_000, size=n_rows),
+    ).astype(str)
+    # 再公表は WO 番号、一部の公開特許は和暦の番号にする
+    numbers = np.where(kinds == "A1", np.char.add("WO", numbers), numbers)
+    heisei = (kinds == "A") & (rng.random(n_rows) < 0.1)
+    numbers[heisei] = [f"H{rng.integers(1, 12):02d}{rng.integers(1, 10**6)}" for _ in range(int(heisei.sum()))]
+    distances = np.sort(rng.random(n_rows))
+    return pd.DataFrame({
+        "publication_number": [f"JP-{number}-{kind}" for number, kind in zip(numbers, kinds)],
+        "cosine_distance": distances,
+        "cosine_similarity": 1 - distances,
+    })
+
+
+def run_benchmark(
+    n_rows: int = 10000, corpus_size: int = 2_000_000, top_k: int = 10000, n_original: int = 300, seed: int = 0
+) -> dict:
+    """
+    行ごとの実装と一括処理の実装の速度を比較し、出力が一致することを確認する。
+    パスインデックスは top-k の公開番号の約8割を含む合成データ（corpus_size 件）で作る。
+    既存の topk CSV（eval/**/topk/*.csv）についても、同じ合成インデックスで出力が一致することを確認する。
+    元の実装（_search_path_original）とは、西暦の番号の公開特許（A）だけを入力ごとに先頭 n_original 行ずつ取って出力を比べる
+    （元の実装は1行ごとに全件を走査するため、全行では時間がかかりすぎる）。
+    比較した結果が空の場合は、何も確認できていないため失敗とする。
+    """
+    import tempfile
+    import time
+
+    from infra.config import PathManager
+
+    rng = np.random.default_rng(seed)
+    top_k_df = _synthetic_top_k(n_rows, rng)
+    csv_dfs = [pd.read_csv(path) for path in sorted(PathManager.EVAL_DIR.glob("**/topk/*.csv"))]
+
+    # 合成インデックス: top-k（と既存CSV）のうち対象種別の文献の約8割 + ランダムな文献
+    publication_numbers = pd.concat([top_k_df["publication_number"]] + [df["publication_number"] for df in csv_dfs], ignore_index=True)
+    parsed = parse_publication_numbers(publication_numbers)
+    parsed["type"] = type_codes(parsed["document_type"])
+    parsed = parsed[parsed["type"] >= 0].sample(frac=0.8, random_state=seed)
+    n_random = max(corpus_size - len(parsed), 0)
+    doc_numbers = np.concatenate([parsed["key"].astype(np.int64).to_numpy(), rng.integers(2010 * 10**6, 2024 * 10**6, size=n_random)])
+    types = np.concatenate([parsed["type"].to_numpy(dtype=np.int64), rng.integers(0, 4, size=n_random)])
+    suffixes = np.array(list(TYPE_MAPPING))[types]
+    path_array = pd.DataFrame({
+        "doc_number": doc_numbers,
+        "table_name": rng.integers(1, 20, size=len(doc_numbers)),
+        "type": types,
+        "chunk_dir": rng.integers(0, 40, size=len(doc_numbers)),
+        "doc_id": np.char.add(np.char.add("JP", doc_numbers.astype(str)), suffixes),
+    })
+
+    num_path_array = path_array[["doc_number", "table_name", "type"]].to_numpy(dtype=np.int64)
+    # 合成の top-k と既存CSVのそれぞれから、西暦の番号の公開特許（A）の先頭 n_original 行を取る
+    a_only_df = pd.concat(
+        [df[df["publication_number"].str.fullmatch(r"JP-\d+-A")].head(n_original) for df in [top_k_df] + csv_dfs],
+        ignore_index=True,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_index = PathIndex.build(Path(tmp_dir) / "index", path_array)
+
+        for df in csv_dfs:
+            expected = _search_path_rowwise(df.copy(), path_index=path_index)
+            actual = search_path(df.copy(), path_index=path_index)
+            _assert_same_result(actual, expected)
+
+        start = time.perf_counter()
+        original = _search_path_original(a_only_df.copy(), num_path_array)
+        original_s = time.perf_counter() - start
+        _assert_same_result(search_path(a_only_df.copy(), path_index=path_index).drop(columns="path"), original, check_dtype=False)
+
+        start = time.perf_counter()
+        expected = _search_path_rowwise(top_k_df.copy(), top_k=top_k, path_index=path_index)
+        rowwise_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = search_path(top_k_df.copy(), top_k=top_k, path_index=path_index)
+        vectorized_s = time.perf_counter() - start
+
+    _assert_same_result(actual, expected)
+    result = {
+        "rows": n_rows,
+        "top_k": top_k,
+        "found": len(actual),
+        "checked_csvs": len(csv_dfs),
+        "original_rows": len(a_only_df),
+        "original_found": len(original),
+        "original_ms_per_row": original_s * 1000 / max(len(a_only_df), 1),
+        "rowwise_ms": rowwise_s * 1000,
+        "vectorized_ms": vectorized_s * 1000,
+        "speedup": rowwise_s / max(vectorized_s, 1e-9),
+    }
+    print(result)
+    return result
+
+
+def _assert_same_result(actual: pd.DataFrame, expected: pd.DataFrame, **kwargs) -> None:
+    """
+    2つの実装の出力が一致することを確認する。空の出力どうしは一致とみなさない（比較できていないため）。
+    """
+    if expected.empty:
+        raise AssertionError("比較対象の出力が空です（パスインデックスに一致する文献がありません）")
+    pd.testing.assert_frame_equal(actual, expected, **kwargs)
+
+
+if __name__ == "__main__":
+    run_benchmark()
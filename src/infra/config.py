@@ -83,6 +83,7 @@ class PathManager:
     TEMP_DIR = EVAL_DIR / "temp"              # 一時ファイル（evalの下）
     DATA_STORE_DIR = PROJECT_ROOT / "data_store"  # ベクトルストア（後方互換性）
     KNOWLEDGE_DIR = EVAL_DIR / DirNames.KNOWLEDGE  # ナレッジディレクトリ（知識ベース）
+    RAW_DATA_DIR = PROJECT_ROOT / "data"  # 特許XMLコーパス（data/result_X/{チャンク}/{doc_id}/text.txt）
 
     @classmethod
     def setup(cls) -> None:
@@ -289,9 +290,71 @@ class Config:
     chunk_overlap = 100
     top_n = 3
 
+    # 検索モード: "dense"（ベクトル検索のみ） or "hybrid"（BM25 + ベクトル検索）
+    retrieval_mode = "dense"
+    hybrid_alpha = 0.5  # ハイブリッド検索でのベクトルスコアの重み（1 - alpha がBM25の重み）
+    hybrid_fetch_k = 50  # ハイブリッド検索で各検索器から取得する候補数
+    ngram_n = 2  # 日本語の文字n-gramのn
+
+    # クエリ埋め込みのキャッシュ（プロセス内LRUの件数、永続キャッシュのSQLiteファイル。Noneなら永続化しない）
+    query_embedding_cache_size = 1024
+    query_embedding_cache_path = str(PathManager.DATA_STORE_DIR / DirNames.CACHE / "query_embeddings.sqlite3")
+
+    # 再ランキング: None（なし）, "lexical"（n-gram重なり）, "cross_encoder"（ローカルモデル）
+    rerank_type = None
+    rerank_fetch_k = 100  # 再ランキング前に1段階目の検索で取得する候補数
+    rerank_batch_size = 32
+    cross_encoder_model_name = "hotchpotch/japanese-reranker-cross-encoder-small-v1"
+
+    # ベクトル圧縮（1段階目の検索をChromaではなく圧縮インデックスで行う）
+    compression_reduction = None  # None, "pca", "matryoshka"
+    compression_dim = 256  # 次元削減後の次元数
+    compression_quantization = None  # None, "int8", "pq"
+    compression_pq_m = 32  # 直積量子化の部分空間数（1ベクトルあたりのバイト数）
+    compression_rescore_k = 100  # Chromaのfloat32ベクトルで再スコアリングする候補数（0なら再スコアリングしない）
+
     # Chroma - プロジェクトルートからの絶対パスを使用
     persist_dir = str(PathManager.DATA_STORE_DIR / "chroma" / "gemini_v0.2")
     # persist_dir = str(PathManager.DATA_STORE_DIR / "chroma" / "openai_v1.0")
+    # シャード分割: None（分割なし）, "table"（result_X単位）, "year"（公開年単位）
+    # 分割時は persist_dir 配下に "table=1/" のようなシャードごとのChromaを作る
+    shard_by = None
+    shard_workers = 8  # シャードの並列検索・並列構築のスレッド数
+    # BM25用の文字n-gram転置インデックス（Chromaと同じバージョン名で管理）
+    lexical_index_dir = str(PathManager.DATA_STORE_DIR / "lexical" / "gemini_v0.2")
+    # 圧縮ベクトルインデックス（Chromaと同じバージョン名で管理）
+    compressed_index_dir = str(PathManager.DATA_STORE_DIR / "compressed" / "gemini_v0.2")
+
+    # 類似特許検索（embedding_v1）: "bigquery"（VECTOR_SEARCH） or "local"（ローカルのmemmap複製）
+    vector_search_backend = "bigquery"
+    local_embedding_dir = str(PathManager.DATA_STORE_DIR / "embedding_v1")
+    local_embedding_dtype = "float16"  # "float32" or "float16"（64次元 × 2バイト）
+    # 先行技術の要約・請求項のローカル文書ストア（infra/doc_store.py。なければBigQueryから取得）
+    doc_store_path = str(PathManager.DATA_STORE_DIR / "doc_store" / "abstract_claims.sqlite3")
+    # doc_number → 公開番号（publication_number）の対応表（bigquery/publication_number_map.py）
+    publication_number_map_dir = str(PathManager.DATA_STORE_DIR / "publication_number_map")
+    # 特許XMLコーパスのパスインデックス（infra/index/path_index.py。(type, doc_number) でソート済み）
+    path_index_dir = str(PathManager.RAW_DATA_DIR / "path" / "index")
+    # パスインデックスを作るコーパスのルート（result_X/{チャンク}/{doc_id}/ がある場所、例: "/mnt/eightthdd/raw_data"）。
+    # 設定した場合だけコーパスを走査して作成・差分更新する（infra/index/path_indexer.py）。None ならパス一覧のCSV・npyから作る
+    path_corpus_dir = None
+    # パスインデックスの公開先（例: "/dev/shm/patent_rag/path_index"）。設定するとすべてのプロセスがここを mmap で共有する
+    path_index_shared_dir = None
+    local_search_block_size = 16384  # ブロック分割top-k検索の1ブロックの行数
+    local_search_threads = 4  # ブロックを並列処理するスレッド数（1なら逐次）
+    # ローカル検索の方式: "exact"（ブロック分割の厳密top-k） or "ivf"（IVF近似最近傍）
+    local_search_method = "exact"
+    local_ivf_dir = str(PathManager.DATA_STORE_DIR / "embedding_v1_ivf")
+    local_ivf_nlist = 1024  # k-meansのクラスタ数
+    local_ivf_nprobe = 16  # 検索時に調べるクラスタ数（大きいほど高recall・低速）
+    topk_result_cache_size = 128  # 類似特許検索結果のプロセス内キャッシュの件数（永続層は eval/{doc}/topk/*.csv）
+
+    # BigQueryクライアント（bigquery/client.py）
+    bigquery_pool_size = 32  # HTTPコネクションプールの大きさ（並列クエリ数の上限の目安）
+    bigquery_use_query_cache = True  # BigQueryの結果キャッシュを使う（同じクエリ・パラメータは課金されない）
+    bigquery_page_size = 1000  # 非同期検索で結果をページごとに取得するときの1ページの行数
+    bigquery_table_modified_ttl = 300  # 検索対象テーブルの更新日時（検索結果キャッシュのキー）を取り直す間隔（秒）
+    search_poll_interval = 0.5  # GUIが非同期検索ジョブの状態を確認する間隔（秒）
 
     # LLM
     llm_type = "gemini"  # "openai" or "gemini"
@@ -0,0 +1,160 @@
+"""
+要約・請求項のローカル文書ストアモジュール
+
+AI審査のたびに BigQuery（dataset03.result_*）から先行技術の要約・請求項を取得する代わりに、
+ローカルの特許XMLコーパス（data/result_X/.../text.txt）を CommonLoader で一度だけ読み込み、
+SQLiteに (テーブル番号, doc_number) → (要約, 請求項, パス) として保存しておきます。
+doc_number は search_path の number 列と同じ主キー（model.patent_number.publication_key）で、
+コーパスの doc_id（例: "JPWO2018134950A1" → "2018134950"）から求めます。
+llm_data_loader はまずこのストアを引き、見つからなかった文献だけを BigQuery から取得します。
+
+実行方法（srcディレクトリで、ストアの構築。既に登録済みのパスはスキップ）:
+    uv run python -m infra.doc_store
+"""
+
+import json
+import re
+import sqlite3
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+from infra.config import PathManager, cfg
+from model.patent_number import publication_key
+
+_TABLE_PATTERN = re.compile(r"result_(\d+)")
+
+# documents テーブルの形式・キーの決め方を変えたら上げる（古いストアは作り直す）
+_SCHEMA_VERSION = 1
+
+_loader = None  # ワーカープロセスごとの CommonLoader
+
+
+def _load_record(path: str) -> tuple | None:
+    """
+    text.txt を読み込み、ストアに保存する1行を返す（読み込めなければNone）。
+    ProcessPoolExecutor のワーカーで実行する。
+    """
+    global _loader
+    if _loader is None:
+        from infra.loader.common_loader import CommonLoader
+
+        _loader = CommonLoader()
+
+    match = _TABLE_PATTERN.search(Path(path).as_posix())
+    if not match:
+        return None
+    # XMLの doc_number（WO/A1 では "WO2018134950"）ではなく、検索結果と同じ主キーで登録する
+    doc_number = publication_key(Path(path).parent.name)
+    if doc_number is None:
+        return None
+    try:
+        patent = _loader.run(path)
+    except Exception as e:
+        print(f"読み込みに失敗したためスキップします: {path} ({e})")
+        return None
+    return (
+        match.group(1),
+        doc_number,
+        patent.abstract or "",
+        json.dumps(patent.claims or [], ensure_ascii=False),
+        path,
+    )
+
+
+class DocStore:
+    """
+    (テーブル番号, doc_number) → 要約・請求項・パス のSQLiteストアです。
+    """
+
+    def __init__(self, db_path: str | Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                # 旧形式（XMLの doc_number をそのままキーにしていた）ストアは作り直す
+                conn.execute("DROP TABLE IF EXISTS documents")
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " table_name TEXT NOT NULL, doc_number TEXT NOT NULL,"
+                " abstract TEXT NOT NULL, claims TEXT NOT NULL, path TEXT NOT NULL,"
+                " PRIMARY KEY (table_name, doc_number))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_path ON documents (path)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def build(self, data_dir: str | Path, max_workers: int | None = None, batch_size: int = 1000) -> int:
+        """
+        data_dir 配下の result_X/**/text.txt をすべて読み込んで登録し、追加した件数を返す。
+        既に登録済みのパスは読み込まない（コーパスの追加分だけを取り込める）。
+        """
+        with closing(self._connect()) as conn:
+            known_paths = {row[0] for row in conn.execute("SELECT path FROM documents")}
+        paths = [
+            str(path)
+            for table_dir in sorted(Path(data_dir).glob("result_*"))
+            for path in table_dir.rglob("text.txt")
+            if str(path) not in known_paths
+        ]
+        print(f"文書ストアの構築: {len(paths)}件を読み込みます（登録済み: {len(known_paths)}件）")
+
+        added = 0
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            batch: list[tuple] = []
+            for record in executor.map(_load_record, paths, chunksize=256):
+                if record is not None:
+                    batch.append(record)
+                if len(batch) >= batch_size:
+                    added += self._insert(batch)
+                    batch = []
+                    print(f"  {added}件")
+            added += self._insert(batch)
+        print(f"文書ストアの構築完了: {added}件を追加しました（{self.db_path}）")
+        return added
+
+    def _insert(self, records: list[tuple]) -> int:
+        if not records:
+            return 0
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (table_name, doc_number, abstract, claims, path) VALUES (?, ?, ?, ?, ?)",
+                records,
+            )
+        return len(records)
+
+    def get_many(self, keys: Iterable[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+        """
+        (テーブル番号, doc_number) の組をまとめて引き、見つかったものを
+        {(テーブル番号, doc_number): {"doc_number", "abstract", "claims", "path", "table_name"}} で返す。
+        """
+        keys = list(dict.fromkeys((str(table_name), str(doc_number)) for table_name, doc_number in keys))
+        found: dict[tuple[str, str], dict] = {}
+        with closing(self._connect()) as conn:
+            # SQLiteのパラメータ数の上限を超えないよう、分割して引く
+            for start in range(0, len(keys), 400):
+                chunk = keys[start : start + 400]
+                condition = " OR ".join(["(table_name = ? AND doc_number = ?)"] * len(chunk))
+                params = [value for key in chunk for value in key]
+                for table_name, doc_number, abstract, claims, path in conn.execute(
+                    f"SELECT table_name, doc_number, abstract, claims, path FROM documents WHERE {condition}", params
+                ):
+                    found[(table_name, doc_number)] = {
+                        "doc_number": doc_number,
+                        "abstract": abstract,
+                        "claims": json.loads(claims),
+                        "path": path,
+                        "table_name": table_name,
+                    }
+        return found
+
+
+if __name__ == "__main__":
+    DocStore(cfg.doc_store_path).build(PathManager.RAW_DATA_DIR)
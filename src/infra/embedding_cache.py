@@ -0,0 +1,117 @@
+"""
+クエリ埋め込みのキャッシュモジュール
+
+同じクエリ（GUIの「検索をやり直す」、評価の再実行など）で、埋め込みAPIを呼び直さないようにします。
+
+- 1段目: プロセス内のLRUキャッシュ（全Retrieverインスタンスで共有）
+- 2段目: SQLiteによる永続キャッシュ（任意。プロセス再起動後も有効）
+
+キーは (埋め込みモデル名, 正規化したクエリ文字列) です。
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings.embeddings import Embeddings
+
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    キャッシュキー用に、NFKC正規化と空白の統一（連続空白を1つに、前後の空白を除去）を行う。
+    """
+    return _SPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    embed_query の結果をキャッシュする Embeddings のラッパーです。
+    embed_documents（ナレッジのベクトル化）はキャッシュせずにそのまま委譲します。
+    """
+
+    # プロセス内LRU（Streamlitのセッションごとに作られるRetrieverでも共有する）
+    _memory_cache: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+    _memory_lock = threading.Lock()
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = 1024, persist_path: str | Path | None = None):
+        """
+        Args:
+            embeddings: 実際に埋め込みを計算するモデル
+            model_name: キャッシュキーに含めるモデル名
+            max_size: プロセス内LRUの最大件数
+            persist_path: 永続キャッシュのSQLiteファイル（Noneなら永続化しない）
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.persist_path = Path(persist_path) if persist_path else None
+        self._db_lock = threading.Lock()
+        if self.persist_path:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    " model TEXT NOT NULL, query_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+                    " PRIMARY KEY (model, query_hash))"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.persist_path, timeout=30)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = (self.model_name, normalize_query(text))
+
+        # 1段目: プロセス内LRU
+        with self._memory_lock:
+            vector = self._memory_cache.get(key)
+            if vector is not None:
+                self._memory_cache.move_to_end(key)
+                return list(vector)
+
+        # 2段目: 永続キャッシュ
+        vector = self._load_persistent(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._save_persistent(key, vector)
+
+        with self._memory_lock:
+            self._memory_cache[key] = list(vector)
+            while len(self._memory_cache) > self.max_size:
+                self._memory_cache.popitem(last=False)
+        return list(vector)
+
+    def _query_hash(self, key: tuple[str, str]) -> str:
+        return hashlib.sha256(key[1].encode("utf-8")).hexdigest()
+
+    def _load_persistent(self, key: tuple[str, str]) -> list[float] | None:
+        if not self.persist_path:
+            return None
+        with self._db_lock, closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND query_hash = ?",
+                (key[0], self._query_hash(key)),
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _save_persistent(self, key: tuple[str, str], vector: list[float]) -> None:
+        if not self.persist_path:
+            return
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._db_lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query_hash, vector) VALUES (?, ?, ?)",
+                (key[0], self._query_hash(key), blob),
+            )
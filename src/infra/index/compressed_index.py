@@ -0,0 +1,364 @@
+"""
+圧縮ベクトルインデックスモジュール
+
+Chromaに格納されたチャンクの埋め込み（float32）を、次元削減と量子化で圧縮した検索用インデックスです。
+1段階目の検索をこの圧縮インデックスで行い、必要に応じてChromaのfloat32ベクトルで上位候補を再スコアリングします。
+
+次元削減:
+    - "pca":        主成分分析で dim 次元に射影する
+    - "matryoshka": 先頭 dim 次元に切り詰める（text-embedding-3 などのMatryoshka表現学習済みモデル向け）
+量子化:
+    - "int8": 次元ごとのスケールによるスカラー量子化（1次元1バイト）
+    - "pq":   直積量子化（pq_m 個の部分空間ごとに256個のセントロイド、1ベクトル pq_m バイト）
+
+ディスク構成（index_dir 配下）:
+    meta.json, ids.npy, codes.npy, [pca_mean.npy, pca_components.npy], [int8_scale.npy], [pq_codebooks.npy]
+    meta.json の settings は構築時の設定。設定を変えた場合は is_built_with() が False になり、作り直す。
+
+構築（build_from_batches）は全ベクトルをメモリに載せない。学習（PCA・PQ）はサンプルだけで行い、
+符号化はバッチごとに codes.npy の memmap へ書き込む。
+"""
+
+import json
+import shutil
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+import numpy as np
+
+REDUCTIONS = (None, "pca", "matryoshka")
+QUANTIZATIONS = (None, "int8", "pq")
+PQ_CENTROIDS = 256
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    行ベクトルをL2正規化する（ゼロベクトルはそのまま）。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(data: np.ndarray, k: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd法によるk-means。セントロイド（k × 次元）を返す。
+    """
+    data = np.asarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    data_sq = np.sum(data**2, axis=1, keepdims=True)
+
+    for _ in range(n_iter):
+        # ||x - c||^2 = ||x||^2 - 2 x・c + ||c||^2
+        distances = data_sq - 2 * data @ centroids.T + np.sum(centroids**2, axis=1)
+        assign = np.argmin(distances, axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        # 空クラスタはランダムな点で置き換える
+        n_empty = int(np.sum(~non_empty))
+        if n_empty:
+            centroids[~non_empty] = data[rng.choice(len(data), size=n_empty, replace=False)]
+
+    return centroids
+
+
+def _reservoir_sample(batches: Iterable[tuple[list[str], np.ndarray]], size: int, rng: np.random.Generator) -> tuple[np.ndarray, int]:
+    """
+    バッチ列から一様に size 件をサンプリングし（リザーバサンプリング）、(サンプル, 全件数) を返す。
+    """
+    sample: np.ndarray | None = None
+    count = 0
+    for _, block in batches:
+        block = np.asarray(block, dtype=np.float32)
+        if sample is None:
+            sample = np.empty((size, block.shape[1]), dtype=np.float32)
+        # リザーバが埋まるまではそのまま入れる
+        n_fill = max(0, min(size - count, len(block)))
+        sample[count : count + n_fill] = block[:n_fill]
+        # 以降の t 件目（0始まり）は確率 size / (t + 1) でリザーバのランダムな位置と入れ替える
+        seen = count + np.arange(n_fill, len(block))
+        slots = (rng.random(len(seen)) * (seen + 1)).astype(np.int64)
+        replace = slots < size
+        # 同じ位置への代入は後のものが残る（逐次のアルゴリズムと同じ）
+        sample[slots[replace]] = block[n_fill:][replace]
+        count += len(block)
+    if sample is None:
+        return np.zeros((0, 0), dtype=np.float32), 0
+    return sample[: min(size, count)], count
+
+
+def _reduce(vectors: np.ndarray, reduction: str | None, dim: int, params: dict[str, np.ndarray]) -> np.ndarray:
+    """正規化済みのベクトルを次元削減し、再正規化する"""
+    if reduction == "pca":
+        return normalize_rows((vectors - params["pca_mean"]) @ params["pca_components"].T)
+    if reduction == "matryoshka":
+        return normalize_rows(vectors[:, :dim])
+    return vectors
+
+
+def _encode(reduced: np.ndarray, quantization: str | None, params: dict[str, np.ndarray]) -> np.ndarray:
+    """次元削減後のベクトルを量子化する"""
+    if quantization == "int8":
+        return np.clip(np.rint(reduced / params["int8_scale"]), -127, 127).astype(np.int8)
+    if quantization == "pq":
+        codebooks = params["pq_codebooks"]
+        pq_m, _, dsub = codebooks.shape
+        codes = np.empty((len(reduced), pq_m), dtype=np.uint8)
+        for j in range(pq_m):
+            sub = reduced[:, j * dsub : (j + 1) * dsub]
+            distances = -2 * sub @ codebooks[j].T + np.sum(codebooks[j] ** 2, axis=1)
+            codes[:, j] = np.argmin(distances, axis=1)
+        return codes
+    return reduced.astype(np.float32)
+
+
+class CompressedVectorIndex:
+    """
+    次元削減 + 量子化したベクトルによる近似内積（コサイン類似度）検索。
+
+    使い方:
+        index = CompressedVectorIndex.build(index_dir, ids, vectors, reduction="pca", dim=256, quantization="int8")
+        hits = index.search(query_vector, k=100)  # [(id, 近似コサイン類似度), ...]
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta: dict = json.load(f)
+        self.ids = np.load(self.index_dir / "ids.npy", mmap_mode="r")
+        self.codes = np.load(self.index_dir / "codes.npy", mmap_mode="r")
+        self.pca_mean = self._load_optional("pca_mean.npy")
+        self.pca_components = self._load_optional("pca_components.npy")
+        self.int8_scale = self._load_optional("int8_scale.npy")
+        self.pq_codebooks = self._load_optional("pq_codebooks.npy")
+
+    def _load_optional(self, name: str) -> np.ndarray | None:
+        path = self.index_dir / name
+        return np.load(path) if path.exists() else None
+
+    @staticmethod
+    def exists(index_dir: str | Path) -> bool:
+        return (Path(index_dir) / "meta.json").exists()
+
+    # --------------------------------------------------------------------------
+    # 構築
+    # --------------------------------------------------------------------------
+
+    @staticmethod
+    def settings(
+        reduction: str | None = None,
+        dim: int | None = None,
+        quantization: str | None = "int8",
+        pq_m: int = 16,
+    ) -> dict:
+        """
+        構築時の設定を、meta.json に保存して比較する形にそろえる（使われない値は None にする）。
+        """
+        return {
+            "reduction": reduction,
+            "dim": dim if reduction else None,
+            "quantization": quantization,
+            "pq_m": pq_m if quantization == "pq" else None,
+        }
+
+    @classmethod
+    def is_built_with(cls, index_dir: str | Path, **settings) -> bool:
+        """
+        既存のインデックスが、指定した設定（build と同じ引数）で構築されたものかどうかを返す。
+        """
+        if not cls.exists(index_dir):
+            return False
+        with open(Path(index_dir) / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta.get("settings") == cls.settings(**settings)
+
+    @classmethod
+    def build(
+        cls,
+        index_dir: str | Path,
+        ids: list[str],
+        vectors: np.ndarray,
+        reduction: str | None = None,
+        dim: int | None = None,
+        quantization: str | None = "int8",
+        pq_m: int = 16,
+        sample_size: int = 100000,
+        seed: int = 0,
+        block_size: int = 65536,
+    ) -> "CompressedVectorIndex":
+        """
+        メモリ上の float32 ベクトルから圧縮インデックスを構築して保存する（build_from_batches のラッパー）。
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        def batches():
+            for start in range(0, len(vectors), block_size):
+                yield ids[start : start + block_size], vectors[start : start + block_size]
+
+        return cls.build_from_batches(index_dir, batches, reduction, dim, quantization, pq_m, sample_size, seed)
+
+    @classmethod
+    def build_from_batches(
+        cls,
+        index_dir: str | Path,
+        batches: Callable[[], Iterable[tuple[list[str], np.ndarray]]],
+        reduction: str | None = None,
+        dim: int | None = None,
+        quantization: str | None = "int8",
+        pq_m: int = 16,
+        sample_size: int = 100000,
+        seed: int = 0,
+    ) -> "CompressedVectorIndex":
+        """
+        (ids, float32ベクトル) のバッチ列から圧縮インデックスを構築して保存する。
+
+        全ベクトルをメモリに載せないよう、バッチ列を2回読む（batches は呼ぶたびに先頭から読み直す関数）。
+            1回目: 件数を数えながら、リザーバサンプリングで学習用のサンプル（sample_size 件）を集め、
+                   PCA・int8のスケール・PQのコードブックをサンプルだけで学習する
+            2回目: バッチごとに符号化し、codes.npy（memmap）に直接書き込む
+        """
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"未定義の次元削減です: {reduction}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"未定義の量子化です: {quantization}")
+
+        settings = cls.settings(reduction, dim, quantization, pq_m)
+        rng = np.random.default_rng(seed)
+        sample, count = _reservoir_sample(batches(), sample_size, rng)
+        if count == 0:
+            raise ValueError("圧縮インデックスに登録するベクトルがありません。")
+        sample = normalize_rows(sample)
+        params: dict[str, np.ndarray] = {}
+
+        # 1. 次元削減（削減後に再正規化し、内積＝コサイン類似度として扱う）
+        dim = dim or sample.shape[1]
+        if reduction == "pca":
+            mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            params["pca_mean"] = mean.astype(np.float32)
+            params["pca_components"] = vt[:dim].astype(np.float32)
+        elif reduction != "matryoshka":
+            dim = sample.shape[1]
+        sample = _reduce(sample, reduction, dim, params)
+        dim = sample.shape[1]
+
+        # 2. 量子化のパラメータ
+        if quantization == "int8":
+            params["int8_scale"] = (np.maximum(np.abs(sample).max(axis=0), 1e-6) / 127.0).astype(np.float32)
+            code_dtype, code_width = np.int8, dim
+        elif quantization == "pq":
+            if dim % pq_m != 0:
+                raise ValueError(f"次元数 {dim} が pq_m={pq_m} で割り切れません。")
+            dsub = dim // pq_m
+            params["pq_codebooks"] = np.stack(
+                [kmeans(sample[:, j * dsub : (j + 1) * dsub], PQ_CENTROIDS, seed=seed + j) for j in range(pq_m)]
+            ).astype(np.float32)
+            code_dtype, code_width = np.uint8, pq_m
+        else:
+            code_dtype, code_width = np.float32, dim
+
+        index_dir = Path(index_dir)
+        tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        # 3. バッチごとに符号化して memmap に書く
+        codes = np.lib.format.open_memmap(tmp_dir / "codes.npy", mode="w+", dtype=code_dtype, shape=(count, code_width))
+        ids: list[str] = []
+        for block_ids, block in batches():
+            block = np.asarray(block, dtype=np.float32)
+            if len(ids) + len(block) > count:
+                raise ValueError("2回目の読み込みでベクトルの件数が増えました。構築し直してください。")
+            codes[len(ids) : len(ids) + len(block)] = _encode(_reduce(normalize_rows(block), reduction, dim, params), quantization, params)
+            ids.extend(block_ids)
+        if len(ids) != count:
+            raise ValueError("2回目の読み込みでベクトルの件数が減りました。構築し直してください。")
+        codes.flush()
+        del codes
+
+        meta = {
+            "reduction": reduction,
+            "dim": dim,
+            "quantization": quantization,
+            "pq_m": pq_m if quantization == "pq" else None,
+            "n_vectors": count,
+            "settings": settings,
+        }
+        np.save(tmp_dir / "ids.npy", np.asarray(ids))
+        for name, array in params.items():
+            np.save(tmp_dir / f"{name}.npy", array)
+        with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        tmp_dir.rename(index_dir)
+
+        return cls(index_dir)
+
+    # --------------------------------------------------------------------------
+    # 検索
+    # --------------------------------------------------------------------------
+
+    def transform_query(self, query_vector: np.ndarray) -> np.ndarray:
+        """
+        クエリベクトルを、インデックスと同じ次元削減空間に射影する。
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+        if self.meta["reduction"] == "pca":
+            query = (query - self.pca_mean) @ self.pca_components.T
+        elif self.meta["reduction"] == "matryoshka":
+            query = query[: self.meta["dim"]]
+        return normalize_rows(query[None, :])[0]
+
+    def score(self, query_vector: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        """
+        全ベクトルとの近似コサイン類似度を返す（メモリを抑えるためブロック単位で計算）。
+        """
+        query = self.transform_query(query_vector)
+        quantization = self.meta["quantization"]
+        scores = np.empty(len(self.codes), dtype=np.float32)
+
+        if quantization == "pq":
+            pq_m = self.meta["pq_m"]
+            dsub = self.meta["dim"] // pq_m
+            # 非対称距離計算（ADC）: 部分空間ごとに、クエリと各セントロイドの内積表を作る
+            table = np.einsum("mkd,md->mk", self.pq_codebooks, query.reshape(pq_m, dsub))
+            for start in range(0, len(self.codes), block_size):
+                block = np.asarray(self.codes[start : start + block_size])
+                scores[start : start + len(block)] = table[np.arange(pq_m), block].sum(axis=1)
+        else:
+            weights = query * self.int8_scale if quantization == "int8" else query
+            for start in range(0, len(self.codes), block_size):
+                block = np.asarray(self.codes[start : start + block_size], dtype=np.float32)
+                scores[start : start + len(block)] = block @ weights
+
+        return scores
+
+    def search(self, query_vector: np.ndarray, k: int) -> list[tuple[str, float]]:
+        """
+        近似コサイン類似度の上位k件を (id, score) で返す。
+        """
+        scores = self.score(query_vector)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.ids[i]), float(scores[i])) for i in top]
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        検索に必要な配列のバイト数（ID文字列を除く）。
+        """
+        total = self.codes.nbytes
+        for array in (self.pca_mean, self.pca_components, self.int8_scale, self.pq_codebooks):
+            if array is not None:
+                total += array.nbytes
+        return total
@@ -0,0 +1,445 @@
+"""
+文字n-gram転置インデックス（BM25）モジュール
+
+特許文献の請求項・要約に含まれる技術用語や部品番号などの完全一致を拾うための、
+ローカルの語彙検索インデックスです。ベクトル検索（Chroma）と組み合わせてハイブリッド検索に使います。
+
+ディスク構成（index_dir 配下）:
+    manifest.json           セグメント一覧とn-gram長、全文書の文書長の合計（BM25の平均文書長に使う）
+    seg_00000/
+        terms.npy           n-gramのハッシュ値（uint64, 昇順）
+        offsets.npy         各termのポスティング開始位置（int64, len = terms + 1）
+        postings.npy        文書番号（セグメント内のローカルID, int32）
+        tfs.npy             出現回数（int32）
+        doc_len.npy         文書長（トークン数, int32）
+        keys.npy            文書キー（ChromaのドキュメントIDと同じ文字列）
+    seg_00001/ ...
+
+- 全配列は np.load(..., mmap_mode="r") で読み込むため、検索時に触れたページだけがメモリに載る。
+- 追加はセグメント単位の追記（既存セグメントは書き換えない）。compact() で1つに統合できる。
+  文書の差し替えは remove() で削除してから add() する（削除は残りの文書を1つのセグメントに書き直す）。
+  セグメント数が max_segments を超えると、add() が自動で compact() する（検索は全セグメントを走査するため）。
+- 既存コーパスからの一括構築は build() で行う。一時ディレクトリにセグメントを書いて最後に1つへ統合し、
+  manifest.json は最後に書くため、中断した構築途中のインデックスが exists() になることはない。
+"""
+
+import hashlib
+import json
+import re
+import shutil
+import unicodedata
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 英数字の連続（部品番号、型番、化学式など）はn-gramに加えて1語としても扱う
+_ALNUM_PATTERN = re.compile(r"[0-9a-z][0-9a-z\-\.]*[0-9a-z]|[0-9a-z]")
+_SPACE_PATTERN = re.compile(r"[\s　]+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFKC正規化（全角英数→半角など）と小文字化を行う。
+    """
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def ngram_tokenize(text: str, n: int = 2) -> list[str]:
+    """
+    日本語向けの文字n-gramトークナイズ。
+
+    空白を除去した文字列の文字n-gramと、英数字の連続（例: "sus304", "m6"）を1語として返す。
+    """
+    normalized = normalize_text(text)
+    tokens = [match.group(0) for match in _ALNUM_PATTERN.finditer(normalized)]
+
+    compact = _SPACE_PATTERN.sub("", normalized)
+    if len(compact) < n:
+        if compact:
+            tokens.append(compact)
+        return tokens
+    tokens.extend(compact[i : i + n] for i in range(len(compact) - n + 1))
+    return tokens
+
+
+def hash_term(term: str) -> int:
+    """
+    termを64bitの安定ハッシュに変換する（語彙ファイルを持たずに済むようにするため）。
+    """
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _Segment:
+    """
+    読み取り専用のインデックスセグメント（memmap）。
+    """
+
+    def __init__(self, seg_dir: Path):
+        self.seg_dir = seg_dir
+        self.terms = np.load(seg_dir / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(seg_dir / "offsets.npy", mmap_mode="r")
+        self.postings = np.load(seg_dir / "postings.npy", mmap_mode="r")
+        self.tfs = np.load(seg_dir / "tfs.npy", mmap_mode="r")
+        self.doc_len = np.load(seg_dir / "doc_len.npy", mmap_mode="r")
+        self.keys = np.load(seg_dir / "keys.npy", mmap_mode="r")
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    def lookup(self, term_hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        termハッシュ群を二分探索し、(見つかったか, 開始位置, 終了位置) を返す。
+        """
+        if not len(self.terms):
+            # 文書がすべて空、または remove() で全件削除したセグメント
+            empty = np.zeros(len(term_hashes), dtype=np.int64)
+            return np.zeros(len(term_hashes), dtype=bool), empty, empty
+        pos = np.searchsorted(self.terms, term_hashes)
+        pos_clipped = np.minimum(pos, len(self.terms) - 1)
+        found = (pos < len(self.terms)) & (self.terms[pos_clipped] == term_hashes)
+        starts = np.where(found, self.offsets[pos_clipped], 0)
+        ends = np.where(found, self.offsets[pos_clipped + 1], 0)
+        return found, starts, ends
+
+
+class NgramInvertedIndex:
+    """
+    文字n-gramによるBM25転置インデックス。
+
+    使い方:
+        index = NgramInvertedIndex("data_store/lexical/v0.1", n=2)
+        index.add(["JP2010000001:0"], ["請求項1 ..."])
+        hits = index.search("ノズルプレート SUS304", k=10)  # [(key, score), ...]
+    """
+
+    def __init__(self, index_dir: str | Path, n: int = 2, max_query_terms: int = 64, max_segments: int = 16):
+        """
+        Args:
+            index_dir: インデックスの保存ディレクトリ
+            n: 文字n-gramのn（新規作成時のみ有効。既存インデックスはmanifestの値を使う）
+            max_query_terms: 検索に使うクエリtermの上限（IDFの高い順に採用し、頻出termの長いポスティングを避ける）
+            max_segments: add() でこの数を超えたら compact() する
+        """
+        self.index_dir = Path(index_dir)
+        self.max_query_terms = max_query_terms
+        self.max_segments = max_segments
+        self.n = n
+        self.segments: list[_Segment] = []
+        # 全セグメントの文書長の合計（検索のたびに doc_len を走査しないよう、manifest に保存して更新する）
+        self.total_doc_len = 0
+        self._load()
+
+    # --------------------------------------------------------------------------
+    # 読み込み
+    # --------------------------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.index_dir / "manifest.json"
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def _load(self) -> None:
+        if not self.exists():
+            return
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.n = manifest["n"]
+        self.segments = [_Segment(self.index_dir / name) for name in manifest["segments"]]
+        total_doc_len = manifest.get("total_doc_len")
+        if total_doc_len is None:
+            # 合計を保存していない旧形式の manifest は、読み込み時に1回だけ数える
+            total_doc_len = sum(int(np.sum(seg.doc_len, dtype=np.int64)) for seg in self.segments)
+        self.total_doc_len = total_doc_len
+
+    def _write_manifest(self, segment_names: list[str]) -> None:
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            manifest = {"n": self.n, "segments": segment_names, "total_doc_len": self.total_doc_len}
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        tmp_path.replace(self.manifest_path)
+
+    @property
+    def n_docs(self) -> int:
+        return sum(seg.n_docs for seg in self.segments)
+
+    def contains(self, keys: list[str]) -> np.ndarray:
+        """
+        各キーが既にインデックスに登録済みかどうかを返す。
+        """
+        result = np.zeros(len(keys), dtype=bool)
+        if not keys:
+            return result
+        query_keys = np.asarray(keys)
+        for seg in self.segments:
+            result |= np.isin(query_keys, seg.keys)
+        return result
+
+    # --------------------------------------------------------------------------
+    # 追加（インクリメンタル更新）
+    # --------------------------------------------------------------------------
+
+    def add(self, keys: list[str], texts: list[str]) -> int:
+        """
+        文書を新しいセグメントとして追加する。登録済みのキー・同じバッチ内で重複するキーはスキップする。
+
+        Returns:
+            追加した文書数
+        """
+        if len(keys) != len(texts):
+            raise ValueError("keys と texts の件数が一致しません。")
+
+        # 同じバッチ内の重複は先に現れたものを残す
+        unique: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+        items = list(unique.items())
+        is_known = self.contains([key for key, _ in items])
+        new_items = [item for item, known in zip(items, is_known) if not known]
+        if not new_items:
+            return 0
+
+        self._append_segment(new_items)
+        self._write_manifest([seg.seg_dir.name for seg in self.segments])
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return len(new_items)
+
+    def _append_segment(self, items: list[tuple[str, str]]) -> None:
+        """
+        (key, text) のリストを新しいセグメントとして書き出す（manifest は書かない）。
+        """
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        seg_name = f"seg_{len(self.segments):05d}"
+        while (self.index_dir / seg_name).exists():
+            seg_name = f"seg_{int(seg_name[4:]) + 1:05d}"
+        self._write_segment(self.index_dir / seg_name, items)
+        segment = _Segment(self.index_dir / seg_name)
+        self.segments.append(segment)
+        self.total_doc_len += int(np.sum(segment.doc_len, dtype=np.int64))
+
+    def build(self, batches: Iterable[tuple[list[str], list[str]]]) -> int:
+        """
+        (keys, texts) のバッチ列からインデックスを一括構築して置き換える（既存コーパスのバックフィル用）。
+
+        バッチごとのセグメントは一時ディレクトリ（{index_dir}.building）に書き、最後に1回だけ compact() して
+        manifest を書いてから index_dir に移す。キーの重複は全バッチを通して先に現れたものを残す。
+        contains() による既存セグメントの照合を行わないため、件数に対して線形で構築できる。
+
+        Returns:
+            登録した文書数
+        """
+        building = NgramInvertedIndex(
+            self.index_dir.with_name(self.index_dir.name + ".building"), n=self.n, max_query_terms=self.max_query_terms
+        )
+        if building.index_dir.exists():
+            shutil.rmtree(building.index_dir)
+
+        seen: set[str] = set()
+        total = 0
+        for keys, texts in batches:
+            items = []
+            for key, text in zip(keys, texts):
+                if key not in seen:
+                    seen.add(key)
+                    items.append((key, text))
+            if items:
+                building._append_segment(items)
+                total += len(items)
+            print(f"  BM25インデックスの構築: {total:,}件（{len(building.segments)}セグメント）")
+
+        building.index_dir.mkdir(parents=True, exist_ok=True)
+        building.compact()
+        building._write_manifest([seg.seg_dir.name for seg in building.segments])
+
+        if self.index_dir.exists():
+            shutil.rmtree(self.index_dir)
+        building.index_dir.rename(self.index_dir)
+        self.segments = []
+        self._load()
+        return total
+
+    def _write_segment(self, seg_dir: Path, items: list[tuple[str, str]]) -> None:
+        """
+        (key, text) のリストから1セグメント分の配列を作成して保存する。
+        """
+        term_chunks: list[np.ndarray] = []
+        doc_chunks: list[np.ndarray] = []
+        tf_chunks: list[np.ndarray] = []
+        doc_len = np.zeros(len(items), dtype=np.int32)
+
+        for local_id, (_, text) in enumerate(items):
+            counts = Counter(hash_term(token) for token in ngram_tokenize(text, self.n))
+            doc_len[local_id] = sum(counts.values())
+            if not counts:
+                continue
+            term_chunks.append(np.fromiter(counts.keys(), dtype=np.uint64, count=len(counts)))
+            tf_chunks.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+            doc_chunks.append(np.full(len(counts), local_id, dtype=np.int32))
+
+        if term_chunks:
+            all_terms = np.concatenate(term_chunks)
+            all_docs = np.concatenate(doc_chunks)
+            all_tfs = np.concatenate(tf_chunks)
+        else:
+            all_terms = np.zeros(0, dtype=np.uint64)
+            all_docs = np.zeros(0, dtype=np.int32)
+            all_tfs = np.zeros(0, dtype=np.int32)
+
+        # term昇順（同じterm内は文書番号順）に並べてポスティングリストを作る
+        order = np.lexsort((all_docs, all_terms))
+        all_terms, all_docs, all_tfs = all_terms[order], all_docs[order], all_tfs[order]
+        terms, starts = np.unique(all_terms, return_index=True)
+
+        self._save_arrays(
+            seg_dir,
+            terms=terms,
+            offsets=np.append(starts, len(all_terms)).astype(np.int64),
+            postings=all_docs,
+            tfs=all_tfs,
+            doc_len=doc_len,
+            keys=np.asarray([key for key, _ in items]),
+        )
+
+    @staticmethod
+    def _save_arrays(seg_dir: Path, **arrays: np.ndarray) -> None:
+        """
+        一時ディレクトリに書き出してからリネームする（書き込み途中のセグメントを読ませないため）。
+        """
+        tmp_dir = seg_dir.with_name(seg_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{name}.npy", array)
+        tmp_dir.rename(seg_dir)
+
+    def compact(self) -> None:
+        """
+        全セグメントを1つに統合する（セグメントが増えすぎた場合に実行）。
+        """
+        if len(self.segments) <= 1:
+            return
+        self._rewrite(np.zeros(0, dtype=str))
+
+    def remove(self, keys: list[str]) -> int:
+        """
+        指定したキーの文書をインデックスから削除する（残りの文書は1つのセグメントに統合する）。
+        add() は登録済みのキーをスキップするため、文書を入れ替えるときは先にこちらで削除する。
+
+        Returns:
+            削除した文書数
+        """
+        n_removed = int(self.contains(keys).sum()) if keys else 0
+        if n_removed:
+            self._rewrite(np.asarray(keys))
+        return n_removed
+
+    def _rewrite(self, drop_keys: np.ndarray) -> None:
+        """
+        drop_keys の文書を除いて全セグメントを1つに書き直し、manifest を差し替える。
+        """
+        term_parts, doc_parts, tf_parts, len_parts, key_parts = [], [], [], [], []
+        doc_offset = 0
+        for seg in self.segments:
+            keep = ~np.isin(np.asarray(seg.keys), drop_keys)
+            # 残す文書に詰め直した文書番号（削除する文書の行は後で捨てる）
+            new_ids = np.cumsum(keep, dtype=np.int64) - 1
+            postings = np.asarray(seg.postings)
+            keep_rows = keep[postings]
+            # ポスティングを (term, doc, tf) の行に展開し、文書番号をずらして連結する
+            term_parts.append(np.repeat(np.asarray(seg.terms), np.diff(np.asarray(seg.offsets)))[keep_rows])
+            doc_parts.append(new_ids[postings[keep_rows]] + doc_offset)
+            tf_parts.append(np.asarray(seg.tfs)[keep_rows])
+            len_parts.append(np.asarray(seg.doc_len)[keep])
+            key_parts.append(np.asarray(seg.keys)[keep])
+            doc_offset += int(keep.sum())
+
+        all_terms = np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.uint64)
+        all_docs = np.concatenate(doc_parts).astype(np.int32) if doc_parts else np.zeros(0, dtype=np.int32)
+        all_tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.int32)
+        order = np.lexsort((all_docs, all_terms))
+        terms, starts = np.unique(all_terms[order], return_index=True)
+
+        doc_len = np.concatenate(len_parts) if len_parts else np.zeros(0, dtype=np.int32)
+        seg_name = f"seg_{max((int(seg.seg_dir.name[4:]) for seg in self.segments), default=-1) + 1:05d}"
+        self._save_arrays(
+            self.index_dir / seg_name,
+            terms=terms,
+            offsets=np.append(starts, len(all_terms)).astype(np.int64),
+            postings=all_docs[order],
+            tfs=all_tfs[order],
+            doc_len=doc_len,
+            keys=np.concatenate(key_parts) if key_parts else np.zeros(0, dtype=str),
+        )
+        old_dirs = [seg.seg_dir for seg in self.segments]
+        self.total_doc_len = int(np.sum(doc_len, dtype=np.int64))
+        # manifest を書き換えてから古いセグメントを消す（途中で止まっても manifest は常に完全なセグメントを指す）
+        self._write_manifest([seg_name])
+        self.segments = [_Segment(self.index_dir / seg_name)]
+        for old_dir in old_dirs:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    # --------------------------------------------------------------------------
+    # 検索
+    # --------------------------------------------------------------------------
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        BM25スコアの上位k件を (key, score) のリストで返す。
+        """
+        if not self.segments or k <= 0:
+            return []
+
+        query_counts = Counter(hash_term(token) for token in ngram_tokenize(query, self.n))
+        if not query_counts:
+            return []
+        term_hashes = np.fromiter(query_counts.keys(), dtype=np.uint64, count=len(query_counts))
+        query_tfs = np.fromiter(query_counts.values(), dtype=np.float32, count=len(query_counts))
+
+        # コーパス全体の統計量（全セグメント合算）
+        lookups = [seg.lookup(term_hashes) for seg in self.segments]
+        n_docs = self.n_docs
+        avg_len = self.total_doc_len / max(n_docs, 1)
+        df = np.zeros(len(term_hashes), dtype=np.float64)
+        for _, starts, ends in lookups:
+            df += ends - starts
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        # IDFの高いtermから max_query_terms 件だけ使う（頻出n-gramの巨大ポスティングを読まない）
+        usable = np.flatnonzero(df > 0)
+        usable = usable[np.argsort(-idf[usable], kind="stable")][: self.max_query_terms]
+
+        candidates: list[tuple[float, str]] = []
+        for seg, (_, starts, ends) in zip(self.segments, lookups):
+            doc_parts: list[np.ndarray] = []
+            score_parts: list[np.ndarray] = []
+            for t in usable:
+                start, end = int(starts[t]), int(ends[t])
+                if start == end:
+                    continue
+                docs = np.asarray(seg.postings[start:end])
+                tfs = np.asarray(seg.tfs[start:end], dtype=np.float32)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(seg.doc_len[docs], dtype=np.float32) / avg_len)
+                doc_parts.append(docs)
+                score_parts.append(idf[t] * query_tfs[t] * tfs * (BM25_K1 + 1) / (tfs + norm))
+            if not doc_parts:
+                continue
+
+            docs = np.concatenate(doc_parts)
+            scores = np.concatenate(score_parts)
+            unique_docs, inverse = np.unique(docs, return_inverse=True)
+            doc_scores = np.bincount(inverse, weights=scores)
+            top = np.argsort(-doc_scores, kind="stable")[:k]
+            candidates.extend((float(doc_scores[i]), str(seg.keys[unique_docs[i]])) for i in top)
+
+        candidates.sort(key=lambda item: -item[0])
+        return [(key, score) for score, key in candidates[:k]]
@@ -0,0 +1,681 @@
+"""
+特許XMLコーパスのパスインデックス（ソート済み配列 + 二分探索）
+
+コーパスのパス一覧（data/path/*_path_XX.csv、約200万行）を (type, doc_number) の順にソートして保存し、
+top-k の公開番号を np.searchsorted でまとめて引きます。
+行ごとに全件のブールマスクを作る検索（O(件数 × コーパス)）の代わりに使います。
+
+公開特許（A）だけでなく、再公表（"1"）・登録特許（B）・実用新案（U）も1つのソート済み配列に入れます。
+doc_number は model/patent_number.py の主キー（WO・和暦の番号も西暦4桁 + 0埋め6桁）に揃えるため、
+BigQueryの公開番号（例: "JP-H084831-A", "JP-WO2014030240-A1"）からも同じキーで引けます。
+
+ディスク構成（index_dir 配下）:
+    keys.npy            照合キー type * TYPE_STRIDE + doc_number（int64, 昇順）
+    table_names.npy     キーに対応する result_X の X（int16, keys.npy と同じ並び）
+    chunk_dirs.npy      result_X 直下のチャンクディレクトリ番号（int32, 同じ並び）
+    doc_id_offsets.npy  行iの doc_id は doc_id_pool[doc_id_offsets[i]:doc_id_offsets[i+1]]（int64, len = 件数 + 1）
+    doc_id_pool.npy     doc_id（例: "JP2010035913A"）を連結したASCIIバイト列（uint8）
+    manifest.json       保存ごとの版（version）と、差分更新用に走査したチャンクディレクトリごとの更新日時
+                        （infra/index/path_indexer.py）。公開先の版はこのファイルのハッシュで決まる
+
+index_dir は版付きディレクトリ（{index_dir}@{版}）を指すシンボリックリンクで、保存のたびに新しい版を書いてから
+リンクを os.replace で原子的に差し替える（読み込み中のプロセスが、消えたディレクトリや書き込み途中の版を見ることはない）。
+置き換えられた版は、差し替え前にリンクを解決したプロセスのために VERSION_GRACE_SECONDS 秒残してから削除する。
+
+chunk_dirs / doc_id_* はコーパスの走査・パス一覧のCSVから作成した場合のみ存在し、text_path() で
+cfg.path_corpus_dir（未設定なら PathManager.RAW_DATA_DIR）/ result_X / {チャンク} / {doc_id} / text.txt を
+配列の参照だけで組み立てられる。
+
+配列は np.load(..., mmap_mode="r") で開くため、二分探索で触れたページだけがメモリに載る。
+get_path_index() は初回の呼び出し時に1度だけ開く（import時には読み込まない）。インデックスがなくても作成はしない。
+
+読み取り専用の mmap はOSのページキャッシュを共有するため、同じファイルを開いた Streamlit のサーバープロセス・
+セッション、並列処理のワーカープロセスはすべて物理メモリ上の1つのコピーを参照する（プロセスごとの複製を持たない）。
+    publish_path_index(index_dir, shared_dir)  インデックスを共有ディレクトリ（例: /dev/shm 配下のtmpfs）に公開する
+                                              （公開先も版付きディレクトリ + シンボリックリンクの差し替え）
+    attach_path_index(index_dir)              公開されたインデックスをプロセス内で1度だけ開く（再公開されたら開き直す）
+PathIndex を ProcessPoolExecutor などでワーカーに渡すと、配列ではなくディレクトリ名だけが pickle され、
+ワーカー側で attach_path_index により同じファイルを開き直す。
+
+実行方法（srcディレクトリで、cfg.path_corpus_dir の走査（未設定なら *_path_XX.csv、patent_path_numpy.npy）からインデックスを作成）:
+    uv run python -m infra.index.path_index
+"""
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from infra.config import PathManager, cfg
+from model.patent_number import parse_publication_numbers
+
+PATH_DATA_DIR = PathManager.RAW_DATA_DIR / "path"
+NUM_PATH = PATH_DATA_DIR / "patent_path_numpy.npy"
+
+# document_typeを整数に変換するマッピング（data/numpy_file.py と同じ）
+# type はコーパスのディレクトリ名の末尾1文字（JP2010035913A → A, JP5752307B → B, ...A1 → 1）
+TYPE_MAPPING = {"A": 0, "1": 1, "B": 2, "U": 3}
+TYPE_CATEGORIES = pd.CategoricalDtype(categories=list(TYPE_MAPPING))
+
+# 照合キーで type を doc_number の上位に置くための倍率（doc_number は10桁まで）
+TYPE_STRIDE = 10**10
+# (table_name, chunk_dir) を1つの整数にまとめるための倍率
+CHUNK_STRIDE = 10**6
+# 置き換えられた版付きディレクトリを削除するまでの猶予（秒）
+VERSION_GRACE_SECONDS = 60
+
+
+def make_keys(doc_numbers: np.ndarray, types: np.ndarray) -> np.ndarray:
+    """
+    doc_number と type（整数）から照合キーを作る。
+    """
+    return np.asarray(types, dtype=np.int64) * TYPE_STRIDE + np.asarray(doc_numbers, dtype=np.int64)
+
+
+def type_codes(document_types: pd.Series) -> np.ndarray:
+    """
+    文献種別（parse_publication_numbers の document_type 列。"A", "1", "B", "U", "Y" など）
+    → パスインデックスの type（整数。対象外・不明は -1）。
+    """
+    return document_types.astype(object).astype(TYPE_CATEGORIES).cat.codes.to_numpy(dtype=np.int64)
+
+
+def read_path_csvs(path_dir: str | Path = PATH_DATA_DIR) -> pd.DataFrame:
+    """
+    data/process_path.py が出力した *_path_XX.csv（doc_id, path 列）を読み込み、
+    doc_number（主キー）, table_name, type の整数列にする。主キーにできない行は除く。
+    """
+    csv_files = sorted(Path(path_dir).glob("*_path_*.csv"))
+    if not csv_files:
+        raise FileNotFoundError(
+            f"パス一覧のCSVがありません: {path_dir}\n"
+            "data/process_path.py を実行して作成してください。"
+        )
+    df = pd.concat([pd.read_csv(csv_file, usecols=["doc_id", "path"], dtype=str) for csv_file in csv_files], ignore_index=True)
+    return _encode_path_table(df)
+
+
+# パス（例: /mnt/eightthdd/raw_data/result_17/10/JP5752307B）の末尾の result_X / チャンク / doc_id
+_PATH_PATTERN = r"result_(?P<table_name>\d+)[/\\](?P<chunk_dir>\d+)[/\\](?P<doc_id>[^/\\]+)[/\\]?$"
+
+
+def _doc_id_codes(doc_ids: pd.Series) -> tuple[pd.Series, np.ndarray]:
+    """
+    doc_id（例: "JP2010035913A"）から doc_number の主キー（解釈できなければNaN）と type（対象外は -1）を求める。
+    """
+    parsed = parse_publication_numbers(doc_ids)
+    return parsed["key"], type_codes(parsed["document_type"])
+
+
+def _encode_path_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    doc_id, path 列から doc_number（主キー）, table_name, type, chunk_dir（整数）と doc_id（文字列）の列を作る。
+    """
+    keys, types = _doc_id_codes(df["doc_id"])
+    parts = df["path"].astype(str).str.extract(_PATH_PATTERN)
+    valid = keys.notna().to_numpy() & parts["table_name"].notna().to_numpy() & (types >= 0)
+    dropped = int((~valid).sum())
+    if dropped:
+        print(f"doc_number・table_name・type を求められない {dropped:,} 件を除きました")
+    return pd.DataFrame({
+        "doc_number": keys[valid].astype(np.int64).to_numpy(),
+        "table_name": parts.loc[valid, "table_name"].astype(np.int64).to_numpy(),
+        "type": types[valid],
+        "chunk_dir": parts.loc[valid, "chunk_dir"].astype(np.int64).to_numpy(),
+        "doc_id": parts.loc[valid, "doc_id"].astype(object).to_numpy(),
+    })
+
+
+def pack_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    """
+    文字列の列を (オフセット, 連結したバイト列) に詰める（ASCIIのdoc_idを1本の配列で持つため）。
+    """
+    encoded = [str(value).encode("ascii") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def take_strings(offsets: np.ndarray, pool: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    pack_strings で詰めた文字列の列から rows の順に取り出し、新しい (オフセット, バイト列) を返す。
+    Pythonの文字列に戻さず、バイト列のファンシーインデックス1回で並べ替える。
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = np.asarray(offsets[rows])
+    lengths = np.asarray(offsets[rows + 1]) - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return new_offsets, np.asarray(pool[positions], dtype=np.uint8)
+
+
+@dataclass
+class EncodedPaths:
+    """
+    パスインデックスに入れる前の整数列と、詰めた doc_id（並びはまだソートしていない）。
+    コーパスの走査ワーカー（infra/index/path_indexer.py）がチャンクごとに作り、プロセス間で受け渡す。
+    """
+
+    doc_numbers: np.ndarray  # int64（主キー）
+    table_names: np.ndarray  # int16（result_X の X）
+    types: np.ndarray  # int8（TYPE_MAPPING）
+    chunk_dirs: np.ndarray  # int32
+    doc_id_offsets: np.ndarray  # int64, len = 件数 + 1
+    doc_id_pool: np.ndarray  # uint8
+
+    def __len__(self) -> int:
+        return len(self.doc_numbers)
+
+    @property
+    def keys(self) -> np.ndarray:
+        return make_keys(self.doc_numbers, self.types)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "EncodedPaths":
+        """
+        doc_number, table_name, type, chunk_dir, doc_id 列の DataFrame（_encode_path_table の出力）から作る。
+        """
+        offsets, pool = pack_strings(df["doc_id"].to_numpy())
+        return cls(
+            df["doc_number"].to_numpy(dtype=np.int64),
+            df["table_name"].to_numpy(dtype=np.int16),
+            df["type"].to_numpy(dtype=np.int8),
+            df["chunk_dir"].to_numpy(dtype=np.int32),
+            offsets,
+            pool,
+        )
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids: list[str], table_name: int, chunk_dir: int) -> "EncodedPaths":
+        """
+        1つのチャンクディレクトリ（result_{table_name}/{chunk_dir}）直下の doc_id から作る。
+        主キー・type を求められない doc_id は除く。
+        """
+        doc_ids = pd.Series(doc_ids, dtype=object)
+        keys, types = _doc_id_codes(doc_ids)
+        valid = keys.notna().to_numpy() & (types >= 0)
+        offsets, pool = pack_strings(doc_ids[valid].to_numpy())
+        count = int(valid.sum())
+        return cls(
+            keys[valid].to_numpy(dtype=np.int64),
+            np.full(count, table_name, dtype=np.int16),
+            types[valid].astype(np.int8),
+            np.full(count, chunk_dir, dtype=np.int32),
+            offsets,
+            pool,
+        )
+
+    @classmethod
+    def concat(cls, parts: list["EncodedPaths"]) -> "EncodedPaths":
+        """
+        複数の EncodedPaths を順につなげる（doc_id のオフセットはバイト列の長さの分ずらす）。
+        """
+        if not parts:
+            return cls.from_doc_ids([], 0, 0)
+        shifts = np.cumsum([0] + [len(part.doc_id_pool) for part in parts])
+        offsets = np.concatenate(
+            [part.doc_id_offsets[:-1] + shift for part, shift in zip(parts, shifts)] + [shifts[-1:]]
+        ).astype(np.int64)
+        return cls(
+            np.concatenate([part.doc_numbers for part in parts]),
+            np.concatenate([part.table_names for part in parts]),
+            np.concatenate([part.types for part in parts]),
+            np.concatenate([part.chunk_dirs for part in parts]),
+            offsets,
+            np.concatenate([part.doc_id_pool for part in parts]),
+        )
+
+    def take(self, rows: np.ndarray) -> "EncodedPaths":
+        """
+        rows の順に行を取り出す。
+        """
+        offsets, pool = take_strings(self.doc_id_offsets, self.doc_id_pool, rows)
+        return EncodedPaths(
+            self.doc_numbers[rows], self.table_names[rows], self.types[rows], self.chunk_dirs[rows], offsets, pool
+        )
+
+
+class PathIndex:
+    """
+    (type, doc_number) → table_name・テキストのパス のソート済み配列インデックス。
+
+    使い方:
+        index = PathIndex(cfg.path_index_dir)
+        rows = index.lookup(doc_numbers, types)   # 見つからない行は -1
+        table_names = index.table_names[rows[rows >= 0]]
+        text_path = index.text_path(rows[0])      # data/result_X/{チャンク}/{doc_id}/text.txt
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        # リンクは1回だけ解決し、全ファイルを同じ版から読む（途中で差し替えられても版が混ざらない）
+        self.version_dir = Path(os.path.realpath(self.index_dir))
+        self.keys = np.load(self.version_dir / "keys.npy", mmap_mode="r")
+        self.table_names = np.load(self.version_dir / "table_names.npy", mmap_mode="r")
+        self.chunk_dirs = None
+        self.doc_id_offsets = None
+        self.doc_id_pool = None
+        if (self.version_dir / "doc_id_pool.npy").exists():
+            self.chunk_dirs = np.load(self.version_dir / "chunk_dirs.npy", mmap_mode="r")
+            self.doc_id_offsets = np.load(self.version_dir / "doc_id_offsets.npy", mmap_mode="r")
+            self.doc_id_pool = np.load(self.version_dir / "doc_id_pool.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(index_dir: str | Path) -> bool:
+        return (Path(index_dir) / "table_names.npy").exists()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __reduce__(self):
+        # 別プロセスへは配列をコピーせず、ディレクトリ名だけを送って同じファイルを mmap で開き直す
+        return attach_path_index, (str(self.index_dir),)
+
+    @property
+    def has_paths(self) -> bool:
+        """テキストのパスを引けるか（パス一覧のCSVから作成したインデックスか）"""
+        return self.doc_id_pool is not None
+
+    @classmethod
+    def build(
+        cls,
+        index_dir: str | Path,
+        path_array: np.ndarray | pd.DataFrame | EncodedPaths,
+        manifest: dict | None = None,
+    ) -> "PathIndex":
+        """
+        [doc_number, table_name, type] の配列（または同名の列を持つ DataFrame）からインデックスを作成して保存する。
+        DataFrame に chunk_dir, doc_id 列がある場合と EncodedPaths の場合は、テキストのパスも保存する。
+        同じキーが複数ある場合は、元の配列で先に現れた行が優先される（安定ソート）。
+        """
+        if isinstance(path_array, pd.DataFrame) and {"chunk_dir", "doc_id"} <= set(path_array.columns):
+            path_array = EncodedPaths.from_frame(path_array)
+        if isinstance(path_array, EncodedPaths):
+            order = np.argsort(path_array.keys, kind="stable")
+            return cls._save(index_dir, cls._arrays(path_array.take(order)), manifest)
+
+        if isinstance(path_array, pd.DataFrame):
+            path_array = path_array[["doc_number", "table_name", "type"]].to_numpy(dtype=np.int64)
+        keys = make_keys(path_array[:, 0], path_array[:, 2])
+        order = np.argsort(keys, kind="stable")
+        arrays = {"keys": keys[order], "table_names": path_array[order, 1].astype(np.int16)}
+        return cls._save(index_dir, arrays, manifest)
+
+    @staticmethod
+    def _arrays(paths: EncodedPaths) -> dict[str, np.ndarray]:
+        """キー順に並んだ EncodedPaths → 保存する配列"""
+        return {
+            "keys": paths.keys,
+            "table_names": paths.table_names.astype(np.int16),
+            "chunk_dirs": paths.chunk_dirs.astype(np.int32),
+            "doc_id_offsets": paths.doc_id_offsets,
+            "doc_id_pool": paths.doc_id_pool,
+        }
+
+    @classmethod
+    def _save(cls, index_dir: str | Path, arrays: dict[str, np.ndarray], manifest: dict | None = None) -> "PathIndex":
+        """
+        配列と manifest.json をプロセスごとの一時ディレクトリに書き出し、新しい版として index_dir のリンクを差し替える。
+        manifest.json には、渡された manifest に保存ごとに一意な版（version）を加えて書く。
+        """
+        index_dir = Path(index_dir)
+        tmp_dir = index_dir.with_name(f"{index_dir.name}.tmp-{os.getpid()}")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{name}.npy", array)
+        version = f"{time.time_ns()}-{os.getpid()}"
+        with open(tmp_dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({**(manifest or {}), "version": version}, f, ensure_ascii=False, indent=2)
+        with _writer_lock(index_dir):
+            _swap_version(index_dir, tmp_dir, version)
+        print(f"パスインデックスを保存しました: {index_dir}（{len(arrays['keys']):,}件）")
+        return cls(index_dir)
+
+    def load_manifest(self) -> dict | None:
+        """
+        差分更新用の manifest.json（チャンクディレクトリごとの更新日時）を返す（なければNone）。
+        """
+        manifest_path = self.version_dir / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def merge(
+        self,
+        removed_chunks: list[tuple[int, int]],
+        delta: pd.DataFrame | EncodedPaths,
+        manifest: dict | None = None,
+        index_dir: str | Path | None = None,
+    ) -> "PathIndex":
+        """
+        (table_name, chunk_dir) の組に属する行を除き、差分（build と同じ列の DataFrame か EncodedPaths）を
+        ソート順を保って挿入する。全体を並べ直さず、既存の配列への二分探索 + 挿入（O(件数)）で
+        新しいインデックスを作って保存する。同じキーは既存の行が優先される。
+        """
+        self._require_paths()
+        if isinstance(delta, pd.DataFrame):
+            delta = EncodedPaths.from_frame(delta)
+        table_names = np.asarray(self.table_names)
+        chunk_dirs = np.asarray(self.chunk_dirs)
+        chunk_codes = table_names.astype(np.int64) * CHUNK_STRIDE + chunk_dirs
+        removed_codes = np.array([table * CHUNK_STRIDE + chunk for table, chunk in removed_chunks], dtype=np.int64)
+        keep_rows = np.flatnonzero(~np.isin(chunk_codes, removed_codes))
+
+        keys = np.asarray(self.keys)
+        offsets, pool = take_strings(self.doc_id_offsets, self.doc_id_pool, keep_rows)
+        kept = EncodedPaths(
+            keys[keep_rows] % TYPE_STRIDE,
+            table_names[keep_rows],
+            (keys[keep_rows] // TYPE_STRIDE).astype(np.int8),
+            chunk_dirs[keep_rows],
+            offsets,
+            pool,
+        )
+        delta = delta.take(np.argsort(delta.keys, kind="stable"))
+
+        # 差分の各行が入る位置（同じキーの既存の行の後ろ）。残りの位置に既存の行を順に並べる
+        new_slots = np.searchsorted(kept.keys, delta.keys, side="right") + np.arange(len(delta))
+        is_new = np.zeros(len(kept) + len(delta), dtype=bool)
+        is_new[new_slots] = True
+        order = np.empty(len(is_new), dtype=np.int64)
+        order[~is_new] = np.arange(len(kept))
+        order[new_slots] = len(kept) + np.arange(len(delta))
+
+        print(f"パスインデックスに差分をマージします: 削除 {len(self) - len(keep_rows):,}件, 追加 {len(delta):,}件")
+        merged = EncodedPaths.concat([kept, delta]).take(order)
+        return self._save(index_dir if index_dir is not None else self.index_dir, self._arrays(merged), manifest)
+
+    def lookup(self, doc_numbers: np.ndarray, types: np.ndarray) -> np.ndarray:
+        """
+        doc_number と type（整数）の配列をまとめて引き、インデックスの行番号を返す（見つからなければ -1）。
+        """
+        keys = make_keys(doc_numbers, types)
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        rows = np.searchsorted(self.keys, keys, side="left")
+        rows_clipped = np.minimum(rows, len(self.keys) - 1)
+        found = self.keys[rows_clipped] == keys
+        return np.where(found, rows_clipped, -1)
+
+    def _require_paths(self):
+        if not self.has_paths:
+            raise ValueError(
+                f"このパスインデックスにはパスが保存されていません: {self.index_dir}\n"
+                "infra/index/path_indexer.py --full（またはパス一覧のCSV）で作り直してください。"
+            )
+
+    def doc_id(self, row: int) -> str:
+        """
+        行番号の doc_id（例: "JP2010035913A"）を返す。
+        """
+        self._require_paths()
+        start, end = self.doc_id_offsets[row], self.doc_id_offsets[row + 1]
+        return self.doc_id_pool[start:end].tobytes().decode("ascii")
+
+    def text_path(self, row: int, data_dir: str | Path | None = None) -> Path:
+        """
+        行番号の text.txt のパス（data_dir / result_X / {チャンク} / {doc_id} / text.txt）を返す。
+        data_dir を省略した場合は cfg.path_corpus_dir（未設定なら PathManager.RAW_DATA_DIR）を使う。
+        """
+        data_dir = Path(data_dir) if data_dir is not None else _corpus_dir()
+        doc_id = self.doc_id(row)
+        return data_dir / f"result_{int(self.table_names[row])}" / str(int(self.chunk_dirs[row])) / doc_id / "text.txt"
+
+    def doc_ids(self, rows: np.ndarray) -> list[str]:
+        """
+        行番号の配列の doc_id をまとめて返す（文字列プールからの読み出しは1回のファンシーインデックス）。
+        """
+        self._require_paths()
+        offsets, pool = take_strings(self.doc_id_offsets, self.doc_id_pool, rows)
+        text = pool.tobytes().decode("ascii")
+        bounds = offsets.tolist()
+        return [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def text_paths(self, rows: np.ndarray, data_dir: str | Path | None = None) -> list[str]:
+        """
+        行番号の配列の text.txt のパスをまとめて文字列で返す（text_path のベクトル版）。
+        """
+        base = str(Path(data_dir) if data_dir is not None else _corpus_dir())
+        rows = np.asarray(rows, dtype=np.int64)
+        doc_ids = self.doc_ids(rows)
+        table_names = np.asarray(self.table_names[rows]).tolist()
+        chunk_dirs = np.asarray(self.chunk_dirs[rows]).tolist()
+        sep = os.sep
+        return [
+            f"{base}{sep}result_{table_name}{sep}{chunk_dir}{sep}{doc_id}{sep}text.txt"
+            for table_name, chunk_dir, doc_id in zip(table_names, chunk_dirs, doc_ids)
+        ]
+
+
+@contextmanager
+def _writer_lock(index_dir: Path):
+    """
+    同じ index_dir への版の差し替え・古い版の削除を、プロセス間で1つずつ行うためのロック（{index_dir}.lock）。
+    読み込み側はロックを取らない。
+    """
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    with open(index_dir.with_name(index_dir.name + ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _swap_version(index_dir: Path, tmp_dir: Path, version: str) -> Path:
+    """
+    書き終えた tmp_dir を版付きディレクトリ {index_dir}@{version} に移し、index_dir（シンボリックリンク）を
+    os.replace で原子的に差し替えて、版付きディレクトリを返す。同じ版が既にあれば tmp_dir は（あれば）捨てる。
+    置き換えた版の更新日時を差し替えた時刻にし、そこから VERSION_GRACE_SECONDS 秒たった版を削除する。
+    _writer_lock を取った状態で呼ぶ。
+    """
+    version_dir = index_dir.with_name(f"{index_dir.name}@{version}")
+    if version_dir.exists():
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        tmp_dir.rename(version_dir)
+
+    previous = Path(os.path.realpath(index_dir)) if index_dir.is_symlink() else None
+    if index_dir.exists() and not index_dir.is_symlink():
+        # 版付きディレクトリ導入前の実ディレクトリは、直前の版として退避してからリンクに置き換える
+        previous = index_dir.with_name(f"{index_dir.name}@legacy")
+        if previous.exists():
+            shutil.rmtree(previous)
+        index_dir.rename(previous)
+    tmp_link = index_dir.with_name(f"{index_dir.name}.link-{os.getpid()}")
+    if tmp_link.is_symlink():
+        tmp_link.unlink()
+    os.symlink(version_dir.name, tmp_link)  # 同じ親ディレクトリからの相対パス
+    os.replace(tmp_link, index_dir)
+
+    now = time.time()
+    if previous is not None and previous != version_dir and previous.exists():
+        os.utime(previous, (now, now))
+    for old_dir in index_dir.parent.glob(f"{glob.escape(index_dir.name)}@*"):
+        if old_dir != version_dir and now - old_dir.stat().st_mtime > VERSION_GRACE_SECONDS:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    return version_dir
+
+
+def _corpus_dir() -> Path:
+    """テキストのパスの起点（cfg.path_corpus_dir、未設定なら PathManager.RAW_DATA_DIR）"""
+    return Path(cfg.path_corpus_dir) if cfg.path_corpus_dir else PathManager.RAW_DATA_DIR
+
+
+_attached: dict[Path, tuple[tuple[str, int, int], PathIndex]] = {}
+_attach_lock = threading.Lock()
+
+
+def _generation(index_dir: Path) -> tuple[str, int, int]:
+    """
+    インデックスの世代（リンク先の版付きディレクトリと keys.npy の inode・更新日時）。
+    保存・公開はリンクの差し替えで行うため、作り直されると必ず変わる。
+    """
+    version_dir = os.path.realpath(index_dir)
+    stat = os.stat(os.path.join(version_dir, "keys.npy"))
+    return version_dir, stat.st_ino, stat.st_mtime_ns
+
+
+def attach_path_index(index_dir: str | Path) -> PathIndex:
+    """
+    インデックスをプロセス内で1度だけ開いて返す（同じディレクトリなら同じインスタンス。スレッドセーフ）。
+    差分更新・再公開でリンクが差し替えられていれば開き直す（開いたままの古い mmap は参照が切れるまで有効）。
+    """
+    # リンク自体は解決せずにキーにする（解決すると版ごとに別のキーになり、差し替えに気づけない）
+    index_dir = Path(os.path.abspath(index_dir))
+    generation = _generation(index_dir)
+    with _attach_lock:
+        attached = _attached.get(index_dir)
+        if attached is None or attached[0] != generation:
+            attached = (generation, PathIndex(index_dir))
+            _attached[index_dir] = attached
+        return attached[1]
+
+
+def _manifest_digest(version_dir: Path) -> str:
+    """
+    インデックスの版を表すハッシュ（manifest.json のハッシュ。保存ごとに一意な version を含む）。
+    manifest.json のない旧形式のインデックスは keys.npy の inode・更新日時・サイズから求める。
+    """
+    manifest_path = version_dir / "manifest.json"
+    if manifest_path.exists():
+        content = manifest_path.read_bytes()
+    else:
+        stat = (version_dir / "keys.npy").stat()
+        content = f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}".encode()
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
+def publish_path_index(index_dir: str | Path, shared_dir: str | Path) -> PathIndex:
+    """
+    インデックスのファイルを shared_dir に複製して公開し、attach したインデックスを返す。
+    shared_dir を tmpfs（/dev/shm 配下など）に置くと、ディスクのページキャッシュから追い出されず、
+    すべてのプロセスが同じ物理メモリを mmap で参照する。
+
+    公開先は元のインデックスの manifest ハッシュを版とする版付きディレクトリ（{shared_dir}@{ハッシュ}）で、
+    shared_dir のリンクを差し替えて公開する。同じ版が公開済みなら複製しない。
+    複製と差し替えは shared_dir の書き込みロックの中で行うため、複数のプロセスが同時に呼んでも1回だけ複製される。
+    """
+    index_dir, shared_dir = Path(index_dir), Path(shared_dir)
+    # 元のリンクは1回だけ解決し、ハッシュを求めた版と同じ版を複製する
+    source_dir = Path(os.path.realpath(index_dir))
+    version = _manifest_digest(source_dir)
+    published_name = f"{shared_dir.name}@{version}"
+    if not (shared_dir.is_symlink() and os.readlink(shared_dir) == published_name):
+        with _writer_lock(shared_dir):
+            # ロックを待つ間に他のプロセスが公開していれば何もしない
+            if not (shared_dir.is_symlink() and os.readlink(shared_dir) == published_name):
+                tmp_dir = shared_dir.with_name(f"{shared_dir.name}.tmp-{os.getpid()}")
+                if tmp_dir.exists():
+                    shutil.rmtree(tmp_dir)
+                if not shared_dir.with_name(published_name).exists():
+                    shutil.copytree(source_dir, tmp_dir)
+                _swap_version(shared_dir, tmp_dir, version)
+                print(f"パスインデックスを公開しました: {shared_dir}（版: {version}）")
+    return attach_path_index(shared_dir)
+
+
+def load_path_array(num_path: str | Path = NUM_PATH) -> np.ndarray:
+    """
+    patent_path_numpy.npy を読み込む（memmap）。ファイルがない・壊れている場合は対処方法を含めたエラーにする。
+    """
+    num_path = Path(num_path)
+    if not num_path.exists():
+        raise FileNotFoundError(
+            f"パスインデックスの元データがありません: {num_path}\n"
+            "data/process_path.py → data/numpy_file.py の順に実行して作成してください。"
+        )
+    try:
+        return np.load(num_path, mmap_mode="r")
+    except ValueError as e:
+        raise ValueError(
+            f"パスインデックスの元データを読み込めません: {num_path}（{e}）\n"
+            "Git LFS のポインタファイルのままの場合は `git lfs pull` で実体を取得してください。"
+        ) from e
+
+
+def path_csv_types(path_dir: str | Path = PATH_DATA_DIR) -> set[str]:
+    """
+    path_dir にある *_path_XX.csv の種別（ファイル名の先頭。data/process_path.py が doc_id の末尾1文字で分ける）。
+    """
+    return {csv_file.name.split("_path_")[0] for csv_file in Path(path_dir).glob("*_path_*.csv")}
+
+
+def load_path_table() -> pd.DataFrame | np.ndarray:
+    """
+    インデックスの元データを読み込み、どちらを使ったかを表示する。
+    *_path_XX.csv が全種別（A/1/B/U）そろっていればCSVを使い（doc_id から doc_number を正規化でき、パスも保存できる）、
+    そうでなければ patent_path_numpy.npy（data/numpy_file.py が作る全種別の表）を使う。
+    一部の種別のCSVしかない場合は、その種別の文献だけのインデックスにならないよう、CSVは使わない
+    （npy も読めなければエラーにする）。
+    """
+    csv_types = path_csv_types(PATH_DATA_DIR)
+    missing_types = sorted(set(TYPE_MAPPING) - csv_types)
+    if csv_types and not missing_types:
+        print(f"パスインデックスの元データ: パス一覧のCSV（{PATH_DATA_DIR}/*_path_*.csv）")
+        return read_path_csvs(PATH_DATA_DIR)
+
+    if csv_types:
+        print(
+            f"警告: パス一覧のCSVに種別 {missing_types} がないため、CSV（{sorted(csv_types)}）は使いません。"
+            f"{NUM_PATH.name} から作成します。"
+        )
+    try:
+        path_array = load_path_array()
+    except (FileNotFoundError, ValueError) as e:
+        if not csv_types:
+            raise
+        raise ValueError(
+            f"パス一覧のCSVが一部の種別（{sorted(csv_types)}）しかなく、{NUM_PATH.name} も読み込めません。\n"
+            "data/process_path.py で全種別のCSVを作り直すか、patent_path_numpy.npy を用意してください。"
+        ) from e
+    print(f"パスインデックスの元データ: {NUM_PATH}")
+    return path_array
+
+
+def build_path_index() -> PathIndex:
+    """
+    cfg.path_index_dir にインデックスを作成する。cfg.path_corpus_dir を設定した場合はコーパスを
+    直接走査し（中間のCSVを経由しない。infra/index/path_indexer.py）、未設定なら load_path_table から作る。
+    （RAW_DATA_DIR にある result_X はサンプルのことがあるため、ディレクトリの有無では選ばない）
+    """
+    if cfg.path_corpus_dir:
+        from infra.index.path_indexer import update_path_index
+
+        return update_path_index(cfg.path_index_dir, cfg.path_corpus_dir, full=True)
+    return PathIndex.build(cfg.path_index_dir, load_path_table())
+
+
+def get_path_index() -> PathIndex:
+    """
+    プロセス共通のパスインデックスを返す（初回のみ開く。スレッドセーフ）。
+    インデックスの作成は時間がかかるため、ここでは行わない（なければ作成方法を含めたエラーにする）。
+    cfg.path_index_shared_dir を設定した場合は、そこに公開したインデックスを開く。
+    """
+    if not PathIndex.exists(cfg.path_index_dir):
+        raise FileNotFoundError(
+            f"パスインデックスがありません: {cfg.path_index_dir}\n"
+            "src で `uv run python -m infra.index.path_index` を実行して作成してください"
+            "（コーパスを走査する場合は cfg.path_corpus_dir を設定して `uv run python -m infra.index.path_indexer`）。"
+        )
+    if cfg.path_index_shared_dir:
+        return publish_path_index(cfg.path_index_dir, cfg.path_index_shared_dir)
+    return attach_path_index(cfg.path_index_dir)
+
+
+if __name__ == "__main__":
+    build_path_index()
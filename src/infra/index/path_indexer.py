@@ -0,0 +1,116 @@
+"""
+パスインデックスの差分更新モジュール
+
+コーパス（cfg.path_corpus_dir/result_X/{チャンク}/{doc_id}/text.txt）に文献が追加・削除されるたびに
+200万件のディレクトリを走査し直してインデックスを作り直す代わりに、チャンクディレクトリごとの
+更新日時（st_mtime_ns）をインデックスの manifest.json に記録しておき、
+新しく増えた・更新日時が変わったチャンクディレクトリだけを走査して、ソート済み配列に差分をマージします。
+
+チャンクディレクトリの更新日時は、直下の doc_id ディレクトリが追加・削除・改名されると変わる。
+文献の中身（text.txt）の書き換えはパスに影響しないため、対象にしない。
+
+全件の作成も同じ経路で行う（data/process_path.py → add_table_name.py → modify_doc_mumber.py →
+numpy_file.py の順にCSVを書き直す代わりに、走査ワーカーが doc_id を整数列に変換し、
+親プロセスでソートしてインデックスの .npy を直接書き出す）。
+
+manifest.json:
+    {"data_dir": "/.../data", "chunks": {"result_1/0": 1712345678901234567, ...}}
+
+実行方法（srcディレクトリで、cfg.path_corpus_dir を設定してから。manifest がなければ全件を走査して作成、--full で全件を作り直す）:
+    uv run python -m infra.index.path_indexer
+    uv run python -m infra.index.path_indexer --full
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from infra.config import cfg
+from infra.index.path_index import EncodedPaths, PathIndex
+
+
+def list_chunk_dirs(data_dir: str | Path) -> dict[str, int]:
+    """
+    data_dir 配下のチャンクディレクトリを列挙し、{"result_X/{チャンク}": 更新日時（ns）} を返す。
+    """
+    chunks: dict[str, int] = {}
+    with os.scandir(data_dir) as table_entries:
+        for table_entry in table_entries:
+            if not (table_entry.name.startswith("result_") and table_entry.is_dir()):
+                continue
+            with os.scandir(table_entry.path) as chunk_entries:
+                for chunk_entry in chunk_entries:
+                    if chunk_entry.name.isdigit() and chunk_entry.is_dir():
+                        chunks[f"{table_entry.name}/{chunk_entry.name}"] = chunk_entry.stat().st_mtime_ns
+    return chunks
+
+
+def _chunk_id(chunk: str) -> tuple[int, int]:
+    """"result_X/{チャンク}" → (X, チャンク)"""
+    table, chunk_dir = chunk.split("/")
+    return int(table.removeprefix("result_")), int(chunk_dir)
+
+
+def scan_chunk(data_dir: str, chunk: str) -> EncodedPaths:
+    """
+    チャンクディレクトリ直下の doc_id ディレクトリを列挙し、整数列と詰めた doc_id に変換して返す。
+    ProcessPoolExecutor のワーカーで実行する（親プロセスへは数個の numpy 配列だけを送る）。
+    """
+    with os.scandir(os.path.join(data_dir, chunk)) as entries:
+        doc_ids = [entry.name for entry in entries if entry.is_dir()]
+    return EncodedPaths.from_doc_ids(doc_ids, *_chunk_id(chunk))
+
+
+def scan_chunks(data_dir: str | Path, chunks: list[str], max_workers: int | None = None) -> EncodedPaths:
+    """
+    チャンクディレクトリを複数プロセスで走査し、PathIndex.build / merge に渡す EncodedPaths を返す。
+    doc_id の正規化（主キー・type への変換）もワーカーで行うため、中間のCSVを経由しない。
+    """
+    if not chunks:
+        return EncodedPaths.concat([])
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        parts = list(executor.map(partial(scan_chunk, str(data_dir)), chunks, chunksize=16))
+    return EncodedPaths.concat(parts)
+
+
+def update_path_index(
+    index_dir: str | Path | None = None,
+    data_dir: str | Path | None = None,
+    full: bool = False,
+) -> PathIndex:
+    """
+    manifest.json と現在のチャンクディレクトリの更新日時を比べ、変わった分だけを走査してインデックスに反映する。
+    インデックス・manifest がない場合、data_dir が変わった場合、full=True の場合は全件を走査して作り直す。
+    data_dir を省略した場合は cfg.path_corpus_dir を使う（どちらもなければ ValueError）。
+    """
+    index_dir = Path(index_dir if index_dir is not None else cfg.path_index_dir)
+    data_dir = data_dir if data_dir is not None else cfg.path_corpus_dir
+    if not data_dir:
+        raise ValueError("走査するコーパスが指定されていません。cfg.path_corpus_dir を設定してください。")
+    data_dir = Path(data_dir)
+    current = list_chunk_dirs(data_dir)
+    manifest = {"data_dir": str(data_dir), "chunks": current}
+
+    index = PathIndex(index_dir) if PathIndex.exists(index_dir) else None
+    previous = index.load_manifest() if index is not None and index.has_paths else None
+    if full or previous is None or previous.get("data_dir") != str(data_dir):
+        print(f"パスインデックスを作成します: {len(current):,}チャンクを走査（{data_dir}）")
+        return PathIndex.build(index_dir, scan_chunks(data_dir, sorted(current)), manifest=manifest)
+
+    previous_chunks = previous["chunks"]
+    changed = sorted(chunk for chunk, mtime in current.items() if previous_chunks.get(chunk) != mtime)
+    deleted = sorted(chunk for chunk in previous_chunks if chunk not in current)
+    if not changed and not deleted:
+        print(f"パスインデックスは最新です: {index_dir}（{len(index):,}件）")
+        return index
+
+    print(f"パスインデックスを差分更新します: 変更 {len(changed):,}チャンク, 削除 {len(deleted):,}チャンク")
+    # 変わったチャンクは一度すべて除き、走査し直した内容で入れ直す
+    removed_chunks = [_chunk_id(chunk) for chunk in changed + deleted]
+    return index.merge(removed_chunks, scan_chunks(data_dir, changed), manifest=manifest)
+
+
+if __name__ == "__main__":
+    update_path_index(full="--full" in sys.argv[1:])
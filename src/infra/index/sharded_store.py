@@ -0,0 +1,143 @@
+"""
+シャード分割したベクトルストアモジュール
+
+430万件のナレッジを1つのChromaコレクションに入れると、1プロセスのメモリに収まらず検索も遅くなるため、
+result_X テーブル単位や公開年単位でChromaを分割（シャード）します。
+
+- 検索: 全シャードにスレッドプールで並列にクエリを投げ（scatter）、各シャードの上位k件をヒープでマージ（gather）する
+- 構築: シャードごとに独立して構築・再構築できる（取り込みもシャード単位で並列化できる）
+  再構築は新しい版のディレクトリに書き、完了してから差し替える（構築中・失敗時も古い版で検索できる）
+
+ディスク構成:
+    {root_dir}/
+        table=1@{版}/  Chromaの永続ディレクトリ（result_1。版は構築開始時刻のns）
+            .complete  構築完了マーカー（最後に書く。ないディレクトリは構築途中とみなしてロードしない）
+        table=2@{版}/
+        ...
+        year=2010@{版}/ （shard_by="year" の場合）
+    同じシャードの版が複数あれば、完了している最新の版をロードする。
+"""
+
+import heapq
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings.embeddings import Embeddings
+
+SHARD_BY_OPTIONS = ("table", "year")
+
+_TABLE_PATTERN = re.compile(r"result_(\d+)")
+_YEAR_PATTERN = re.compile(r"^JP((?:19|20)\d{2})\d{6}[A-Z]")
+
+# シャードの構築完了マーカー
+COMPLETE_MARKER = ".complete"
+
+
+def shard_key(path: str | Path, shard_by: str) -> str:
+    """
+    ナレッジのパス（.../result_X/{チャンク}/{doc_id}/text.txt）からシャードキーを求める。
+    XMLを読まずに決まるので、ロード前にパスをシャードへ振り分けられる。
+    """
+    path = Path(path)
+    if shard_by == "table":
+        match = _TABLE_PATTERN.search(path.as_posix())
+        return f"table={match.group(1) if match else 'other'}"
+    elif shard_by == "year":
+        # 公開番号に西暦を含む公開特許（JP2010000001A）は公開年、登録番号（JP5752307B など）は "registered"
+        match = _YEAR_PATTERN.match(path.parent.name)
+        return f"year={match.group(1) if match else 'registered'}"
+    else:
+        raise ValueError(f"未定義のシャード分割方法です: {shard_by}")
+
+
+def _shard_version(shard_dir: Path) -> int:
+    """
+    シャードのディレクトリ名（{キー}@{版}）の版。版のない旧形式のディレクトリは最も古い版（-1）とする。
+    """
+    version = shard_dir.name.partition("@")[2]
+    return int(version) if version.isdigit() else -1
+
+
+class ShardedChroma:
+    """
+    複数のChroma（シャード）を1つのベクトルストアのように検索するクラスです。
+    Retrieverが使うChromaのメソッド（similarity_search_with_relevance_scores、ID指定のget）に対応します。
+    """
+
+    def __init__(self, root_dir: str | Path, embeddings: Embeddings, max_workers: int = 8):
+        self.root_dir = Path(root_dir)
+        self.embeddings = embeddings
+        self.max_workers = max_workers
+        self.shards: dict[str, Chroma] = {}
+        self.shard_dirs: dict[str, Path] = {}
+        if self.root_dir.exists():
+            for shard_dir in sorted(self.root_dir.iterdir(), key=_shard_version):
+                key = shard_dir.name.partition("@")[0]
+                # 構築途中で止まった版（マーカーなし）はロードしない。版の昇順なので、最新の完了した版が残る
+                if shard_dir.is_dir() and "=" in key and (shard_dir / COMPLETE_MARKER).exists():
+                    self.shard_dirs[key] = shard_dir
+            for key, shard_dir in self.shard_dirs.items():
+                self.shards[key] = Chroma(persist_directory=str(shard_dir), embedding_function=embeddings)
+
+    def build_shard(self, key: str, documents: list[Document], ids: list[str]) -> Chroma:
+        """
+        1シャード分のChromaを新しい版のディレクトリに構築し、完了したら既存のシャードと差し替える。
+        他のシャードには触れないため、シャードごとに並列で実行できる。
+        構築中は古い版で検索を続け、構築に失敗した場合は新しい版を消して古い版を残す。
+        完了マーカーは書き込みが終わってから最後に作り、古い版は差し替えた後に削除する。
+        """
+        shard_dir = self.root_dir / f"{key}@{time.time_ns()}"
+        shard_dir.mkdir(parents=True)
+        try:
+            shard = Chroma.from_documents(
+                documents=documents, embedding=self.embeddings, ids=ids, persist_directory=str(shard_dir)
+            )
+        except BaseException:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+            raise
+        (shard_dir / COMPLETE_MARKER).touch()
+
+        self.shards[key] = shard
+        self.shard_dirs[key] = shard_dir
+        # 同じシャードの古い版（と、途中で止まった古い構築）を削除する
+        for old_dir in self.root_dir.iterdir():
+            if old_dir.name.partition("@")[0] == key and _shard_version(old_dir) < _shard_version(shard_dir):
+                shutil.rmtree(old_dir, ignore_errors=True)
+        return shard
+
+    def shard_ids(self, key: str) -> list[str]:
+        """
+        シャードに格納済みのチャンクIDを返す（シャードがなければ空）。
+        """
+        shard = self.shards.get(key)
+        return shard.get(include=[])["ids"] if shard is not None else []
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """
+        全シャードを並列に検索し、関連度スコアの上位k件をマージして返す。
+        （クエリ埋め込みはキャッシュされるので、埋め込みAPIの呼び出しは1回で済む）
+        """
+        if not self.shards:
+            return []
+        # 先にクエリ埋め込みをキャッシュへ載せ、各シャードから同時にAPIを呼ばないようにする
+        self.embeddings.embed_query(query)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.shards))) as executor:
+            results = executor.map(lambda shard: shard.similarity_search_with_relevance_scores(query, k=k), self.shards.values())
+            return heapq.nlargest(k, (hit for hits in results for hit in hits), key=lambda hit: hit[1])
+
+    def get(self, ids: list[str], include: list[str]) -> dict:
+        """
+        ID指定で全シャードからチャンクを取得し、Chroma.get と同じ形式の辞書で返す。
+        """
+        merged: dict[str, list] = {"ids": [], **{field: [] for field in include}}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(self.shards), 1))) as executor:
+            for result in executor.map(lambda shard: shard.get(ids=ids, include=include), self.shards.values()):
+                merged["ids"].extend(result["ids"])
+                for field in include:
+                    merged[field].extend(result[field] if result[field] is not None else [])
+        return merged
@@ -4,8 +4,8 @@ LLM data loader module
 This module provides functions to prepare patent data for LLM processing.
 """
 
-import re
 import json
+import functools
 import streamlit as st
 from dataclasses import asdict
 from pathlib import Path
@@ -13,12 +13,14 @@ from typing import Dict, Any
 import pandas as pd
 from model.patent import Patent
 from ui.gui.utils import format_patent_number_for_bigquery
-from ui.gui.utils import normalize_patent_id
+from model.patent_number import lookup_keys
 from bigquery.patent_lookup import find_documents_batch, get_abstract_claims_by_query
 from llm.llm_pipeline import llm_entry
 from infra.loader.common_loader import CommonLoader
 from bigquery.search_path_from_file import search_path
-from infra.config import PathManager, DirNames
+from infra.config import PathManager, DirNames, cfg
+from infra.doc_store import DocStore
+from app.reranker import Reranker, create_reranker
 
 
 # 本番では変更
@@ -46,6 +48,10 @@ def entry(action=None):
     save_abstract_claims_query(query, doc_number)
     query_patent_number_a = format_patent_number_for_bigquery(query)
     abstraccts_claims_list = load_patent_b(query_patent_number_a, doc_number)
+    if abstraccts_claims_list is None:
+        # 類似特許検索が完了していない（中止した・まだ実行していない）場合は topk のCSVがない
+        st.error(f"❌ 類似特許の検索結果（{query_patent_number_a}.csv）がありません。先にステップ2で検索を完了してください。")
+        return None
     results = llm_execution(abstraccts_claims_list, doc_number)
     return results
     
@@ -124,7 +130,7 @@ def load_patent_b(patent_number_a: Patent, doc_number: str):
         doc_number: 特許公開番号
 
     Returns:
-        Patent: 読み込んだPatent Bのオブジェクト
+        list[dict] | None: 先行技術の要約・請求項のリスト。topk のCSVがなければNone
     """
     # PathManagerを使用してtopkディレクトリを取得
     topk_dir = PathManager.get_topk_results_path(doc_number)
@@ -142,9 +148,15 @@ def load_patent_b(patent_number_a: Patent, doc_number: str):
         return None
 
     df = pd.read_csv(csv_file_path)
-    top_k_df = search_path(df, top_k=TOP_K)
 
-    abstraccts_claims_list =get_abstract_claims_by_query(top_k_df)
+    # 再ランキングする場合は、多めに候補を取得してからTOP_K件に絞り込む
+    reranker = _get_reranker()
+    fetch_k = max(cfg.rerank_fetch_k, TOP_K) if reranker else TOP_K
+    top_k_df = search_path(df, top_k=fetch_k)
+
+    abstraccts_claims_list = load_abstract_claims(top_k_df)
+    if reranker:
+        abstraccts_claims_list = rerank_abstract_claims(reranker, abstraccts_claims_list, doc_number)
 
     json_file_name = f"top_k_{patent_number_a}.json"
 
@@ -157,6 +169,102 @@ def load_patent_b(patent_number_a: Patent, doc_number: str):
 
     return abstraccts_claims_list
 
+@functools.cache
+def _get_doc_store() -> DocStore | None:
+    """ローカル文書ストアを1度だけ開く（未構築ならNone）"""
+    if not Path(cfg.doc_store_path).exists():
+        return None
+    return DocStore(cfg.doc_store_path)
+
+
+def load_abstract_claims(top_k_df: pd.DataFrame) -> list:
+    """
+    search_path の結果について、各文献の要約・請求項を取得する。
+    ローカル文書ストア（infra/doc_store.py）→ パスインデックスが指す text.txt（path 列）の順に引き、
+    どちらにもなかった文献だけをBigQueryから取得する。
+
+    Returns:
+        [{"doc_number", "abstract", "claims", "top_k"}, ...]（top_k の昇順）
+    """
+    # 順位は最初に現れた行で決める（get_abstract_claims_by_query と同じ）
+    rank_by_number = {}
+    for rank, number in enumerate(top_k_df['number'], start=1):
+        rank_by_number.setdefault(number, rank)
+
+    abstraccts_claims_list = []
+    missing_df = top_k_df[top_k_df['table_name'].notna()]
+
+    doc_store = _get_doc_store()
+    if doc_store is not None:
+        found = doc_store.get_many(zip(missing_df['table_name'], missing_df['number']))
+        for row in found.values():
+            abstraccts_claims_list.append(
+                {"doc_number": row["doc_number"], "abstract": row["abstract"], "claims": row["claims"], "top_k": rank_by_number[row["doc_number"]]}
+            )
+        missing_df = missing_df[~missing_df['number'].isin({row["doc_number"] for row in found.values()})]
+
+    if 'path' in missing_df.columns:
+        local_rows = _load_abstract_claims_from_text(missing_df)
+        for row_dict in local_rows:
+            row_dict["top_k"] = rank_by_number[row_dict["doc_number"]]
+            abstraccts_claims_list.append(row_dict)
+        missing_df = missing_df[~missing_df['number'].isin({row_dict["doc_number"] for row_dict in local_rows})]
+
+    if not missing_df.empty:
+        print(f"ローカルにない{missing_df['number'].nunique()}件をBigQueryから取得します")
+        for row_dict in get_abstract_claims_by_query(missing_df):
+            row_dict["top_k"] = rank_by_number[row_dict["doc_number"]]
+            abstraccts_claims_list.append(row_dict)
+
+    abstraccts_claims_list.sort(key=lambda row_dict: row_dict["top_k"])
+    return abstraccts_claims_list
+
+
+def _load_abstract_claims_from_text(top_k_df: pd.DataFrame) -> list:
+    """
+    path 列（data/result_X/{チャンク}/{doc_id}/text.txt）が存在する文献を CommonLoader で読み込む。
+    """
+    loader = CommonLoader()
+    rows = []
+    for number, path in dict(zip(top_k_df['number'], top_k_df['path'])).items():
+        if not isinstance(path, str) or not Path(path).exists():
+            continue
+        try:
+            patent = loader.run(path)
+        except Exception as e:
+            print(f"text.txt の読み込みに失敗したため、BigQueryから取得します: {path} ({e})")
+            continue
+        rows.append({"doc_number": number, "abstract": patent.abstract, "claims": patent.claims})
+    return rows
+
+
+@functools.cache
+def _get_reranker() -> Reranker | None:
+    """再ランキング器を1度だけ生成する（スコアのキャッシュをStreamlitの再実行間で共有するため）"""
+    return create_reranker()
+
+
+def _abstract_claims_text(row_dict) -> str:
+    """要約と請求項を、再ランキング用の1つの文字列にまとめる"""
+    claims = row_dict.get("claims") or ""
+    if isinstance(claims, list):
+        claims = "\n".join(claims)
+    return f"{row_dict.get('abstract') or ''}\n{claims}"
+
+
+def rerank_abstract_claims(reranker: Reranker, abstraccts_claims_list, doc_number: str):
+    """
+    先行技術の候補を、queryの要約・請求項との関連度で再ランキングし、上位TOP_K件を返す
+    """
+    query_json_dict = read_json("q", doc_number)
+    if not query_json_dict:
+        return abstraccts_claims_list[:TOP_K]
+
+    candidates = [(row_dict["doc_number"], _abstract_claims_text(row_dict)) for row_dict in abstraccts_claims_list]
+    order = reranker.rerank(_abstract_claims_text(query_json_dict), candidates, TOP_K)
+    return [abstraccts_claims_list[i] for i in order]
+
+
 def save_abstract_claims_as_json(abstract_claims_list_dict, query_doc_number: str):
     """abstract_claims_list_dictをJSONファイルとして保存する"""
     # PathManagerを使用してabstract_claimsディレクトリを取得
@@ -192,59 +300,25 @@ def get_abstract_claims(found_lookup):
     abstract_claim_list_dict = get_abstract_claims_by_query(result_table_dict)
     return abstract_claim_list_dict
 
-def find_document(publication_numbers, year_parts):
-    target_lookup_entries = find_documents_batch(publication_numbers)
-    # target_lookup_entriesを辞書に変換し、dataframeにする
-    df_lookup_entries = pd.DataFrame(target_lookup_entries)
-    # 下のアルゴリズムをdataframeで実装する
-    # doc_number の列に publication_numbersが含まれるものを探す
-    # Noneを除外
-    publication_numbers = [num for num in publication_numbers if num is not None]
+def find_document(publication_numbers):
+    """
+    BigQueryの公開番号（例: "JP-H084831-A"）から、patent_lookup の行（result_table, doc_number, path）を求める。
+    公開番号ごとの完全一致キーをまとめて1回のクエリで引き、キーの優先順で対応付ける。
+    """
+    keys_by_number = {number: lookup_keys(number) for number in publication_numbers if number is not None}
+    all_keys = sorted({key for keys in keys_by_number.values() for key in keys})
+    if not all_keys:
+        return []
+    entries_by_key = {entry["doc_number"]: entry for entry in find_documents_batch(all_keys)}
 
     final_lookup_entrys = []
-    for pub_num, year in zip(publication_numbers, year_parts):
-        found_df = df_lookup_entries[df_lookup_entries['doc_number'].str.contains(pub_num, na=False)]
-        if len(found_df) == 0:
-            continue
-        if len(found_df) == 1:
-            final_lookup_entrys.append(found_df.iloc[0].to_dict())
-            continue
-        # 複数ヒットした場合、yearでフィルタリング
-        if year is not None:
-            print(found_df.head())
-            found_df_year = found_df[found_df['doc_number'].str.contains(year, na=False)]
-            if len(found_df_year) > 0:
-                final_lookup_entrys.append(found_df_year.iloc[0].to_dict())
-                continue
-            else:
-                # yearが和暦であれば西暦に変換して再度試す
-                imperial = re.match(r'^[HSR]\d{2}$', year)
-                if imperial:
-                    era = imperial.group()[0]
-                    year_num = int(imperial.group()[1:])
-                    if era == 'S': year = 1925 + year_num
-                    elif era == 'H': year = 1988 + year_num
-                    elif era == 'R': year = 2018 + year_num
-
-                # データフレームの doc_number から '年' (先頭4桁) を抽出して整数化
-                # エラー処理: 数字でないものが混ざっている場合に備えて coerce を使用
-                found_df['extracted_year'] = pd.to_numeric(found_df['doc_number'].str[:4], errors='coerce')
-                
-                # ターゲットの年 (int化)
-                target_year = int(year)
-                
-                # 「年号の差（絶対値）」を計算
-                found_df['year_diff'] = (found_df['extracted_year'] - target_year).abs()
-                
-                # 年の差が小さい順にソート
-                sorted_df = found_df.sort_values('year_diff')
-                
-                # 最も近い候補を取得
-                best_match = sorted_df.iloc[0]
-                final_lookup_entrys.append(best_match.to_dict())
+    for keys in keys_by_number.values():
+        for key in keys:
+            if key in entries_by_key:
+                final_lookup_entrys.append(entries_by_key[key])
+                break
     return final_lookup_entrys
 
-
 if __name__ == "__main__":
     #entry()
     # llm_execution(1)
@@ -0,0 +1,308 @@
+"""
+特許番号の正規化モジュール
+
+BigQueryの公開番号（publication_number, 例: "JP-2012040876-A", "JP-H084831-A", "JP-5021568-B2"）と、
+XMLやpatent_lookupテーブルの文献番号（doc_number, 例: "2012040876"）を相互に対応付けるための、
+完全一致で引けるキーを作ります。LIKE '%…%' による部分一致検索の代わりに使います。
+
+    canonicalize("JP2012040876A")       -> "JP-2012040876-A"
+    lookup_keys("JP-H084831-A")         -> ["1996004831", "H08004831"]
+    lookup_keys("JP-WO2014030240-A1")   -> ["2014030240"]
+    lookup_keys("JP-5021568-B2")        -> ["5021568"]
+
+大量の公開番号（top-k の検索結果、コーパスのパス一覧など）は parse_publication_numbers で一括に解析します。
+
+公開番号の解析はすべてこのモジュールで行います（GUIの normalize_patent_id / parse_patent_info、
+data/process_path.py の extract_info、search_path も同じキーを使う）。正規表現はモジュールの読み込み時に
+1度だけコンパイルし、1件ずつの解析（parse_publication_number, split_number, number_keys, publication_key,
+kind_code_from_label）は LRU キャッシュで同じ番号の再解析を省きます。
+
+実行方法（srcディレクトリで、往復変換のセルフテスト）:
+    uv run python -m model.patent_number
+"""
+
+import functools
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# 和暦の元年の前年（西暦 = オフセット + 和暦年）
+ERA_OFFSETS = {"M": 1867, "T": 1911, "S": 1925, "H": 1988, "R": 2018}
+
+_PUBLICATION_NUMBER_PATTERN = re.compile(r"^(?P<country>[A-Z]{2})-?(?P<number>WO\d+|[MTSHR]\d+|\d+)-?(?P<kind>[A-Z]\d?)$")
+_WO_PATTERN = re.compile(r"^WO(\d{4})(\d+)$")
+_ERA_PATTERN = re.compile(r"^([MTSHR])(\d{2})(\d+)$")
+_WESTERN_PATTERN = re.compile(r"^((?:19|20)\d{2})(\d{6,})$")
+# parse_publication_numbers 用（_PUBLICATION_NUMBER_PATTERN と同じ形を、番号部分の種類ごとに分けて取り出す）
+_SERIES_PATTERN = re.compile(
+    r"^(?P<country>[A-Z]{2})-?"
+    r"(?P<number>WO(?P<wo_year>\d{4})(?P<wo_serial>\d+)|(?P<era>[MTSHR])(?P<era_year>\d{2})(?P<era_serial>\d+)|(?P<digits>\d+))"
+    r"-?(?P<kind>[A-Z]\d?)$"
+)
+# XMLの kind（例: "公開特許公報(A)", "特許公報(B2)"）の括弧内の種別コード
+_KIND_LABEL_PATTERN = re.compile(r"\(([A-Z]\d?)\)")
+
+# 1件ずつの解析結果を覚えておく件数（top-k 1回分の公開番号が収まる大きさ）
+_SCALAR_CACHE_SIZE = 65536
+
+
+@dataclass(frozen=True)
+class PublicationNumber:
+    """
+    公開番号を 国コード・番号・種別コード に分解したもの。
+    """
+
+    country: str  # "JP"
+    number: str  # BigQueryでの番号部分（例: "2012040876", "H084831", "WO2014030240", "5021568"）
+    kind: str  # 種別コード（例: "A", "B2", "U", "Y2"）
+
+    @property
+    def canonical(self) -> str:
+        """BigQueryの publication_number 形式（例: "JP-2012040876-A"）"""
+        return f"{self.country}-{self.number}-{self.kind}"
+
+    @property
+    def kind_type(self) -> str:
+        """種別コードの先頭1文字（"A", "B", "U", "Y" など）"""
+        return self.kind[:1]
+
+    @property
+    def compact(self) -> str:
+        """ハイフンなしの公開番号（例: "JP2012040876A"。コーパスのディレクトリ名の形）"""
+        return f"{self.country}{self.number}{self.kind}"
+
+    @property
+    def document_type(self) -> str:
+        """コーパスの文献種別（再公表 A1 は "1"、それ以外は種別コードの先頭1文字）"""
+        return document_type(self.kind)
+
+
+@dataclass(frozen=True)
+class NumberParts:
+    """
+    公開番号の番号部分を 形式・年・連番 に分解したもの。
+    """
+
+    style: str  # "wo"（WO2014030240）, "era"（H084831）, "western"（2012040876）, "registration"（5021568）
+    serial: str  # 連番（0埋めしない。例: "4831"）
+    year: str | None = None  # wo・western は西暦4桁、era は和暦2桁、registration は None
+    era: str | None = None  # 元号の頭文字（era のみ）
+
+    @property
+    def western_year(self) -> int | None:
+        """西暦の年（registration は None）"""
+        if self.style == "era":
+            return western_year(self.era, int(self.year))
+        return int(self.year) if self.year is not None else None
+
+
+@functools.lru_cache(maxsize=_SCALAR_CACHE_SIZE)
+def parse_publication_number(patent_id: str) -> PublicationNumber | None:
+    """
+    "JP-2012040876-A"、"JP2012040876A" などの公開番号を分解する（解釈できなければNone）。
+    """
+    if not patent_id:
+        return None
+    match = _PUBLICATION_NUMBER_PATTERN.match(patent_id.strip().upper())
+    if not match:
+        return None
+    return PublicationNumber(match.group("country"), match.group("number"), match.group("kind"))
+
+
+def canonicalize(patent_id: str) -> str | None:
+    """
+    公開番号をBigQueryの publication_number 形式に揃える（解釈できなければNone）。
+    """
+    parsed = parse_publication_number(patent_id)
+    return parsed.canonical if parsed else None
+
+
+def document_type(kind: str) -> str:
+    """
+    種別コード → コーパスの文献種別（ディレクトリ名の末尾1文字。"A1" → "1"、"B2" → "B"）。
+    """
+    return "1" if kind == "A1" else kind[:1]
+
+
+@functools.lru_cache(maxsize=_SCALAR_CACHE_SIZE)
+def kind_code_from_label(label: str | None) -> str | None:
+    """
+    XMLの kind（例: "公開特許公報(A)", "特許公報(B2)"）から種別コードを取り出す（なければNone）。
+    """
+    match = _KIND_LABEL_PATTERN.search(label or "")
+    return match.group(1) if match else None
+
+
+def western_year(era: str, era_year: int) -> int:
+    """
+    和暦（元号の頭文字と年）を西暦に変換する（例: ("H", 8) -> 1996）。
+    """
+    return ERA_OFFSETS[era] + era_year
+
+
+@functools.lru_cache(maxsize=_SCALAR_CACHE_SIZE)
+def split_number(number: str) -> NumberParts | None:
+    """
+    公開番号の番号部分を 形式・年・連番 に分解する（解釈できなければNone）。
+    """
+    match_wo = _WO_PATTERN.match(number)
+    if match_wo:
+        return NumberParts("wo", match_wo.group(2), year=match_wo.group(1))
+
+    match_era = _ERA_PATTERN.match(number)
+    if match_era:
+        return NumberParts("era", match_era.group(3), year=match_era.group(2), era=match_era.group(1))
+
+    match_western = _WESTERN_PATTERN.match(number)
+    if match_western:
+        return NumberParts("western", match_western.group(2), year=match_western.group(1))
+
+    if number.isdigit():
+        return NumberParts("registration", number)
+    return None
+
+
+@functools.lru_cache(maxsize=_SCALAR_CACHE_SIZE)
+def _number_keys(number: str) -> tuple[str, ...]:
+    parts = split_number(number)
+    if parts is None:
+        return ()
+    if parts.style == "wo":
+        return (parts.year + parts.serial.zfill(6),)
+    if parts.style == "era":
+        serial = parts.serial.zfill(6)
+        # 和暦の文献は、doc_number が西暦年・和暦年のどちらで記録されていても引けるよう両方を返す
+        return (f"{parts.western_year}{serial}", f"{parts.era}{parts.year}{serial}")
+    if parts.style == "western":
+        return (parts.year + parts.serial,)
+    return (number,)
+
+
+def number_keys(number: str) -> list[str]:
+    """
+    公開番号の番号部分から、doc_number と完全一致で照合するキーを作る。
+    先頭のキーが主キー（西暦4桁 + 0埋め6桁、または登録番号そのまま）。
+    """
+    # キャッシュした結果を呼び出し側が書き換えても壊れないよう、タプルからリストを作り直して返す
+    return list(_number_keys(number))
+
+
+def lookup_keys(patent_id: str) -> list[str]:
+    """
+    公開番号から、doc_number と完全一致で照合するキーを作る（解釈できなければ空リスト）。
+    """
+    parsed = parse_publication_number(patent_id)
+    return number_keys(parsed.number) if parsed else []
+
+
+def publication_key(patent_id: str) -> str | None:
+    """
+    公開番号（またはコーパスの doc_id, 例: "JP2010035913A"）から doc_number の主キーを返す（解釈できなければNone）。
+    parse_publication_numbers の key 列と同じ値になる。
+    """
+    parsed = parse_publication_number(patent_id)
+    keys = _number_keys(parsed.number) if parsed else ()
+    return keys[0] if keys else None
+
+
+def parse_publication_numbers(patent_ids: pd.Series) -> pd.DataFrame:
+    """
+    公開番号の Series を一括で分解する（parse_publication_number + number_keys の先頭キーのベクトル版）。
+
+    Returns:
+        country, number, kind, key, document_type 列の DataFrame（元の Series と同じインデックス）。
+        key は doc_number と照合する主キー（西暦4桁 + 0埋め6桁、または登録番号そのまま）。
+        document_type はコーパスの文献種別（document_type() と同じ）。解釈できない行はすべての列が NaN
+    """
+    parsed = patent_ids.astype(str).str.strip().str.upper().str.extract(_SERIES_PATTERN).astype(object)
+
+    key = parsed["digits"].copy()
+    wo = parsed["wo_year"].notna()
+    key[wo] = parsed.loc[wo, "wo_year"] + parsed.loc[wo, "wo_serial"].str.zfill(6)
+    era = parsed["era"].notna()
+    if era.any():
+        years = parsed.loc[era, "era"].map(ERA_OFFSETS) + parsed.loc[era, "era_year"].astype(int)
+        key[era] = years.astype(str) + parsed.loc[era, "era_serial"].str.zfill(6)
+
+    kind = parsed["kind"]
+    return pd.DataFrame({
+        "country": parsed["country"],
+        "number": parsed["number"],
+        "kind": kind,
+        "key": key,
+        "document_type": kind.str[:1].where(kind != "A1", "1"),
+    })
+
+
+def candidate_publication_numbers(doc_number: str, kind: str | None = None, country: str = "JP") -> list[str]:
+    """
+    XMLの doc_number（と種別コード）から、BigQueryの publication_number の候補を優先順に作る。
+    候補は完全一致（IN UNNEST）やローカルの対応表で照合する。
+    """
+    doc_number = re.sub(r"[^0-9A-Z]", "", (doc_number or "").upper())
+    numbers = [doc_number]
+    # 2000年より前の公開番号は和暦（例: 1996004831 -> H084831）でBigQueryに登録されている
+    match_western = _WESTERN_PATTERN.match(doc_number)
+    if match_western and int(match_western.group(1)) < 2000:
+        year, serial = int(match_western.group(1)), str(int(match_western.group(2)))
+        era = "H" if year >= 1989 else "S"
+        numbers.append(f"{era}{year - ERA_OFFSETS[era]:02d}{serial}")
+
+    kinds = ([kind] if kind else []) + [k for k in ("A", "B2", "B1", "A1", "U", "Y2") if k != kind]
+    return [f"{country}-{number}-{kind_code}" for number in numbers for kind_code in kinds]
+
+
+def _self_test(n_random: int = 20000, seed: int = 0):
+    """
+    往復変換のセルフテスト（1件ずつの解析と一括の解析が一致すること、キー ↔ 公開番号が往復できること）。
+    """
+    samples = {
+        "JP-2012040876-A": "2012040876",
+        "JP2012040876A": "2012040876",
+        "JP-H084831-A": "1996004831",
+        "JP-S606174-Y2": "1985006174",
+        "JP-WO2014030240-A1": "2014030240",
+        "JP-5021568-B2": "5021568",
+        "jp-r02123456-a": "2020123456",
+    }
+    for patent_id, key in samples.items():
+        assert publication_key(patent_id) == key, (patent_id, publication_key(patent_id))
+    assert publication_key("JP-INVALID-FMT") is None
+    assert number_keys("H084831") == ["1996004831", "H08004831"]
+    assert kind_code_from_label("特許公報(B2)") == "B2" and kind_code_from_label(None) is None
+
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(["A", "A1", "B1", "B2", "U", "Y2"], size=n_random)
+    years = rng.integers(1989, 2025, size=n_random)
+    serials = rng.integers(1, 10**6, size=n_random)
+    patent_ids = []
+    for kind, year, serial in zip(kinds.tolist(), years.tolist(), serials.tolist()):
+        if kind == "A1":
+            number = f"WO{year}{serial:06d}"
+        elif kind[0] in "BY":
+            number = str(serial + 5_000_000)
+        elif year < 2000:
+            number = f"H{year - ERA_OFFSETS['H']:02d}{serial}"
+        else:
+            number = f"{year}{serial:06d}"
+        patent_ids.append(f"JP-{number}-{kind}")
+
+    parsed = parse_publication_numbers(pd.Series(patent_ids + ["JP-INVALID-FMT"]))
+    assert parsed.iloc[-1].isna().all()
+    for row, patent_id in zip(parsed.itertuples(), patent_ids):
+        scalar = parse_publication_number(patent_id)
+        # 公開番号 → 分解 → 公開番号（ハイフンあり・なし）
+        assert scalar.canonical == patent_id and canonicalize(scalar.compact) == patent_id
+        # 1件ずつの解析と一括の解析が一致する
+        assert (row.country, row.number, row.kind) == (scalar.country, scalar.number, scalar.kind)
+        assert row.key == publication_key(patent_id) and row.document_type == scalar.document_type
+        # 主キー → 候補の公開番号 に元の公開番号が含まれる（和暦・西暦の往復）
+        if scalar.kind != "A1":
+            assert patent_id in candidate_publication_numbers(row.key, scalar.kind), patent_id
+    print(f"セルフテストに成功しました（{len(samples) + len(patent_ids):,}件）: {parse_publication_number.cache_info()}")
+
+
+if __name__ == "__main__":
+    _self_test()
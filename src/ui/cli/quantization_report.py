@@ -0,0 +1,132 @@
+"""
+ベクトル圧縮（次元削減・量子化）の評価レポートを出力します。
+
+現在のベクトルストア（Chromaのfloat32ベクトルの総当たり検索）を基準に、
+圧縮設定ごとの recall@k・メモリ使用量・検索レイテンシを比較します。
+正解データは eval/rag_output_with_TF.csv（is_correct=True の query_id, knowledge_id の組）を使います。
+
+実行方法（srcディレクトリで）:
+    uv run python -m ui.cli.quantization_report
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.retriever import Retriever
+from infra.config import DirNames, PathManager
+from infra.index.compressed_index import CompressedVectorIndex, normalize_rows
+from infra.loader.common_loader import CommonLoader
+
+# 比較する圧縮設定（None は圧縮なし = 現在のベクトルストア相当）
+COMPRESSION_SETTINGS: list[dict | None] = [
+    None,
+    {"reduction": None, "quantization": "int8"},
+    {"reduction": "matryoshka", "dim": 512, "quantization": "int8"},
+    {"reduction": "pca", "dim": 256, "quantization": "int8"},
+    {"reduction": "pca", "dim": 128, "quantization": "int8"},
+    {"reduction": "pca", "dim": 256, "quantization": "pq", "pq_m": 32},
+    {"reduction": "pca", "dim": 256, "quantization": "pq", "pq_m": 16},
+]
+TOP_KS = [10, 50, 100]
+RESCORE_K = 100
+
+
+def load_ground_truth(csv_path: Path) -> dict[str, set[str]]:
+    """
+    query_id -> 正解のknowledge_id集合 を返す。
+    """
+    df = pd.read_csv(csv_path, dtype={"query_id": str, "knowledge_id": str})
+    df = df[df["is_correct"].astype(str).str.lower() == "true"]
+    return {query_id: set(group["knowledge_id"]) for query_id, group in df.groupby("query_id")}
+
+
+def load_all_vectors(retriever: Retriever) -> tuple[list[str], np.ndarray, dict[str, str]]:
+    """
+    Chromaから全チャンクのID・float32ベクトル・公開番号を取得する。
+    """
+    ids: list[str] = []
+    vectors: list[np.ndarray] = []
+    publication_numbers: dict[str, str] = {}
+    for batch in retriever.iter_chunks(include=["embeddings", "metadatas"]):
+        ids.extend(batch["ids"])
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            publication_numbers[chunk_id] = str((metadata or {}).get("publication_number", ""))
+    return ids, np.concatenate(vectors), publication_numbers
+
+
+def recall_at_k(ranked_chunk_ids: list[str], publication_numbers: dict[str, str], relevant: set[str], k: int) -> float:
+    """
+    上位k件のチャンクに含まれる特許（重複除去）のうち、正解特許の再現率を返す。
+    """
+    retrieved = {publication_numbers[chunk_id] for chunk_id in ranked_chunk_ids[:k]}
+    return len(retrieved & relevant) / len(relevant)
+
+
+def run_quantization_report(output_csv: Path | None = None) -> pd.DataFrame:
+    retriever = Retriever(knowledge_dir=str(PathManager.KNOWLEDGE_DIR))
+    ground_truth = load_ground_truth(PathManager.EVAL_DIR / "rag_output_with_TF.csv")
+
+    # 評価用クエリの読み込みと埋め込み（ネットワーク呼び出しは1クエリ1回のみ）
+    loader = CommonLoader()
+    query_vectors: dict[str, np.ndarray] = {}
+    for path in (PathManager.EVAL_DIR / DirNames.QUERY).rglob("text.txt"):
+        patent = loader.run(path)
+        query_id = patent.publication.doc_number
+        if query_id in ground_truth and query_id not in query_vectors:
+            query_vectors[query_id] = np.asarray(retriever.chroma.embeddings.embed_query(retriever._to_str(patent)), dtype=np.float32)
+    if not query_vectors:
+        raise ValueError("正解データに対応する評価用クエリが見つかりません。")
+
+    ids, vectors, publication_numbers = load_all_vectors(retriever)
+    full_vectors = normalize_rows(vectors)
+    positions = {chunk_id: j for j, chunk_id in enumerate(ids)}
+    max_k = max(TOP_KS)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, setting in enumerate(COMPRESSION_SETTINGS):
+            index = None if setting is None else CompressedVectorIndex.build(Path(tmp_dir) / f"index_{i}", ids, vectors, **setting)
+            for rescore in ([False] if index is None else [False, True]):
+                recalls = {k: [] for k in TOP_KS}
+                latencies = []
+                for query_id, query_vector in query_vectors.items():
+                    start = time.perf_counter()
+                    if index is None:
+                        scores = full_vectors @ normalize_rows(query_vector[None, :])[0]
+                        ranked = [ids[j] for j in np.argsort(-scores)[:max_k]]
+                    else:
+                        hits = index.search(query_vector, max(max_k, RESCORE_K))
+                        ranked = [chunk_id for chunk_id, _ in hits]
+                        if rescore:
+                            # float32ベクトルで上位候補を再スコアリング
+                            candidates = np.array([positions[chunk_id] for chunk_id in ranked[:RESCORE_K]])
+                            exact = full_vectors[candidates] @ normalize_rows(query_vector[None, :])[0]
+                            ranked = [ids[j] for j in candidates[np.argsort(-exact)]]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    for k in TOP_KS:
+                        recalls[k].append(recall_at_k(ranked, publication_numbers, ground_truth[query_id], k))
+
+                row = {
+                    "setting": "float32（現在のストア）" if setting is None else ", ".join(f"{key}={value}" for key, value in setting.items()),
+                    "rescore": rescore,
+                    "memory_mb": (full_vectors.nbytes if index is None else index.memory_bytes) / 1024**2,
+                    "latency_ms": float(np.mean(latencies)),
+                }
+                row.update({f"recall@{k}": float(np.mean(recalls[k])) for k in TOP_KS})
+                rows.append(row)
+                print(row)
+
+    report_df = pd.DataFrame(rows)
+    output_csv = output_csv or PathManager.EVAL_DIR / "quantization_report.csv"
+    report_df.to_csv(output_csv, index=False, encoding="utf-8-sig")
+    print(f"レポートを保存しました: {output_csv}")
+    return report_df
+
+
+if __name__ == "__main__":
+    run_quantization_report()
@@ -45,6 +45,9 @@ def render_common_steps():
             else:
                 query_detail.query_detail()
 
+    # 実行中の検索ジョブがあれば進捗を表示する
+    query_detail.search_job_status()
+
     # --- Step 3: AI審査 ---
     st.header("3. AI審査")
     st.write("大規模言語モデルを活用し、類似度の高い先行技術文献に基づいてAI審査を実行します。")
@@ -23,7 +23,7 @@ def reset_session_state():
     """セッションステートの初期化"""
     keys_to_reset = [
         "df_retrieved", "matched_chunk_markdowns", "reasons",
-        "query", "retrieved_docs", "search_results_df",
+        "query", "retrieved_docs", "search_results_df", "search_partial_results_df",
         "ai_judge_results", "file_content", "project_dir",
         "current_doc_number", "uploaded_dir"
     ]
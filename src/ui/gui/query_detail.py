@@ -1,9 +1,9 @@
 import streamlit as st
 from pathlib import Path
 
-from bigquery.big_query_topk import search_similar_patents
+from bigquery.big_query_topk import submit_similar_patents_search
 from ui.gui.utils import format_patent_number_for_bigquery
-from infra.config import PathManager, DirNames
+from infra.config import PathManager, DirNames, cfg
 import inspect
 import pandas as pd
     
@@ -69,29 +69,92 @@ def query_detail():
     if not search_button_pressed:
         if not output_csv_path.exists():
             return
-        search_results_df = pd.read_csv(output_csv_path)
+        job = st.session_state.get("search_job")
+        if job is not None and Path(job.output_csv) == Path(output_csv_path):
+            # 同じCSVへの検索ジョブがまだ表示されていない間は、CSVは古い結果なので表示しない
+            # （途中結果・最終結果は search_job_status() が表示する）
+            return
+        # CSVにはキャッシュとして大きいtop_kの結果が残っていることがあるため、指定件数に絞る
+        search_results_df = pd.read_csv(output_csv_path).head(top_k_count)
         show_result(search_results_df, output_csv_path)
     else:
 
         if not query_patent:
             st.error("特許番号を入力してください")
         else:
+            # 検索はバックグラウンドのジョブで実行し、スクリプトスレッドはブロックしない
+            # 進捗と途中結果は search_job_status() が表示する
+            previous_job = st.session_state.get("search_job")
+            if previous_job is not None and not previous_job.done:
+                previous_job.cancel()
+            st.session_state.search_job = submit_similar_patents_search(
+                target_patent_number=query_patent,
+                output_csv=output_csv_path,
+                top_k=top_k_count
+            )
+
+
+def search_job_status():
+    """
+    実行中の検索ジョブの進捗を表示する。
+    実行中はフラグメントとして一定間隔で再実行され、届いたページを search_partial_results_df に反映する。
+    search_results_df（確定した検索結果）はジョブが完了するまで書き換えない。
+    """
+    job = st.session_state.get("search_job")
+    if job is None:
+        return
+    if job.done:
+        _show_finished_job(job)
+    else:
+        st.fragment(_poll_search_job, run_every=cfg.search_poll_interval)()
+
 
-            try:
-                with st.spinner(f"検索中... 特許番号: {query_patent}"):
-                    # BigQueryクエリの実行
-                    search_results_df = search_similar_patents(
-                        target_patent_number=query_patent,
-                        output_csv=output_csv_path,
-                        top_k=top_k_count
-                    )
-
-                    st.success(f"検索完了！{len(search_results_df)}件の類似特許を発見しました")
-                    show_result(search_results_df, output_csv_path)
-            except Exception as e:
-                st.error(f"エラーが発生しました: {str(e)}")
-                st.exception(e)
-                raise e
+def _poll_search_job():
+    job = st.session_state.get("search_job")
+    if job is None:
+        return
+    if job.done:
+        # 完了したら画面全体を再実行し、結果の表示と他のステップの状態を更新する
+        st.rerun()
+
+    status = job.poll()
+    if status["total_rows"]:
+        st.progress(
+            min(status["fetched_rows"] / status["total_rows"], 1.0),
+            text=f"検索中... 特許番号: {job.target_patent_number}（{status['fetched_rows']:,} / {status['total_rows']:,}件）"
+        )
+    else:
+        st.info(f"⏳ 検索中... 特許番号: {job.target_patent_number}（ジョブ: {status['job_id'] or '投入中'}）")
+
+    partial_results_df = job.dataframe()
+    if not partial_results_df.empty:
+        # 届いた分から順に表示する（途中結果は確定した結果とは別のキーに置く）
+        st.session_state.search_partial_results_df = partial_results_df
+        st.dataframe(partial_results_df.head(10))
+
+    if st.button("検索を中止", key="cancel_search_job"):
+        job.cancel()
+
+
+def _show_finished_job(job):
+    # 完了したジョブの結果は1回だけ表示する（以降の再実行では取得済みの結果として扱う）
+    st.session_state.search_job = None
+    if job.state == "ERROR":
+        st.session_state.search_partial_results_df = None
+        st.error(f"エラーが発生しました: {str(job.exception)}")
+        st.exception(job.exception)
+        return
+    search_results_df = job.dataframe()
+    if job.state == "CANCELLED":
+        # 中止したジョブはCSVを書いていないため、検索結果としては公開しない（途中結果のキーにだけ残す）
+        st.session_state.search_partial_results_df = search_results_df if not search_results_df.empty else None
+        st.warning(f"検索を中止しました（取得済み: {len(search_results_df)}件。検索結果としては保存していません）")
+        if not search_results_df.empty:
+            st.dataframe(search_results_df.head(10))
+        return
+    st.session_state.search_partial_results_df = None
+    st.success(f"検索完了！{len(search_results_df)}件の類似特許を発見しました")
+    show_result(search_results_df, job.output_csv)
 
 def show_result(search_results_df, output_csv_path):
     # session_stateに検索結果を保存
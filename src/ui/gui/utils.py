@@ -8,6 +8,7 @@ from langchain_core.documents import Document
 # from app.retriever import Retriever
 from infra.loader.common_loader import CommonLoader
 from model.patent import Patent
+from model.patent_number import PublicationNumber, kind_code_from_label, parse_publication_number, split_number
 
 
 # TODO: 検索実行はGUIではなくRetrieverやRAG側で制御すべきか考える。
@@ -75,9 +76,10 @@ def create_matched_md(index: int, xml_loader: CommonLoader, MAX_CHAR: int) -> st
         """
     return markdown_text
 
-from google.cloud import bigquery
 from dotenv import load_dotenv
 import os
+
+from bigquery.publication_number_map import resolve_publication_number
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
@@ -99,31 +101,14 @@ def format_patent_number_for_bigquery(patent: Patent) -> str:
         BigQuery用にフォーマットされた特許番号（例: JP-2012173419-A, JP-7550342-B2）
     """
     doc_number = patent.publication.doc_number
-    country = patent.publication.country or "JP"
     kind = patent.publication.kind
 
+    # kind（例: "公開特許公報(A)"）から種別コードを取り出し、候補の優先順位に使う
+    kind_code = kind_code_from_label(kind)
 
-    # BigQueryクライアントの初期化
-    client = bigquery.Client(project=PROJECT_ID)
-
-
-    # SQLクエリ(LIKE演算子で部分一致)
-    query = f"""
-    SELECT publication_number
-    FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
-    WHERE publication_number LIKE '%{doc_number}%'
-    """
-
-    # クエリの実行
-    query_job = client.query(query)
-
-    # 結果の取得
-    results = query_job.result()
-
-    # 結果の表示
-    for row in results:
-        formatted_number =  str(row.publication_number)
-        
+    # LIKE '%…%' の部分一致ではなく、ローカルの対応表またはBigQueryの完全一致照合で求める
+    formatted_number = resolve_publication_number(doc_number, kind_code)
+    if formatted_number:
         return formatted_number
     print("該当する特許番号が見つかりませんでした。")
     return ""
@@ -132,67 +117,35 @@ def format_patent_number_for_bigquery(patent: Patent) -> str:
 def normalize_patent_id(patent_id):
     """
     特許IDを解析し、DB検索用の固定長フォーマット（西暦4桁 + 0埋め6桁）に変換する。
+    番号の解析は model/patent_number.py の split_number で行う。
     
     戻り値:
-        変換成功時 -> "2010058462" のような文字列
-        対象外/不可 -> None
+        変換成功時 -> (年, 0埋め6桁の番号) のタプル（例: ("2010", "058462")、和暦は ("H07", "000006")）
+        登録番号 -> (None, 番号)
+        対象外/不可 -> (None, None)
     """
-    parts = patent_id.split('-')
-    
-    # フォーマットチェック
-    if len(parts) < 3:
-        return (None, None)
-
-    raw_number = parts[1]  # 真ん中 (例: H076, 2011005843)
-    kind_code = parts[2]   # 末尾 (例: A, B2)
+    parsed = parse_publication_number(patent_id)
 
     # 1. まず種別コードでフィルタリング（特許A, Bのみ対象）
-    if not re.match(r'^[AB]', kind_code):
+    if parsed is None or parsed.kind_type not in ("A", "B"):
         return (None, None)
 
-    # 変換結果を格納する変数
-    year_part = None   # 西暦4桁 (int)
-    number_part = None # 番号部分 (str)
-
-    # --- パターン解析 ---
+    parts = split_number(parsed.number)
+    if parts is None:
+        return (None, None)
 
     # パターンA: WO (国際公開再公表) -> WO2014030240
-    match_wo = re.match(r'^WO(\d{4})(\d+)$', raw_number)
-    if match_wo:
-        year_part = int(match_wo.group(1))
-        number_part = match_wo.group(2)
-
+    if parts.style == "wo":
+        return (int(parts.year), parts.serial.zfill(6))
     # パターンB: 和暦 (H076, S606174)
-    elif re.match(r'^([HSMTR])(\d{2})(\d+)$', raw_number):
-        match_imp = re.match(r'^([HSMTR])(\d{2})(\d+)$', raw_number)
-        era = match_imp.group(1)
-        year_part = era + match_imp.group(2)
-        number_part = match_imp.group(3)
-        
-        # 西暦変換
-        # if era == 'S': year_part = 1925 + year_num
-        # elif era == 'H': year_part = 1988 + year_num
-        # elif era == 'R': year_part = 2018 + year_num
-
+    if parts.style == "era":
+        return (parts.era + parts.year, parts.serial.zfill(6))
     # パターンC: 西暦4桁付き (2011005843)
-    elif re.match(r'^(19|20)\d{2}(\d+)$', raw_number) and len(raw_number) >= 10:
-        year_part = raw_number[:4]
-        number_part = raw_number[4:]
-
+    if parts.style == "western":
+        return (parts.year, parts.serial.zfill(6))
     # パターンD: 年号なし登録番号 (5021568)
     # これは「年号4桁+6桁」のルールには当てはまらないため、そのままの番号を使う
-    elif re.match(r'^\d+$', raw_number):
-        return_number = raw_number.zfill(6)
-        return (year_part, return_number)
-
-    # --- 整形処理 (年号がある場合) ---
-    if year_part is not None and number_part is not None:
-        # 番号部分を6桁にゼロ埋めする (例: "6" -> "000006")
-        padded_number = number_part.zfill(6)
-        # 結合して返す
-        return (year_part, padded_number)
-    
-    return (None, None)
+    return (None, parts.serial.zfill(6))
 
 # # --- テスト実行 ---
 # ids = [
@@ -220,12 +173,12 @@ def normalize_patent_id(patent_id):
 def parse_patent_info(patent_id):
     """
     特許IDを解析し、コア番号の抽出と、特許(A/B)かどうかの判定を行う
+    番号の解析は model/patent_number.py の parse_publication_number / split_number で行う。
     """
-    # 1. ハイフンで分割
-    parts = patent_id.split('-')
-    
+    parsed = parse_publication_number(patent_id)
+
     # 想定外のフォーマット（JP-xxxx-xx の形式でない場合）
-    if len(parts) < 3:
+    if parsed is None:
         return {
             "original": patent_id,
             "core_number": None,
@@ -233,35 +186,17 @@ def parse_patent_info(patent_id):
             "is_target_patent": False,
             "note": "Format Error"
         }
-    
-    raw_number = parts[1]  # 真ん中 (例: H084831)
-    kind_code = parts[2]   # 末尾 (例: Y2)
-    
-    # 2. コア番号の抽出（ご提示のロジックを活用）
-    core_number = raw_number
-    
-    # パターンA: 和暦付き (例: H084831, S606174) -> 年号除去
-    match_imperial = re.match(r'^([HSMTR]\d{2})(\d+)$', raw_number)
-    if match_imperial:
-        core_number = match_imperial.group(2)
-        
-    # パターンB: 西暦4桁付き (例: 2011005843) -> 年号除去
-    # 条件: 19xx or 20xx で始まり、かつ全体が10桁以上
-    elif re.match(r'^(19|20)\d{2}(\d+)$', raw_number) and len(raw_number) >= 10:
-        core_number = raw_number[4:]
-
-    # 3. 種別コードによるフィルタリング（ここを追加）
-    # 今回の要件: 特許(A, B系)のみ対象。実用新案(Y, U)などは除外。
-    # Kind Codeが "A" または "B" で始まるものをTrueとする
-    is_target = False
-    if re.match(r'^[AB]', kind_code):
-        is_target = True
 
+    # コア番号: 和暦付き (例: H084831)・西暦4桁付き (例: 2011005843) は年号を除いた連番、それ以外は番号そのまま
+    parts = split_number(parsed.number)
+    core_number = parts.serial if parts is not None and parts.style in ("era", "western") else parsed.number
+
+    # 今回の要件: 特許(A, B系)のみ対象。実用新案(Y, U)などは除外。
     return {
         "original": patent_id,
         "core_number": core_number,
-        "kind_code": kind_code,
-        "is_target_patent": is_target
+        "kind_code": parsed.kind,
+        "is_target_patent": parsed.kind_type in ("A", "B")
     }
 
 # # --- テスト実行 ---
@@ -311,20 +246,12 @@ def format_patent_number_for_bigquery_compose_id(patent: Patent) -> str:
     country = patent.publication.country or "JP"
     kind = patent.publication.kind
 
-    # kindから種別コード（A, B, B2など）を抽出
-    kind_code = ""
-    if kind:
-        # 日本語のkind（例: "公開特許公報(A)", "特許公報(B2)"）からコードを抽出
-        import re
-        match = re.search(r'\(([AB]\d?)\)', kind)
-        if match:
-            kind_code = match.group(1)
-
-    # kindが取得できない場合は、デフォルトでAを使用
-    if not kind_code:
+    # 日本語のkind（例: "公開特許公報(A)", "特許公報(B2)"）から種別コード（A, B, B2など）を抽出
+    kind_code = kind_code_from_label(kind)
+
+    # kindが取得できない（特許A, B以外の）場合は、デフォルトでAを使用
+    if not kind_code or kind_code[0] not in ("A", "B"):
         kind_code = "A"
 
     # フォーマット: JP-{doc_number}-{kind_code}
-    formatted_number = f"{country}-{doc_number}-{kind_code}"
-
-    return formatted_number
+    return PublicationNumber(country, doc_number, kind_code).canonical